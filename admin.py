@@ -0,0 +1,161 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import csv
+import hmac
+import io
+import json
+import logging
+import math
+from datetime import datetime
+from functools import wraps
+from config import ADMIN_TOKEN
+from database import EXPORTACOES, iter_history
+from services.timeutil import day_bounds, format_epoch
+from services.profiling import start_session, stop_session, session_status
+from services.redis_memory import memory_report
+from services.state_backend import uses_redis
+
+logger = logging.getLogger(__name__)
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+# Duração máxima de uma sessão de profiling (segundos)
+MAX_PROFILE_SECONDS = 300
+
+# Chaves medidas com MEMORY USAGE por família no relatório de memória
+MAX_MEMORY_SAMPLE = 1000
+
+# Exportação: linhas por consulta ao banco (e por bloco enviado)
+EXPORT_PAGE_SIZE = 1000
+FORMATOS_EXPORTACAO = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def is_admin_request():
+    """Verifica o token de administrador enviado no header X-Admin-Token"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def require_admin(view):
+    """Restringe a rota a quem enviar o ADMIN_TOKEN"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({"status": False, "error": "não autorizado"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# Sessões de profiling (valem para o processo que atender a requisição)
+@admin_bp.route('/profile/start', methods=['POST'])
+@require_admin
+def profile_start():
+    try:
+        segundos = float(request.args.get('segundos', 30))
+        intervalo = float(request.args.get('intervalo', 0.005))
+    except ValueError:
+        return jsonify({"status": False, "error": "segundos e intervalo devem ser números"}), 400
+    if not (0 < segundos < math.inf and 0 < intervalo < math.inf):
+        return jsonify({"status": False, "error": "segundos e intervalo devem ser maiores que zero"}), 400
+    segundos = min(segundos, MAX_PROFILE_SECONDS)
+    intervalo = max(intervalo, 0.001)
+    sessao = start_session(segundos, intervalo)
+    if not sessao:
+        return jsonify({"status": False, "error": "já existe uma sessão ativa", "sessao": session_status()}), 409
+    logger.info(f"Sessão de profiling iniciada por {segundos}s")
+    return jsonify({"status": True, "sessao": sessao})
+
+@admin_bp.route('/profile/stop', methods=['POST'])
+@require_admin
+def profile_stop():
+    sessao = stop_session()
+    if not sessao:
+        return jsonify({"status": False, "error": "nenhuma sessão iniciada"}), 404
+    return jsonify({"status": True, "sessao": sessao})
+
+@admin_bp.route('/profile', methods=['GET'])
+@require_admin
+def profile_status():
+    return jsonify({"status": True, "sessao": session_status()})
+
+# Memória do Redis por família de chaves
+@admin_bp.route('/redis/memoria', methods=['GET'])
+@require_admin
+def redis_memory():
+    try:
+        amostra = int(request.args.get('amostra', 200))
+    except ValueError:
+        return jsonify({"status": False, "error": "amostra deve ser um número inteiro"}), 400
+    amostra = min(max(amostra, 1), MAX_MEMORY_SAMPLE)
+    if not uses_redis():
+        return jsonify({"status": False, "error": "Estado em memória (STATE_BACKEND=memoria), sem Redis"}), 409
+    try:
+        return jsonify({"status": True, "memoria": memory_report(amostra)})
+    except Exception as e:
+        logger.error(f"Erro ao gerar relatório de memória do Redis: {e}")
+        return jsonify({"status": False, "error": str(e)}), 500
+
+def _parse_instante(valor, fim=False):
+    """
+    Converte um parâmetro de período: segundos desde a época ou uma data
+    'YYYY-MM-DD' (início do dia; com fim=True, o início do dia seguinte)
+    """
+    if valor is None or valor == '':
+        return None
+    if valor.isdigit():
+        return int(valor)
+    dia = datetime.strptime(valor, '%Y-%m-%d').date()
+    return day_bounds(dia)[1 if fim else 0]
+
+def _export_rows(tabela, formato, linhas):
+    """Serializa as linhas em blocos de EXPORT_PAGE_SIZE (memória constante)"""
+    colunas = EXPORTACOES[tabela][0]
+    # Instantes seguem em segundos desde a época e também formatados
+    tempos = [i for i, coluna in enumerate(colunas) if coluna in ('timestamp', 'ultima_atualizacao', 'ultima_leitura')]
+    cabecalho = list(colunas) + [f"{colunas[i]}_local" for i in tempos]
+
+    bloco = io.StringIO()
+    escritor = csv.writer(bloco) if formato == 'csv' else None
+    if escritor:
+        escritor.writerow(cabecalho)
+
+    quantidade = 0
+    for linha in linhas:
+        valores = list(linha) + [
+            format_epoch(linha[i], '%Y-%m-%d %H:%M:%S') if linha[i] is not None else None
+            for i in tempos
+        ]
+        if escritor:
+            escritor.writerow(valores)
+        else:
+            bloco.write(json.dumps(dict(zip(cabecalho, valores)), ensure_ascii=False) + '\n')
+        quantidade += 1
+        if quantidade % EXPORT_PAGE_SIZE == 0:
+            yield bloco.getvalue()
+            bloco.seek(0)
+            bloco.truncate()
+    if bloco.tell():
+        yield bloco.getvalue()
+
+# Exportação do histórico (fechamentos, clima) em NDJSON ou CSV
+@admin_bp.route('/export/<tabela>', methods=['GET'])
+@require_admin
+def export_history(tabela):
+    if tabela not in EXPORTACOES:
+        return jsonify({"status": False, "error": f"tabela desconhecida (use {', '.join(EXPORTACOES)})"}), 404
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in FORMATOS_EXPORTACAO:
+        return jsonify({"status": False, "error": "formato deve ser ndjson ou csv"}), 400
+    try:
+        inicio = _parse_instante(request.args.get('inicio'))
+        fim = _parse_instante(request.args.get('fim'), fim=True)
+    except ValueError:
+        return jsonify({"status": False, "error": "inicio/fim devem ser YYYY-MM-DD ou segundos desde a época"}), 400
+    lado = request.args.get('lado')
+
+    logger.info(f"Exportando {tabela} ({formato}) de {inicio} a {fim}, lado {lado or 'todos'}")
+    linhas = iter_history(tabela, inicio=inicio, fim=fim, lado=lado, lote=EXPORT_PAGE_SIZE)
+    return Response(
+        stream_with_context(_export_rows(tabela, formato, linhas)),
+        mimetype=FORMATOS_EXPORTACAO[formato],
+        headers={"Content-Disposition": f"attachment; filename={tabela}.{formato}"}
+    )
@@ -1,9 +1,24 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, request, jsonify
 import os
 import logging
-from services.evolution_service import process_message, get_mensagem_ajuda
-import requests
-from waitress import serve
+import threading
+import time
+from services.evolution_service import process_message, get_mensagem_ajuda, notify_group, check_closure_alert
+from services.rollup_service import start_compactor
+from services.clients import get_http_session, warm_up
+from services.cache import get_cache_stats, start_invalidation_listener
+from services.state_repository import warm_load, start_flusher
+from services.event_bus import start_event_consumer, start_notifier
+from services.circuit_breaker import get_breaker, get_breaker_stats
+from services.profiling import should_profile, profile_request
+from services.admission import admission, classify, PRIORIDADE_BAIXA
+from services.faq import build_index, stats as faq_stats
+from services.catchup import claim_message, start_catchup
+from services.closure_stats import get_closure_stats, start_monitor
+from admin import admin_bp, is_admin_request
+from create_db import create_database
+from database import write_queue, warm_closure_stats
+from config import validate_config, WORKERS, THREADS
 from dotenv import load_dotenv
 
 # Carrega as variáveis de ambiente
@@ -16,19 +31,63 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+bp = Blueprint('bot', __name__)
 
 # Rota raiz para verificar se o servidor está online
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def home():
     return jsonify({
         "status": "online",
         "message": "Bot está funcionando!"
     })
 
+# Métricas internas (caches, circuit breakers, fila de escrita, admissão e fechamentos)
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        "cache": get_cache_stats(),
+        "circuit_breakers": get_breaker_stats(),
+        "fila_escrita": write_queue.stats(),
+        "admissao": admission.stats(),
+        "faq": faq_stats(),
+        "fechamentos": {lado: get_closure_stats(lado) for lado in ('CENTER', 'GOIO')}
+    })
+
+def extract_text(data):
+    """Retorna o texto de um evento messages.upsert (mensagem normal ou resposta)"""
+    if not data or data.get('event') != 'messages.upsert':
+        return None
+    message_data = data.get('data', {})
+    if message_data.get('messageType') not in ['conversation', 'extendedTextMessage']:
+        return None
+    return (message_data.get('message', {}).get('conversation') or
+            message_data.get('message', {}).get('extendedTextMessage', {}).get('text'))
+
 # Rota webhook
-@app.route('/webhook', methods=['POST'])
+@bp.route('/webhook', methods=['POST'])
 def webhook():
+    # Controle de admissão: sob carga, a conversa livre é descartada antes
+    # das consultas, e as consultas antes dos comandos que mudam o estado
+    prioridade = classify(extract_text(request.get_json(silent=True)))
+    if not admission.try_acquire(prioridade):
+        if prioridade == PRIORIDADE_BAIXA:
+            # 200 para a Evolution API não reenviar uma mensagem que seria ignorada
+            return jsonify({"status": True, "descartada": True}), 200
+        return jsonify({"status": False, "error": "Servidor sobrecarregado"}), 429, {"Retry-After": "1"}
+
+    inicio = time.perf_counter()
+    try:
+        # Profiling por amostragem (PROFILE_SAMPLE_RATE) ou pedido pelo admin (X-Profile: 1)
+        forcar = request.headers.get('X-Profile') == '1' and is_admin_request()
+        if should_profile(forcar):
+            with profile_request('webhook'):
+                return handle_webhook()
+        return handle_webhook()
+    finally:
+        admission.release(time.perf_counter() - inicio)
+
+def handle_webhook():
+    """Processa uma mensagem recebida da Evolution API"""
     try:
         data = request.json
         logger.info("=== NOVA REQUISIÇÃO RECEBIDA ===")
@@ -49,13 +108,21 @@ def webhook():
             
             if message_data.get('messageType') in ['conversation', 'extendedTextMessage']:
                 # Pega o texto da mensagem (suporta mensagens normais e respostas)
-                text = (message_data.get('message', {}).get('conversation') or 
-                       message_data.get('message', {}).get('extendedTextMessage', {}).get('text'))
+                text = extract_text(data)
                 
-                sender = message_data.get('pushName')
+                # Sem pushName, o JID de quem enviou identifica o remetente
+                sender = message_data.get('pushName') or message_data.get('key', {}).get('participant') or 'Usuário'
                 group_id = message_data.get('key', {}).get('remoteJid')
                 
                 if text and group_id == os.getenv('GROUP_ID'):
+                    # Comando ou relato já aplicado pela recuperação (ou reenviado)
+                    if not claim_message(
+                        message_data.get('key', {}).get('id'),
+                        message_data.get('messageTimestamp'),
+                        text.strip().lower()
+                    ):
+                        return jsonify({"status": True, "duplicada": True}), 200
+                        
                     response = process_message({
                         'text': text,
                         'sender': {
@@ -84,7 +151,20 @@ def webhook():
                         logger.info(f"Headers: {headers}")
                         logger.info(f"Payload: {payload}")
                         
-                        response = requests.post(url, json=payload, headers=headers)
+                        evolution_breaker = get_breaker('evolution')
+                        if not evolution_breaker.allow():
+                            logger.warning("Circuito da Evolution API aberto, resposta não enviada")
+                            return jsonify({"status": True}), 200
+                            
+                        try:
+                            response = get_http_session().post(url, json=payload, headers=headers, timeout=10)
+                        except Exception:
+                            evolution_breaker.record_failure()
+                            raise
+                        if response.status_code >= 500:
+                            evolution_breaker.record_failure()
+                        else:
+                            evolution_breaker.record_success()
                         logger.info(f"Resposta da API: {response.text}")
                         
                         return jsonify({"status": True}), 200
@@ -99,12 +179,65 @@ def webhook():
             "error": str(e)
         }), 500
 
+def start_background_services():
+    """Prepara o banco, aquece as conexões e inicia as tarefas periódicas"""
+    try:
+        create_database()
+    except Exception as e:
+        logger.error(f"Erro ao preparar o banco de dados: {e}")
+    warm_up()
+    try:
+        warm_load()
+    except Exception as e:
+        logger.error(f"Erro ao restaurar o status no Redis: {e}")
+    try:
+        warm_closure_stats()
+    except Exception as e:
+        logger.error(f"Erro ao montar a estatística de fechamentos: {e}")
+    start_flusher()
+    start_invalidation_listener()
+    start_event_consumer()
+    start_notifier(notify_group)
+    start_compactor()
+    build_index()
+    start_catchup(notify_group)
+    start_monitor(check_closure_alert)
+
+def create_app(validate=True, start_background=True):
+    """
+    Cria a aplicação Flask. A validação do ambiente e as conexões
+    acontecem aqui, e não na importação dos módulos.
+    """
+    if validate:
+        validate_config()
+        
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    app.register_blueprint(admin_bp)
+    
+    if start_background:
+        threading.Thread(target=start_background_services, name='startup', daemon=True).start()
+        
+    return app
+
+def start_multiprocess_server():
+    """Substitui o processo pelo gunicorn com WORKERS processos (prefork)"""
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    logger.info(f"Iniciando gunicorn com {WORKERS} workers")
+    os.execvp('gunicorn', ['gunicorn', '-c', config_path, 'app:create_app()'])
+
 def start_server():
-    """Inicia o servidor com Waitress"""
+    """Inicia o servidor com Waitress (ou gunicorn se WORKERS > 1)"""
+    if WORKERS > 1:
+        validate_config()
+        start_multiprocess_server()
+        
     try:
+        from waitress import serve
         port = int(os.getenv('PORT', 80))
+        app = create_app()
         logger.info(f"Iniciando servidor na porta {port}")
-        serve(app, host='0.0.0.0', port=port)
+        serve(app, host='0.0.0.0', port=port, threads=THREADS)
     except Exception as e:
         logger.error(f"Erro ao iniciar servidor: {e}")
         raise
@@ -0,0 +1,62 @@
+"""
+Mede a busca no índice de perguntas frequentes (services.faq): tempo de
+montagem do índice, latência por pergunta e qual entrada cada pergunta de
+exemplo encontra (abaixo de FAQ_LIMIAR a pergunta iria para o modelo remoto e
+abaixo de FAQ_LIMIAR_MODELO seria ignorada).
+
+Uso:
+    python benchmarks/bench_faq.py [repeticoes]
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Perguntas como aparecem no grupo (nenhuma é igual aos exemplos do índice)
+PERGUNTAS = [
+    "quanto tempo demora?",
+    "demora muito ainda?",
+    "falta quanto pra liberar?",
+    "que horas abre?",
+    "tá chovendo aí?",
+    "alguém sabe se tá liberado pra goioerê?",
+    "qual o melhor horário pra passar?",
+    "por que tá fechado?",
+    "como uso o bot?",
+    "quanto custa o café?",
+    "quem ganhou o jogo ontem?",
+]
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    from config import FAQ_LIMIAR, FAQ_LIMIAR_MODELO
+    from services.faq import build_index
+
+    inicio = time.perf_counter()
+    indice = build_index()
+    montagem = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for pergunta in PERGUNTAS:
+            indice.search(pergunta)
+    por_busca = (time.perf_counter() - inicio) / (repeticoes * len(PERGUNTAS))
+
+    print(f"Índice: {len(indice.documentos)} exemplos, {len(indice.idf)} termos, montado em {montagem * 1000:.2f} ms")
+    print(f"Busca: {por_busca * 1_000_000:.1f} µs por pergunta ({repeticoes * len(PERGUNTAS)} buscas)")
+    print(f"\nLimiar: {FAQ_LIMIAR} (modelo a partir de {FAQ_LIMIAR_MODELO})")
+    for pergunta in PERGUNTAS:
+        entrada, similaridade = indice.search(pergunta)
+        if entrada and similaridade >= FAQ_LIMIAR:
+            destino = entrada['id']
+        elif similaridade >= FAQ_LIMIAR_MODELO:
+            destino = 'modelo remoto'
+        else:
+            destino = 'ignorada'
+        print(f"  {pergunta:42s} {similaridade:.2f}  {destino}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compara inserções de fechamentos: commit por linha (caminho antigo) contra
+a fila de escrita em lote (services.batch_writer, usada por database.write_queue).
+
+Uso:
+    python benchmarks/bench_inserts.py [quantidade]
+
+Roda em um diretório temporário, sem tocar no traffic.db real.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def per_row_commit(quantidade):
+    """Uma conexão, um INSERT e um commit por fechamento (como era antes)"""
+    for i in range(quantidade):
+        conn = sqlite3.connect('traffic.db')
+        conn.execute(
+            "INSERT INTO fechamentos (lado, tempo_fechamento, timestamp) VALUES (?, ?, ?)",
+            ('CENTER', 600 + i % 300, 1704121200)
+        )
+        conn.commit()
+        conn.close()
+
+def batched(quantidade):
+    """Enfileira em um BatchWriter igual ao write_queue e espera o flush"""
+    from database import connect_db, write_closures
+    from services.batch_writer import BatchWriter
+    from config import ESCRITA_LOTE_MAX, ESCRITA_INTERVALO_MS
+
+    # Sem o after_commit do write_queue (invalidação de cache no Redis):
+    # mede apenas o caminho de gravação no SQLite
+    writer = BatchWriter('bench', connect_db, lote=ESCRITA_LOTE_MAX, intervalo_ms=ESCRITA_INTERVALO_MS,
+                         max_fila=quantidade)
+    writer.register('fechamento', write_closures)
+    for i in range(quantidade):
+        writer.submit('fechamento', ('CENTER', 600 + i % 300, 1704121200))
+    writer.flush()
+
+def medir(funcao, quantidade):
+    inicio = time.perf_counter()
+    funcao(quantidade)
+    return quantidade / (time.perf_counter() - inicio)
+
+def main():
+    quantidade = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    os.chdir(tempfile.mkdtemp(prefix='bench_inserts_'))
+
+    from create_db import create_database
+    create_database()
+
+    por_linha = medir(per_row_commit, quantidade)
+    em_lote = medir(batched, quantidade)
+
+    total = sqlite3.connect('traffic.db').execute("SELECT COUNT(*) FROM fechamentos").fetchone()[0]
+    print(f"Commit por linha: {por_linha:10.0f} inserções/s")
+    print(f"Fila em lote:     {em_lote:10.0f} inserções/s ({em_lote / por_linha:.1f}x)")
+    print(f"Linhas gravadas:  {total} (esperado {quantidade * 2})")
+
+if __name__ == '__main__':
+    main()
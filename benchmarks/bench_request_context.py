@@ -0,0 +1,139 @@
+"""
+Compara as leituras de uma resposta de status: o caminho item a item
+(get_status dos dois lados, get_weather_status e get_daily_stats) contra o
+RequestContext (services.request_context), contando idas ao Redis e
+conexões ao SQLite em três situações:
+
+- frio: nada em cache (L1 e L2 vazios)
+- L2: o L1 deste processo expirou, mas o Redis tem os valores
+- quente: tudo no L1
+
+O tempo estimado soma --rtt-ms por ida ao Redis (latência de rede simulada).
+
+Uso:
+    python benchmarks/bench_request_context.py [--rtt-ms 0.5] [--repeticoes 200]
+
+Usa o fakeredis (pip install fakeredis lupa) em um diretório temporário,
+sem tocar no traffic.db real.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+class Contador:
+    """Conta idas ao Redis (comandos e pipelines) e conexões ao SQLite"""
+
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.redis = 0
+        self.sqlite = 0
+
+    def reset(self):
+        self.redis = 0
+        self.sqlite = 0
+
+    def ida_redis(self):
+        self.redis += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+def instrumentar(contador):
+    import redis.client
+    import database
+
+    executar = redis.client.Redis.execute_command
+    def execute_command(self, *args, **kwargs):
+        contador.ida_redis()
+        return executar(self, *args, **kwargs)
+    redis.client.Redis.execute_command = execute_command
+
+    executar_pipeline = redis.client.Pipeline.execute
+    def execute(self, *args, **kwargs):
+        contador.ida_redis()
+        return executar_pipeline(self, *args, **kwargs)
+    redis.client.Pipeline.execute = execute
+
+    conectar = database.connect_db
+    def connect_db():
+        contador.sqlite += 1
+        return conectar()
+    database.connect_db = connect_db
+
+def item_a_item():
+    from database import get_daily_stats, get_weather_status
+    from services.state_repository import get_status
+    return get_status('CENTER'), get_status('GOIO'), get_weather_status(), get_daily_stats()
+
+def com_contexto():
+    from services.request_context import load_context, STATUS, CLIMA, ESTATISTICAS
+    contexto = load_context(STATUS, CLIMA, ESTATISTICAS)
+    return contexto.status['CENTER'], contexto.status['GOIO'], contexto.clima, contexto.estatisticas
+
+def preparar_cache(situacao):
+    import services.clients as clients
+    from services.cache import status_cache, weather_cache, stats_cache
+    for cache in (status_cache, weather_cache, stats_cache):
+        cache.drop_local()
+    if situacao == 'frio':
+        for chave in clients.get_redis().keys('cache:*'):
+            clients.get_redis().delete(chave)
+    elif situacao == 'quente':
+        com_contexto()
+
+def medir(funcao, situacao, contador, repeticoes):
+    idas_redis = idas_sqlite = 0
+    tempo = 0.0
+    for _ in range(repeticoes):
+        preparar_cache(situacao)
+        contador.reset()
+        inicio = time.perf_counter()
+        funcao()
+        tempo += time.perf_counter() - inicio
+        idas_redis += contador.redis
+        idas_sqlite += contador.sqlite
+    return idas_redis / repeticoes, idas_sqlite / repeticoes, tempo / repeticoes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help='latência simulada por ida ao Redis')
+    parser.add_argument('--repeticoes', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ['STATE_BACKEND'] = 'redis'
+    os.chdir(tempfile.mkdtemp(prefix='bench_request_context_'))
+    logging.basicConfig(level=logging.CRITICAL)
+
+    import fakeredis
+    import services.clients as clients
+    clients._redis_client = fakeredis.FakeRedis(decode_responses=True)
+
+    from create_db import create_database
+    from database import update_weather, record_closure_time, write_queue
+    from services.state_repository import warm_load
+    create_database()
+    warm_load()
+    update_weather('céu limpo')
+    for tempo in (600, 900, 1200):
+        record_closure_time('CENTER', tempo)
+    write_queue.flush()
+
+    assert item_a_item() == com_contexto(), "os dois caminhos devem devolver os mesmos dados"
+
+    contador = Contador(args.rtt_ms / 1000)
+    instrumentar(contador)
+
+    print(f"Latência simulada do Redis: {args.rtt_ms} ms por ida  ({args.repeticoes} repetições)\n")
+    print(f"{'situação':10s} {'caminho':12s} {'idas Redis':>11s} {'conexões SQLite':>16s} {'tempo (ms)':>11s}")
+    for situacao in ('frio', 'L2', 'quente'):
+        for nome, funcao in (('item a item', item_a_item), ('contexto', com_contexto)):
+            redis, sqlite, tempo = medir(funcao, situacao, contador, args.repeticoes)
+            print(f"{situacao:10s} {nome:12s} {redis:11.1f} {sqlite:16.1f} {tempo * 1000:11.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Mede o tempo de importação e de boot da aplicação.
+
+Uso:
+    python benchmarks/bench_startup.py
+
+Roda `python -X importtime -c "import app"` em um processo limpo, mostra os
+módulos mais caros e compara com o orçamento. Retorna código 1 se algum
+orçamento for ultrapassado.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Orçamentos (em milissegundos)
+IMPORT_BUDGET_MS = int(os.getenv('IMPORT_BUDGET_MS', '300'))
+BOOT_BUDGET_MS = int(os.getenv('BOOT_BUDGET_MS', '50'))
+
+# Módulos que não podem ser carregados na importação do app
+LAZY_MODULES = ['redis', 'requests', 'openai', 'waitress', 'pytz']
+
+BOOT_SCRIPT = """
+import time
+from app import create_app
+inicio = time.perf_counter()
+create_app(validate=False, start_background=False)
+print((time.perf_counter() - inicio) * 1000)
+"""
+
+def run_importtime():
+    """Executa a importação com -X importtime e retorna [(cumulativo_us, modulo)]"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    modulos = []
+    for linha in result.stderr.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        _, cumulativo, nome = linha[len('import time:'):].split('|')
+        modulos.append((int(cumulativo), nome.rstrip()))
+    return modulos
+
+def run_boot():
+    """Mede o tempo de create_app() sem validação nem serviços de fundo"""
+    result = subprocess.run(
+        [sys.executable, '-c', BOOT_SCRIPT],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main():
+    modulos = run_importtime()
+    total_ms = next(c for c, nome in modulos if nome.strip() == 'app') / 1000
+
+    print("Módulos mais caros (cumulativo):")
+    for cumulativo, nome in sorted(modulos, reverse=True)[:15]:
+        print(f"  {cumulativo / 1000:8.1f} ms  {nome}")
+
+    carregados = {nome.strip() for _, nome in modulos}
+    indevidos = [m for m in LAZY_MODULES if m in carregados]
+
+    boot_ms = run_boot()
+
+    print()
+    print(f"Importação do app: {total_ms:.1f} ms (orçamento {IMPORT_BUDGET_MS} ms)")
+    print(f"Boot (create_app): {boot_ms:.1f} ms (orçamento {BOOT_BUDGET_MS} ms)")
+    if indevidos:
+        print(f"Módulos carregados na importação: {', '.join(indevidos)}")
+
+    if total_ms > IMPORT_BUDGET_MS or boot_ms > BOOT_BUDGET_MS or indevidos:
+        print("FALHOU")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Teste de estresse da máquina de estados de transição: centenas de usuários
+simulados enviando !alterna, !sim, !passou e !cancelar ao mesmo tempo, com um
+relógio controlável (cada ação avança o relógio em alguns segundos).
+
+Verifica as invariantes:
+- no máximo uma transição ativa a qualquer momento
+- nenhuma alternância perdida ou duplicada (iniciadas = concluídas +
+  canceladas + ativas; o status final bate com o número de conclusões)
+- o lock de status sempre liberado (e nunca liberado por quem não é o dono)
+- um único remetente, mesmo com o peso máximo, nunca atinge o quórum de relatos
+
+e mostra a vazão e os números de contenção.
+
+Uso:
+    python benchmarks/stress_transitions.py [--usuarios 200] [--acoes 20] [--threads 32] [--fake | --memoria]
+
+Sem --fake usa o Redis de REDIS_HOST/REDIS_PORT no banco REDIS_DB (padrão 15),
+que é APAGADO no início. Com --fake usa o fakeredis (pip install fakeredis lupa)
+e com --memoria o backend de estado em memória (STATE_BACKEND=memoria).
+Roda em um diretório temporário, sem tocar no traffic.db real.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Proporção de cada comando enviado pelos usuários
+COMANDOS = [('!alterna', 35), ('!passou', 35), ('!cancelar', 5), ('!sim', 25)]
+
+# Classificação das respostas (trecho da mensagem -> resultado)
+RESULTADOS = [
+    ('Outra pessoa está alterando', 'lock_ocupado'),
+    ('Já há uma transição', 'transicao_em_andamento'),
+    ('*Aguarde*', 'aguarde'),
+    ('Confirmação Necessária', 'confirmacao_pedida'),
+    ('Status já alterado', 'confirmacao_obsoleta'),
+    ('Transição Concluída', 'concluida'),
+    ('Tempo muito curto', 'cedo_demais'),
+    ('Transição Cancelada', 'cancelada'),
+    ('já foi concluída ou cancelada', 'transicao_encerrada'),
+    ('Não há transição', 'sem_transicao'),
+    ('Não há confirmação', 'sem_confirmacao'),
+    ('Confirmação expirada', 'confirmacao_expirada'),
+    ('Erro', 'erro'),
+]
+
+class FakeClock:
+    """Relógio controlável: começa na hora real e só anda quando avançado"""
+
+    def __init__(self):
+        self._agora = time.time()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            return self._agora
+
+    def advance(self, segundos):
+        with self._lock:
+            self._agora += segundos
+
+def classificar(resposta):
+    if resposta is None:
+        return 'sem_resposta'
+    for trecho, resultado in RESULTADOS:
+        if trecho in resposta:
+            return resultado
+    return 'outro'
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+def preparar(fake, memoria, redis_db):
+    """Isola o estado e o SQLite e devolve o backend de estado"""
+    os.environ.setdefault('REDIS_HOST', 'localhost')
+    os.environ['REDIS_DB'] = str(redis_db)
+    os.environ['STATE_BACKEND'] = 'memoria' if memoria else 'redis'
+    os.chdir(tempfile.mkdtemp(prefix='stress_transitions_'))
+    logging.basicConfig(level=logging.CRITICAL)
+
+    import services.clients as clients
+    from services.state_backend import get_backend
+    if not memoria:
+        if fake:
+            import fakeredis
+            clients._redis_client = fakeredis.FakeRedis(decode_responses=True)
+        clients.get_redis().flushdb()
+
+    from create_db import create_database
+    from services.state_repository import warm_load
+    create_database()
+    warm_load()
+    return get_backend()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--acoes', type=int, default=20, help='comandos por usuário')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--passo', type=float, default=60, help='avanço máximo do relógio por ação (s)')
+    parser.add_argument('--redis-db', type=int, default=15)
+    parser.add_argument('--fake', action='store_true', help='usar fakeredis em vez de um Redis local')
+    parser.add_argument('--memoria', action='store_true', help='usar o backend de estado em memória')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    backend = preparar(args.fake, args.memoria, args.redis_db)
+
+    from services import evolution_service as es
+    from services.state_repository import get_status, pending_count
+    from services.timeutil import set_clock
+
+    relogio = FakeClock()
+    set_clock(relogio)
+
+    chaves_transicao = [es.TRANSICAO_KEY.format(local=local) for local in ('CENTER', 'GOIO')]
+    contagem = Counter()
+    contagem_lock = threading.Lock()
+    esperas_lock = []
+    latencias = []
+
+    def contar(chave, valor=1):
+        with contagem_lock:
+            contagem[chave] += valor
+
+    # Instrumentação: notificações, inícios de transição e o lock de status
+    es.notify_group = lambda mensagem, group_id=None: True
+
+    start_transition = es.start_transition
+    def start_transition_instrumentado(local, nome_remetente):
+        ok = start_transition(local, nome_remetente)
+        if ok:
+            contar('iniciadas')
+            if backend.exists(*chaves_transicao) > 1:
+                contar('violacao_transicoes_simultaneas')
+        return ok
+    es.start_transition = start_transition_instrumentado
+
+    acquire_lock, release_lock = es.acquire_lock, es.release_lock
+    def acquire_instrumentado(key, timeout=30, espera=0):
+        inicio = time.perf_counter()
+        token = acquire_lock(key, timeout, espera)
+        with contagem_lock:
+            esperas_lock.append(time.perf_counter() - inicio)
+            contagem['lock_adquirido' if token else 'lock_recusado'] += 1
+        return token
+    def release_instrumentado(key, token):
+        liberado = release_lock(key, token)
+        if not liberado:
+            contar('violacao_lock_de_outro')
+        return liberado
+    es.acquire_lock, es.release_lock = acquire_instrumentado, release_instrumentado
+
+    # Monitor: amostra continuamente quantas transições estão ativas
+    parar = threading.Event()
+    def monitor():
+        while not parar.is_set():
+            if backend.exists(*chaves_transicao) > 1:
+                contar('violacao_transicoes_simultaneas')
+            contar('amostras_monitor')
+    thread_monitor = threading.Thread(target=monitor, daemon=True)
+    thread_monitor.start()
+
+    status_inicial, _ = get_status('CENTER', usar_cache=False)
+    pendentes_inicial = pending_count()
+    comandos, pesos = zip(*COMANDOS)
+
+    def usuario(n):
+        nome = f"usuario{n}"
+        resultados = []
+        for _ in range(args.acoes):
+            comando = random.choices(comandos, pesos)[0]
+            relogio.advance(random.uniform(0, args.passo))
+            inicio = time.perf_counter()
+            resposta = es.process_message({'text': comando, 'sender': {'pushName': nome}})
+            resultados.append((comando, classificar(resposta), time.perf_counter() - inicio))
+        return resultados
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        por_usuario = list(executor.map(usuario, range(args.usuarios)))
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    thread_monitor.join()
+
+    por_comando = Counter()
+    for resultados in por_usuario:
+        for comando, resultado, latencia in resultados:
+            por_comando[(comando, resultado)] += 1
+            latencias.append(latencia)
+            contar(resultado)
+
+    # Invariantes finais
+    ativas = backend.exists(*chaves_transicao)
+    status_final, _ = get_status('CENTER', usar_cache=False)
+    concluidas = contagem['concluida']
+    esperado = status_inicial if concluidas % 2 == 0 else ('FECHADO' if status_inicial == 'ABERTO' else 'ABERTO')
+    mudancas_gravadas = pending_count() - pendentes_inicial
+
+    # Relatos: um remetente ganha o bônus máximo em quóruns com outros e depois
+    # relata sozinho várias vezes (em um trecho separado do teste acima)
+    from config import RELATOS_JANELA
+    from services.report_aggregator import submit_report
+    for rodada in range(20):
+        relogio.advance(RELATOS_JANELA + 1)
+        submit_report('estresse', 'confiavel')
+        submit_report('estresse', f"ajudante{rodada}")
+    relogio.advance(RELATOS_JANELA + 1)
+    quorum_sozinho = False
+    for _ in range(10):
+        decidiu, _, _ = submit_report('estresse', 'confiavel')
+        quorum_sozinho |= decidiu
+        relogio.advance(1)
+
+    invariantes = {
+        'no máximo uma transição ativa': contagem['violacao_transicoes_simultaneas'] == 0,
+        'iniciadas = concluídas + canceladas + ativas':
+            contagem['iniciadas'] == concluidas + contagem['cancelada'] + ativas,
+        'status final condiz com as conclusões': status_final == esperado,
+        'uma mudança de status por lado por conclusão': mudancas_gravadas == 2 * concluidas,
+        'lock liberado no fim': not backend.exists(es.STATUS_LOCK_KEY),
+        'lock nunca liberado por quem não é o dono': contagem['violacao_lock_de_outro'] == 0,
+        'nenhuma resposta de erro': contagem['erro'] == 0,
+        'um remetente sozinho não atinge o quórum de relatos': not quorum_sozinho,
+    }
+
+    total = len(latencias)
+    print(f"Usuários: {args.usuarios}  Comandos: {total}  Threads: {args.threads}  "
+          f"Estado: {'memória' if args.memoria else 'fakeredis' if args.fake else f'Redis db {args.redis_db}'}")
+    print(f"Vazão: {total / duracao:.0f} comandos/s em {duracao:.2f}s")
+    print(f"Latência: p50 {percentil(latencias, 0.5) * 1000:.2f} ms  "
+          f"p99 {percentil(latencias, 0.99) * 1000:.2f} ms  máx {max(latencias) * 1000:.2f} ms")
+    print(f"Lock de status: {contagem['lock_adquirido']} adquiridos, {contagem['lock_recusado']} recusados "
+          f"({contagem['lock_recusado'] / max(1, contagem['lock_adquirido'] + contagem['lock_recusado']):.1%}), "
+          f"espera p99 {percentil(esperas_lock, 0.99) * 1000:.2f} ms")
+    print(f"Transições: {contagem['iniciadas']} iniciadas, {concluidas} concluídas, "
+          f"{contagem['cancelada']} canceladas, {ativas} ativa(s) no fim")
+    print("\nResultados por comando:")
+    for (comando, resultado), quantidade in sorted(por_comando.items()):
+        print(f"  {comando:10s} {resultado:24s} {quantidade:6d}")
+
+    print("\nInvariantes:")
+    for descricao, ok in invariantes.items():
+        print(f"  [{'ok' if ok else 'FALHOU'}] {descricao}")
+    sys.exit(0 if all(invariantes.values()) else 1)
+
+if __name__ == '__main__':
+    main()
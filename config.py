@@ -1,7 +1,7 @@
 from dotenv import load_dotenv
 import os
 import sys
-import pytz
+from zoneinfo import ZoneInfo
 from datetime import timedelta
 
 # Carrega as variáveis de ambiente do arquivo .env
@@ -22,54 +22,17 @@ APIKEY = os.getenv('APIKEY')
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
 CITY_ID = os.getenv('CITY_ID')
 
-# Validação das variáveis de ambiente
-required_vars = [
-    'BOT_URL', 'GROUP_ID', 'SERVER_URL', 'INSTANCE', 'APIKEY', 'WEATHER_API_KEY', 'CITY_ID'
-]
-
-# Primeiro verifica se as variáveis existem
-missing_vars = [var for var in required_vars if not os.getenv(var)]
-
-if missing_vars:
-    print(f"Erro: Variáveis de ambiente faltando: {', '.join(missing_vars)}")
-    print("Por favor, configure todas as variáveis necessárias no arquivo .env")
-    sys.exit(1)
-
-# Depois verifica se os valores são válidos
-invalid_vars = []
-
-# Verifica se as URLs são válidas
-for url_var in ['BOT_URL', 'SERVER_URL']:
-    url = os.getenv(url_var)
-    if not url.startswith(('http://', 'https://')):
-        invalid_vars.append(f"{url_var} (deve começar com http:// ou https://)")
-
-# Verifica se GROUP_ID é um número válido
-try:
-    # Formato do WhatsApp: número@g.us
-    group_id_parts = GROUP_ID.split('@')
-    if len(group_id_parts) != 2 or group_id_parts[1] != 'g.us':
-        invalid_vars.append("GROUP_ID (formato inválido, deve ser número@g.us)")
-    else:
-        # Verifica se a parte numérica é válida
-        int(group_id_parts[0])
-except (ValueError, AttributeError):
-    invalid_vars.append("GROUP_ID (formato inválido, deve ser número@g.us)")
-
-# Verifica se APIKEY tem um tamanho mínimo
-if len(APIKEY) < 10:
-    invalid_vars.append("APIKEY (muito curta, verifique se está correta)")
-
-if invalid_vars:
-    print(f"Erro: Valores inválidos nas variáveis de ambiente: {', '.join(invalid_vars)}")
-    print("Por favor, corrija os valores no arquivo .env")
-    sys.exit(1)
-
 # Configurações do Flask
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true' 
 
+# Configurações de processos
+WORKERS = int(os.getenv('WORKERS', '1'))  # acima de 1 usa gunicorn (prefork)
+SHARED_STATE_BACKEND = os.getenv('SHARED_STATE_BACKEND', 'redis')  # 'redis' ou 'local'
+SHARED_STATE_PATH = os.getenv('SHARED_STATE_PATH', 'shared_state.db')  # usado no modo 'local'
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'redis')  # 'redis' ou 'memoria' (um único processo, sem Redis)
+
 # Configuração do fuso horário
-BR_TIMEZONE = pytz.timezone('America/Sao_Paulo')
+BR_TIMEZONE = ZoneInfo('America/Sao_Paulo')
 
 # Configurações de publicidade
 INTERVALO_MINIMO_PUBLICIDADE = timedelta(minutes=30)
@@ -77,6 +40,8 @@ CHANCE_PUBLICIDADE = 0.5  # 50% de chance
 
 # Configurações de clima
 WEATHER_UPDATE_INTERVAL = 1800  # 30 minutos em segundos
+CLIMA_MAX_REGISTROS = int(os.getenv('CLIMA_MAX_REGISTROS', '500'))  # mudanças de clima mantidas no banco
+CLIMA_ARQUIVO = os.getenv('CLIMA_ARQUIVO')  # arquivo NDJSON opcional para leituras removidas
 WEATHER_ALERT_THRESHOLDS = {
     'temp_max': 35,  # Alerta de calor acima de 35°C
     'temp_min': 10,  # Alerta de frio abaixo de 10°C
@@ -102,4 +67,113 @@ RELEVANCE_CATEGORIES = [
 ]
 
 # Configurações de alertas
-ALERTA_TEMPO_MEDIO = 1.5  # Alerta quando fechamento > 150% da média
\ No newline at end of file
+ALERTA_TEMPO_MEDIO = float(os.getenv('ALERTA_TEMPO_MEDIO', '1.5'))  # Alerta quando fechamento > 150% da média
+ALERTA_JANELA = int(os.getenv('ALERTA_JANELA', '50'))  # fechamentos com o mesmo peso na média; depois vira média móvel
+ALERTA_MINIMO_AMOSTRAS = int(os.getenv('ALERTA_MINIMO_AMOSTRAS', '5'))  # fechamentos antes do primeiro alerta
+ALERTA_INTERVALO = int(os.getenv('ALERTA_INTERVALO', '60'))  # segundos entre verificações da transição
+
+# Configurações de agregação de histórico (rollups)
+ROLLUP_INTERVALO = int(os.getenv('ROLLUP_INTERVALO', '300'))  # segundos entre compactações
+RETENCAO_FECHAMENTOS_DIAS = int(os.getenv('RETENCAO_FECHAMENTOS_DIAS', '90'))  # dados brutos
+RETENCAO_ROLLUP_HORA_DIAS = int(os.getenv('RETENCAO_ROLLUP_HORA_DIAS', '400'))  # agregados por hora
+
+# Configurações dos circuit breakers (Evolution API, OpenWeather, OpenAI)
+CIRCUIT_JANELA = int(os.getenv('CIRCUIT_JANELA', '60'))  # janela de medição em segundos
+CIRCUIT_TAXA_FALHAS = float(os.getenv('CIRCUIT_TAXA_FALHAS', '0.5'))  # abre com 50% de falhas
+CIRCUIT_MINIMO_CHAMADAS = int(os.getenv('CIRCUIT_MINIMO_CHAMADAS', '4'))  # chamadas mínimas na janela
+CIRCUIT_TEMPO_ABERTO = int(os.getenv('CIRCUIT_TEMPO_ABERTO', '30'))  # segundos até a chamada de teste
+
+# Administração e profiling
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # token exigido no header X-Admin-Token
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # fração do /webhook perfilada
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_ARQUIVOS = int(os.getenv('PROFILE_MAX_ARQUIVOS', '20'))  # arquivos mantidos por tipo
+
+# Persistência do status (write-behind do Redis para o SQLite)
+ESTADO_FLUSH_INTERVALO = float(os.getenv('ESTADO_FLUSH_INTERVALO', '2'))  # segundos
+ESTADO_FLUSH_LOTE = int(os.getenv('ESTADO_FLUSH_LOTE', '500'))  # mudanças por transação
+
+# Gravação em lote de fechamentos e clima
+ESCRITA_LOTE_MAX = int(os.getenv('ESCRITA_LOTE_MAX', '200'))  # grava ao juntar M linhas
+ESCRITA_INTERVALO_MS = int(os.getenv('ESCRITA_INTERVALO_MS', '200'))  # ou a cada N ms
+ESCRITA_FILA_MAX = int(os.getenv('ESCRITA_FILA_MAX', '10000'))  # acima disso grava na hora
+
+# Controle de admissão do /webhook (descarte por prioridade sob carga)
+THREADS = int(os.getenv('THREADS', '4'))  # threads do waitress/gunicorn por processo
+ADMISSAO_LIMITE_MAX = int(os.getenv('ADMISSAO_LIMITE_MAX', str(THREADS)))  # requisições simultâneas
+ADMISSAO_LIMITE_MIN = int(os.getenv('ADMISSAO_LIMITE_MIN', '2'))  # piso do limite adaptativo
+ADMISSAO_LATENCIA_ALVO_MS = float(os.getenv('ADMISSAO_LATENCIA_ALVO_MS', '500'))  # acima disso o limite cai
+
+# Agregação de relatos em texto livre ("fechado", "passando"...)
+RELATOS_JANELA = int(os.getenv('RELATOS_JANELA', '120'))  # segundos em que os relatos valem
+RELATOS_QUORUM = float(os.getenv('RELATOS_QUORUM', '1.5'))  # soma de pesos para alternar o status
+RELATOS_PESO_MAX = float(os.getenv('RELATOS_PESO_MAX', '1.4'))  # peso máximo de um remetente confiável (menor que o quórum)
+RELATOS_PESO_VALIDADE = int(os.getenv('RELATOS_PESO_VALIDADE', '2592000'))  # segundos até o bônus voltar ao padrão (30 dias)
+
+# Estado efêmero por usuário (última ação, confirmações) em hashes por bucket
+USUARIOS_BUCKET_SEGUNDOS = int(os.getenv('USUARIOS_BUCKET_SEGUNDOS', '300'))  # cada bucket vive dois períodos
+USUARIOS_SHARDS = int(os.getenv('USUARIOS_SHARDS', '16'))  # hashes por bucket (~128 usuários cada)
+
+# Perguntas frequentes (índice TF-IDF local antes do modelo remoto)
+FAQ_LIMIAR = float(os.getenv('FAQ_LIMIAR', '0.45'))  # similaridade mínima para responder sem o modelo
+FAQ_LIMIAR_MODELO = float(os.getenv('FAQ_LIMIAR_MODELO', '0.3'))  # abaixo disso a pergunta é ignorada (fora do tema)
+FAQ_MODELO = os.getenv('FAQ_MODELO', 'gpt-4')  # modelo remoto abaixo do limiar (vazio desativa)
+
+# Recuperação das mensagens perdidas enquanto o bot estava fora do ar
+CATCHUP_JANELA = int(os.getenv('CATCHUP_JANELA', '3600'))  # segundos de histórico consultados (0 desativa)
+CATCHUP_PAGINA = int(os.getenv('CATCHUP_PAGINA', '50'))  # mensagens por página da Evolution API
+CATCHUP_MAX_PAGINAS = int(os.getenv('CATCHUP_MAX_PAGINAS', '20'))  # limite de páginas por recuperação
+
+def validate_config():
+    """Valida as variáveis de ambiente obrigatórias (encerra o processo se houver erro)"""
+    required_vars = [
+        'BOT_URL', 'GROUP_ID', 'SERVER_URL', 'INSTANCE', 'APIKEY', 'WEATHER_API_KEY', 'CITY_ID'
+    ]
+
+    # Primeiro verifica se as variáveis existem
+    missing_vars = [var for var in required_vars if not os.getenv(var)]
+
+    if missing_vars:
+        print(f"Erro: Variáveis de ambiente faltando: {', '.join(missing_vars)}")
+        print("Por favor, configure todas as variáveis necessárias no arquivo .env")
+        sys.exit(1)
+
+    # Depois verifica se os valores são válidos
+    invalid_vars = []
+
+    # Verifica se as URLs são válidas
+    for url_var in ['BOT_URL', 'SERVER_URL']:
+        url = os.getenv(url_var)
+        if not url.startswith(('http://', 'https://')):
+            invalid_vars.append(f"{url_var} (deve começar com http:// ou https://)")
+
+    # Verifica se GROUP_ID é um número válido
+    try:
+        # Formato do WhatsApp: número@g.us
+        group_id_parts = GROUP_ID.split('@')
+        if len(group_id_parts) != 2 or group_id_parts[1] != 'g.us':
+            invalid_vars.append("GROUP_ID (formato inválido, deve ser número@g.us)")
+        else:
+            # Verifica se a parte numérica é válida
+            int(group_id_parts[0])
+    except (ValueError, AttributeError):
+        invalid_vars.append("GROUP_ID (formato inválido, deve ser número@g.us)")
+
+    # Verifica se APIKEY tem um tamanho mínimo
+    if len(APIKEY) < 10:
+        invalid_vars.append("APIKEY (muito curta, verifique se está correta)")
+
+    # O estado em memória não é compartilhado entre processos
+    if STATE_BACKEND not in ('redis', 'memoria'):
+        invalid_vars.append("STATE_BACKEND (use 'redis' ou 'memoria')")
+    elif STATE_BACKEND == 'memoria' and WORKERS > 1:
+        invalid_vars.append("STATE_BACKEND ('memoria' exige WORKERS=1)")
+
+    # Um único remetente, por mais confiável, não pode atingir o quórum sozinho
+    if RELATOS_PESO_MAX >= RELATOS_QUORUM:
+        invalid_vars.append("RELATOS_PESO_MAX (deve ser menor que RELATOS_QUORUM)")
+
+    if invalid_vars:
+        print(f"Erro: Valores inválidos nas variáveis de ambiente: {', '.join(invalid_vars)}")
+        print("Por favor, corrija os valores no arquivo .env")
+        sys.exit(1)
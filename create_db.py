@@ -1,16 +1,104 @@
 import sqlite3
+from services.timeutil import to_epoch
+
+# Versão do esquema (PRAGMA user_version)
+# 1: instantes como INTEGER (segundos desde a época) em vez de texto
+SCHEMA_VERSION = 1
+
+# Colunas de instante por tabela, migradas de texto para INTEGER na versão 1
+COLUNAS_TEMPO = {
+    'status_transito': ('ultima_atualizacao',),
+    'historico_status': ('timestamp',),
+    'fechamentos': ('timestamp',),
+    'clima': ('ultima_atualizacao', 'ultima_leitura')
+}
+
+# Índices das tabelas migradas (recriados nas tabelas novas)
+INDICES_TEMPO = ('idx_status_transito_lado', 'idx_fechamentos_timestamp', 'idx_clima_atualizacao')
+
+def add_column_if_missing(cursor, tabela, coluna, definicao):
+    """Adiciona uma coluna a uma tabela existente (migração de bancos antigos)"""
+    cursor.execute(f"PRAGMA table_info({tabela})")
+    if coluna not in [linha[1] for linha in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+
+def table_exists(cursor, tabela):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,))
+    return cursor.fetchone() is not None
+
+def prepare_epoch_migration(cursor):
+    """
+    Renomeia as tabelas com instantes em texto para que sejam recriadas com
+    colunas INTEGER. Retorna as tabelas renomeadas.
+    """
+    if table_exists(cursor, 'clima'):
+        add_column_if_missing(cursor, 'clima', 'ultima_leitura', 'TEXT')
+    if table_exists(cursor, 'status_transito'):
+        # Bancos antigos podem ter mais de um registro por lado
+        cursor.execute('''
+        DELETE FROM status_transito
+        WHERE id NOT IN (SELECT MAX(id) FROM status_transito GROUP BY lado)
+        ''')
+    for indice in INDICES_TEMPO:
+        cursor.execute(f"DROP INDEX IF EXISTS {indice}")
+
+    renomeadas = []
+    for tabela in COLUNAS_TEMPO:
+        if table_exists(cursor, tabela):
+            cursor.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_texto")
+            renomeadas.append(tabela)
+    return renomeadas
+
+def copy_epoch_rows(cursor, tabela):
+    """Copia as linhas de <tabela>_texto para a tabela nova convertendo os instantes"""
+    cursor.execute(f"SELECT * FROM {tabela}_texto")
+    colunas = [descricao[0] for descricao in cursor.description]
+    indices = [colunas.index(coluna) for coluna in COLUNAS_TEMPO[tabela]]
+
+    linhas = []
+    for linha in cursor.fetchall():
+        linha = list(linha)
+        for i in indices:
+            linha[i] = to_epoch(linha[i])
+        linhas.append(linha)
+
+    cursor.executemany(
+        f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+        linhas
+    )
+    cursor.execute(f"DROP TABLE {tabela}_texto")
 
 def create_database():
     conn = sqlite3.connect('traffic.db')
     cursor = conn.cursor()
 
+    # Uma transação para todo o esquema: a migração é atômica e dois
+    # processos iniciando juntos não migram o mesmo banco
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("PRAGMA user_version")
+    versao = cursor.fetchone()[0]
+    migrar = prepare_epoch_migration(cursor) if versao < 1 else []
+
     # Criação da tabela de status de trânsito
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS status_transito (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         lado TEXT NOT NULL,
         status TEXT NOT NULL,
-        ultima_atualizacao TEXT NOT NULL
+        ultima_atualizacao INTEGER NOT NULL
+    )
+    ''')
+
+    # Um registro por lado (necessário para a persistência em lote)
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_status_transito_lado ON status_transito (lado)')
+
+    # Histórico de mudanças de status
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS historico_status (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lado TEXT NOT NULL,
+        status TEXT NOT NULL,
+        timestamp INTEGER NOT NULL
     )
     ''')
 
@@ -24,16 +112,72 @@ def create_database():
     )
     ''')
 
+    # Criação da tabela de fechamentos (dados brutos)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS fechamentos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lado TEXT NOT NULL,
+        tempo_fechamento INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fechamentos_timestamp ON fechamentos (timestamp)')
+
+    # Agregados por hora (hora local no formato 'YYYY-MM-DD HH')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS fechamentos_hora (
+        hora TEXT NOT NULL,
+        lado TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        soma_tempo INTEGER NOT NULL,
+        total_chuva INTEGER NOT NULL DEFAULT 0,
+        soma_tempo_chuva INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hora, lado)
+    )
+    ''')
+
+    # Agregados por dia, derivados dos agregados por hora
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS fechamentos_dia (
+        dia TEXT NOT NULL,
+        lado TEXT NOT NULL,
+        dia_semana INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        soma_tempo INTEGER NOT NULL,
+        total_chuva INTEGER NOT NULL DEFAULT 0,
+        soma_tempo_chuva INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, lado)
+    )
+    ''')
+
+    # Controle do compactador (último id de fechamento já agregado)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_estado (
+        chave TEXT PRIMARY KEY,
+        valor INTEGER NOT NULL
+    )
+    ''')
+
     # Criação da tabela de clima
+    # Cada linha é uma mudança de condição: ultima_atualizacao marca quando a
+    # condição começou e ultima_leitura a última vez que ela foi confirmada
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS clima (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         condicao TEXT NOT NULL,
         alerta TEXT,
-        ultima_atualizacao TEXT NOT NULL
+        ultima_atualizacao INTEGER NOT NULL,
+        ultima_leitura INTEGER
     )
     ''')
 
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_clima_atualizacao ON clima (ultima_atualizacao)')
+
+    # Migração dos instantes em texto para segundos desde a época
+    for tabela in migrar:
+        copy_epoch_rows(cursor, tabela)
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
     conn.commit()
     conn.close()
 
@@ -1,150 +1,135 @@
 import sqlite3
-from datetime import datetime, timedelta
-import pytz
-from config import BR_TIMEZONE
-import redis
-import json
-import sys
-import os
-
-# Configuração do Redis
-redis_client = redis.Redis(
-    host=os.getenv('REDIS_HOST', 'sigabot_redis'),
-    port=int(os.getenv('REDIS_PORT', '6379')),
-    db=int(os.getenv('REDIS_DB', '0')),
-    password=os.getenv('REDIS_PASSWORD'),
-    decode_responses=True
+from datetime import datetime
+from config import (
+    BR_TIMEZONE, CLIMA_MAX_REGISTROS, CLIMA_ARQUIVO,
+    ESCRITA_LOTE_MAX, ESCRITA_INTERVALO_MS, ESCRITA_FILA_MAX, ALERTA_JANELA
 )
-
-# Testa conexão com Redis
-try:
-    redis_client.ping()
-except redis.ConnectionError as e:
-    print(f"Erro ao conectar ao Redis: {e}")
-    print("Verifique se o serviço 'sigabot_redis' está acessível")
-except redis.AuthenticationError as e:
-    print(f"Erro de autenticação no Redis: {e}")
-    print("Verifique se a senha do Redis está correta")
-    sys.exit(1)
+import json
+from services.cache import weather_cache, stats_cache
+from services.batch_writer import BatchWriter
+from services import closure_stats
+from services.timeutil import now_epoch, format_epoch, day_bounds
 
 def connect_db():
     return sqlite3.connect('traffic.db')
 
-def get_status(lado):
+# Inserções de fechamentos e clima saem do caminho da resposta e são
+# gravadas em lote por uma thread (veja write_queue no fim do módulo)
+
+def load_status_rows():
+    """Lê o status persistido de todos os lados"""
     conn = connect_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT status, ultima_atualizacao FROM status_transito WHERE lado = ?", (lado,))
-    result = cursor.fetchone()
+    cursor.execute("SELECT lado, status, ultima_atualizacao FROM status_transito")
+    result = cursor.fetchall()
     conn.close()
-    
-    if result:
-        status, ultima_atualizacao = result
-        try:
-            ultima_atualizacao = datetime.strptime(ultima_atualizacao.split('.')[0], '%Y-%m-%d %H:%M:%S')
-            ultima_atualizacao = BR_TIMEZONE.localize(ultima_atualizacao)
-            ultima_atualizacao_str = ultima_atualizacao.strftime('%d/%m/%Y %H:%M')
-            return status, ultima_atualizacao_str
-        except Exception:
-            return status, ultima_atualizacao
-    return None, None
-
-def update_status(lado, novo_status):
+    return result
+
+def save_status_changes(mudancas):
+    """
+    Persiste um lote de mudanças de status (lado, status, ultima_atualizacao)
+    em uma única transação: atualiza o status atual e grava o histórico.
+    """
     conn = connect_db()
-    cursor = conn.cursor()
-    agora = datetime.now(BR_TIMEZONE)
-    agora_str = agora.strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute(
-        "UPDATE status_transito SET status = ?, ultima_atualizacao = ? WHERE lado = ?",
-        (novo_status, agora_str, lado)
-    )
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO status_transito (lado, status, ultima_atualizacao) VALUES (?, ?, ?)
+            ON CONFLICT (lado) DO UPDATE SET
+                status = excluded.status,
+                ultima_atualizacao = excluded.ultima_atualizacao
+            WHERE excluded.ultima_atualizacao >= status_transito.ultima_atualizacao
+        """, mudancas)
+        cursor.executemany(
+            "INSERT INTO historico_status (lado, status, timestamp) VALUES (?, ?, ?)",
+            mudancas
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-def record_closure_time(lado, tempo_fechamento):
-    """Registra tempo de fechamento"""
+def record_closure_time(lado, tempo_fechamento, timestamp=None):
+    """Registra tempo de fechamento (gravado em lote pelo write_queue)"""
     # Ignorar tempos muito curtos (menos de 1 minuto) pois provavelmente são correções
     if tempo_fechamento < 60:  # 60 segundos
         return
         
-    conn = connect_db()
-    cursor = conn.cursor()
-    agora = datetime.now(BR_TIMEZONE)
-    agora_str = agora.strftime('%Y-%m-%d %H:%M:%S')
-    
-    cursor.execute(
+    write_queue.submit('fechamento', (lado, tempo_fechamento, timestamp or now_epoch()))
+    closure_stats.record(lado, tempo_fechamento)
+
+def write_closures(cursor, fechamentos):
+    """Grava um lote de fechamentos (lado, tempo_fechamento, timestamp)"""
+    cursor.executemany(
         "INSERT INTO fechamentos (lado, tempo_fechamento, timestamp) VALUES (?, ?, ?)",
-        (lado, tempo_fechamento, agora_str)
+        fechamentos
     )
-    conn.commit()
-    conn.close()
 
-def calculate_average_closure(lado, limit=5):
-    """Calcula média móvel dos últimos fechamentos"""
+def closures_written(fechamentos, _):
+    for dia in {format_epoch(timestamp, '%Y-%m-%d') for _, _, timestamp in fechamentos}:
+        stats_cache.invalidate(dia)
+
+def warm_closure_stats(limit=ALERTA_JANELA):
+    """Monta a estatística online de cada lado com os últimos fechamentos, se ainda não existe"""
     conn = connect_db()
-    cursor = conn.cursor()
-    
-    # Pegar apenas fechamentos com duração significativa (mais de 1 minuto)
-    cursor.execute("""
-        SELECT tempo_fechamento 
-        FROM fechamentos 
-        WHERE lado = ? 
-        AND tempo_fechamento >= 60
-        ORDER BY id DESC
-        LIMIT ?
-    """, (lado, limit))
-    
-    tempos = cursor.fetchall()
-    conn.close()
-    
-    if not tempos:
-        return None
-        
-    # Remover outliers (tempos muito diferentes da média)
-    tempos = [t[0] for t in tempos]
-    media = sum(tempos) / len(tempos)
-    desvio_padrao = (sum((x - media) ** 2 for x in tempos) / len(tempos)) ** 0.5
-    
-    # Considerar apenas tempos dentro de 2 desvios padrão da média
-    tempos_filtrados = [t for t in tempos if abs(t - media) <= 2 * desvio_padrao]
-    
-    if not tempos_filtrados:
-        return media  # Se todos forem outliers, retorna a média original
-        
-    return sum(tempos_filtrados) / len(tempos_filtrados)
+    try:
+        cursor = conn.cursor()
+        for lado in ('CENTER', 'GOIO'):
+            cursor.execute("""
+                SELECT tempo_fechamento FROM fechamentos
+                WHERE lado = ? AND tempo_fechamento >= 60
+                ORDER BY id DESC
+                LIMIT ?
+            """, (lado, limit))
+            # Do mais antigo ao mais recente, como se chegassem um a um
+            closure_stats.seed(lado, [tempo for tempo, in reversed(cursor.fetchall())])
+    finally:
+        conn.close()
+
+def current_day():
+    """Dia atual no fuso do Brasil (chave das estatísticas diárias)"""
+    return datetime.now(BR_TIMEZONE).date()
 
 def get_daily_stats():
     """Retorna estatísticas do dia atual"""
+    hoje = current_day()
+    return stats_cache.get_or_load(hoje.strftime('%Y-%m-%d'), lambda: load_daily_stats(hoje))
+
+def load_daily_stats(hoje):
+    """Calcula as estatísticas de um dia direto no banco"""
     conn = connect_db()
-    cursor = conn.cursor()
-    hoje = datetime.now(BR_TIMEZONE).strftime('%Y-%m-%d')
-    
-    # Total de fechamentos do dia
-    cursor.execute(
-        "SELECT COUNT(*) FROM fechamentos WHERE date(timestamp) = ?",
-        (hoje,)
-    )
-    total_fechamentos = cursor.fetchone()[0]
+    try:
+        return query_daily_stats(conn.cursor(), hoje)
+    finally:
+        conn.close()
+
+def query_daily_stats(cursor, hoje):
+    """Estatísticas de um dia (total, tempo médio em segundos e horário de pico)"""
+    # Intervalo do dia em segundos desde a época (usa o índice de timestamp)
+    inicio, fim = day_bounds(hoje)
     
-    # Tempo médio de fechamento
+    # Total de fechamentos e tempo médio do dia
     cursor.execute(
-        "SELECT AVG(tempo_fechamento) FROM fechamentos WHERE date(timestamp) = ?",
-        (hoje,)
+        "SELECT COUNT(*), AVG(tempo_fechamento) FROM fechamentos WHERE timestamp >= ? AND timestamp < ?",
+        (inicio, fim)
     )
-    tempo_medio = cursor.fetchone()[0] or 0
+    total_fechamentos, tempo_medio = cursor.fetchone()
+    tempo_medio = tempo_medio or 0
     
-    # Horário mais movimentado
+    # Horário mais movimentado (hora local contada a partir do início do dia)
     cursor.execute("""
-        SELECT strftime('%H:00', timestamp) as hora, COUNT(*) as total
+        SELECT (timestamp - ?) / 3600 as hora, COUNT(*) as total
         FROM fechamentos 
-        WHERE date(timestamp) = ?
+        WHERE timestamp >= ? AND timestamp < ?
         GROUP BY hora
         ORDER BY total DESC
         LIMIT 1
-    """, (hoje,))
+    """, (inicio, inicio, fim))
     result = cursor.fetchone()
-    horario_pico = result[0] if result else "Sem dados"
+    horario_pico = f"{result[0]:02d}:00" if result else "Sem dados"
     
-    conn.close()
     return {
         'total_fechamentos': total_fechamentos,
         'tempo_medio': int(tempo_medio),
@@ -153,30 +138,170 @@ def get_daily_stats():
 
 def get_weather_status():
     """Retorna o último status do clima registrado"""
+    return weather_cache.get_or_load('atual', load_weather_status)
+
+def load_weather_status():
+    """Lê o último status do clima direto no banco"""
     conn = connect_db()
-    cursor = conn.cursor()
+    try:
+        return query_weather_status(conn.cursor())
+    finally:
+        conn.close()
+
+def query_weather_status(cursor):
     cursor.execute(
-        "SELECT condicao, alerta, ultima_atualizacao FROM clima ORDER BY id DESC LIMIT 1"
+        "SELECT condicao, alerta, ultima_atualizacao, ultima_leitura FROM clima ORDER BY id DESC LIMIT 1"
     )
     result = cursor.fetchone()
-    conn.close()
     
     if result:
         return {
             'condicao': result[0],
             'alerta': result[1],
-            'ultima_atualizacao': result[2]
+            'ultima_atualizacao': result[2],
+            'ultima_leitura': result[3] or result[2]
         }
     return None
 
-def update_weather(condicao, alerta=None):
-    """Atualiza o status do clima"""
+def load_status_dependencies(clima=False, dia=None):
+    """
+    Lê o clima atual e/ou as estatísticas de um dia em uma única transação
+    de leitura (uma conexão, um snapshot consistente)
+    """
     conn = connect_db()
-    cursor = conn.cursor()
-    agora = datetime.now(BR_TIMEZONE)
+    try:
+        conn.execute('BEGIN')
+        cursor = conn.cursor()
+        resultado = {}
+        if clima:
+            resultado['clima'] = query_weather_status(cursor)
+        if dia:
+            resultado['estatisticas'] = query_daily_stats(cursor, dia)
+        conn.commit()
+        return resultado
+    finally:
+        conn.close()
+
+def archive_weather(rows):
+    """Exporta leituras de clima removidas para o arquivo NDJSON configurado"""
+    with open(CLIMA_ARQUIVO, 'a', encoding='utf-8') as arquivo:
+        for id_, condicao, alerta, ultima_atualizacao, ultima_leitura in rows:
+            arquivo.write(json.dumps({
+                'id': id_,
+                'condicao': condicao,
+                'alerta': alerta,
+                'ultima_atualizacao': ultima_atualizacao,
+                'ultima_leitura': ultima_leitura
+            }, ensure_ascii=False) + '\n')
+
+def apply_weather_reading(cursor, condicao, alerta, agora, removidas=None):
+    """
+    Grava uma leitura de clima. Só insere uma nova linha quando a condição
+    ou o alerta mudam; caso contrário apenas renova a última leitura.
+    As linhas antigas removidas vão para `removidas`, para serem arquivadas
+    só depois do commit. Retorna True quando houve mudança.
+    """
+    cursor.execute("SELECT id, condicao, alerta FROM clima ORDER BY id DESC LIMIT 1")
+    ultimo = cursor.fetchone()
+    
+    if ultimo and ultimo[1] == condicao and ultimo[2] == alerta:
+        cursor.execute(
+            "UPDATE clima SET ultima_leitura = ? WHERE id = ?",
+            (agora, ultimo[0])
+        )
+        return False
+        
     cursor.execute(
-        "INSERT INTO clima (condicao, alerta, ultima_atualizacao) VALUES (?, ?, ?)",
-        (condicao, alerta, agora.strftime('%Y-%m-%d %H:%M:%S'))
+        "INSERT INTO clima (condicao, alerta, ultima_atualizacao, ultima_leitura) VALUES (?, ?, ?, ?)",
+        (condicao, alerta, agora, agora)
     )
-    conn.commit()
-    conn.close() 
\ No newline at end of file
+    
+    # Manter apenas as últimas CLIMA_MAX_REGISTROS mudanças (ids são crescentes)
+    limite = cursor.lastrowid - CLIMA_MAX_REGISTROS
+    if limite > 0:
+        if CLIMA_ARQUIVO and removidas is not None:
+            cursor.execute(
+                "SELECT id, condicao, alerta, ultima_atualizacao, ultima_leitura FROM clima WHERE id <= ? ORDER BY id",
+                (limite,)
+            )
+            removidas.extend(cursor.fetchall())
+        cursor.execute("DELETE FROM clima WHERE id <= ?", (limite,))
+    return True
+
+def write_weather(cursor, leituras):
+    """
+    Grava um lote de leituras de clima (condicao, alerta, timestamp) em ordem.
+    Retorna as linhas removidas pelo limite de registros
+    """
+    removidas = []
+    for condicao, alerta, agora in leituras:
+        apply_weather_reading(cursor, condicao, alerta, agora, removidas)
+    return removidas
+
+def weather_written(leituras, removidas):
+    weather_cache.invalidate('atual')
+    # Arquivo só depois do commit: rollback ou nova tentativa não duplicam linhas
+    if removidas:
+        archive_weather(removidas)
+
+def update_weather(condicao, alerta=None):
+    """
+    Registra uma leitura do clima (gravada em lote pelo write_queue).
+    Retorna True quando a condição ou o alerta mudaram em relação à última leitura.
+    """
+    atual = get_weather_status()
+    mudou = not atual or atual['condicao'] != condicao or atual['alerta'] != alerta
+    write_queue.submit('clima', (condicao, alerta, now_epoch()))
+    return mudou
+
+# Colunas exportadas de cada tabela de histórico e a coluna de instante
+# usada no filtro de período (consultadas por id, em páginas)
+EXPORTACOES = {
+    'fechamentos': (('id', 'lado', 'tempo_fechamento', 'timestamp'), 'timestamp'),
+    'clima': (('id', 'condicao', 'alerta', 'ultima_atualizacao', 'ultima_leitura'), 'ultima_atualizacao')
+}
+
+def iter_history(tabela, inicio=None, fim=None, lado=None, lote=1000):
+    """
+    Percorre o histórico de uma tabela em ordem de id, uma página por
+    consulta (keyset: id > último id lido). Cada página é lida por completo
+    antes de ser entregue, então nenhuma leitura fica aberta entre páginas
+    e o escritor não é bloqueado. Gera tuplas com as colunas de EXPORTACOES.
+    """
+    colunas, coluna_tempo = EXPORTACOES[tabela]
+    filtros = ["id > ?"]
+    params = []
+    if inicio is not None:
+        filtros.append(f"{coluna_tempo} >= ?")
+        params.append(inicio)
+    if fim is not None:
+        filtros.append(f"{coluna_tempo} < ?")
+        params.append(fim)
+    if lado and 'lado' in colunas:
+        filtros.append("lado = ?")
+        params.append(lado)
+    sql = (
+        f"SELECT {', '.join(colunas)} FROM {tabela} "
+        f"WHERE {' AND '.join(filtros)} ORDER BY id LIMIT ?"
+    )
+
+    ultimo_id = 0
+    conn = connect_db()
+    try:
+        while True:
+            linhas = conn.execute(sql, [ultimo_id] + params + [lote]).fetchall()
+            if not linhas:
+                return
+            yield from linhas
+            if len(linhas) < lote:
+                return
+            ultimo_id = linhas[-1][0]
+    finally:
+        conn.close()
+
+write_queue = BatchWriter(
+    'sqlite', connect_db,
+    lote=ESCRITA_LOTE_MAX, intervalo_ms=ESCRITA_INTERVALO_MS, max_fila=ESCRITA_FILA_MAX
+)
+write_queue.register('fechamento', write_closures, closures_written)
+write_queue.register('clima', write_weather, weather_written)
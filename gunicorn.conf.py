@@ -0,0 +1,44 @@
+# Configuração do gunicorn para o modo com vários processos (WORKERS > 1)
+#
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+#
+# Todo estado compartilhado entre requisições (publicidade, caches, agendas)
+# fica no Redis ou no arquivo de SHARED_STATE_PATH, então cada worker pode
+# atender qualquer mensagem.
+import os
+from config import WORKERS, STATE_BACKEND
+
+bind = f"0.0.0.0:{os.getenv('PORT', '80')}"
+# Mesmo padrão de config.WORKERS (validado em validate_config)
+workers = WORKERS
+worker_class = 'gthread'
+threads = int(os.getenv('THREADS', '4'))
+timeout = 30
+
+# A aplicação é criada em cada worker, depois do fork: nenhuma conexão
+# (Redis, SQLite, HTTP) é herdada do processo mestre
+preload_app = False
+
+def on_starting(server):
+    """Prepara o banco uma única vez, no processo mestre"""
+    # -w na linha de comando também muda a quantidade de workers
+    if STATE_BACKEND == 'memoria' and server.cfg.workers > 1:
+        server.log.error("STATE_BACKEND=memoria exige um único worker (cada processo teria o próprio estado)")
+        raise SystemExit(1)
+    from create_db import create_database
+    create_database()
+
+def post_fork(server, worker):
+    """Garante que o worker crie seus próprios clientes"""
+    from services.clients import reset_clients
+    reset_clients()
+
+def worker_exit(server, worker):
+    """Grava o que ainda está nas filas de escrita antes de o worker sair"""
+    from database import write_queue
+    from services.state_repository import flush_pending
+    write_queue.flush()
+    try:
+        flush_pending()
+    except Exception as e:
+        server.log.error(f"Erro ao persistir status na saída do worker: {e}")
@@ -0,0 +1,101 @@
+import threading
+from services.faq import is_question
+from config import (
+    ADMISSAO_LIMITE_MIN, ADMISSAO_LIMITE_MAX, ADMISSAO_LATENCIA_ALVO_MS
+)
+
+# Classes de prioridade (menor número = mais importante)
+PRIORIDADE_ALTA = 0    # mudam o estado: alternar, passou, cancelar, confirmações
+PRIORIDADE_MEDIA = 1   # consultas: !status, perguntas e demais comandos
+PRIORIDADE_BAIXA = 2   # conversa livre
+
+NOMES_PRIORIDADE = {
+    PRIORIDADE_ALTA: 'alta',
+    PRIORIDADE_MEDIA: 'media',
+    PRIORIDADE_BAIXA: 'baixa'
+}
+
+# Fração do limite que cada prioridade pode ocupar: a conversa livre é a
+# primeira a ser descartada e os comandos de estado usam o limite inteiro
+FRACAO_LIMITE = {
+    PRIORIDADE_ALTA: 1.0,
+    PRIORIDADE_MEDIA: 0.8,
+    PRIORIDADE_BAIXA: 0.5
+}
+
+COMANDOS_ALTA = {'!alterna', '!passou', '!cancelar', '!sim', '!nao'}
+PALAVRAS_ESTADO = ['fechado', 'aberto', 'liberado', 'bloqueado', 'passando', 'parado']
+PALAVRAS_STATUS = ['como esta', 'como está', 'status']
+
+def classify(texto):
+    """Classifica a prioridade de uma mensagem com as mesmas regras do process_message"""
+    mensagem = (texto or '').strip().lower()
+    if mensagem.startswith('!'):
+        return PRIORIDADE_ALTA if mensagem in COMANDOS_ALTA else PRIORIDADE_MEDIA
+    if any(palavra in mensagem for palavra in PALAVRAS_STATUS) or is_question(mensagem):
+        return PRIORIDADE_MEDIA
+    if any(palavra in mensagem for palavra in PALAVRAS_ESTADO):
+        return PRIORIDADE_ALTA
+    return PRIORIDADE_BAIXA
+
+class AdmissionController:
+    """
+    Controle de admissão com limite de requisições simultâneas que se adapta
+    à latência medida (AIMD): sobe de um em um enquanto a latência está
+    abaixo do alvo e cai 10% quando passa dele.
+    """
+
+    AJUSTE_A_CADA = 10  # requisições concluídas entre ajustes do limite
+
+    def __init__(self, limite_min=ADMISSAO_LIMITE_MIN, limite_max=ADMISSAO_LIMITE_MAX,
+                 latencia_alvo_ms=ADMISSAO_LATENCIA_ALVO_MS):
+        self.limite_min = limite_min
+        self.limite_max = limite_max
+        self.latencia_alvo = latencia_alvo_ms / 1000
+        self.limite = float(limite_max)
+        self.em_andamento = 0
+        self.latencia_media = 0.0
+        self._concluidas = 0
+        self._lock = threading.Lock()
+        self.admitidas = {nome: 0 for nome in NOMES_PRIORIDADE.values()}
+        self.descartadas = {nome: 0 for nome in NOMES_PRIORIDADE.values()}
+
+    def try_acquire(self, prioridade):
+        """Reserva uma vaga para a requisição. Retorna False se ela deve ser descartada"""
+        nome = NOMES_PRIORIDADE[prioridade]
+        with self._lock:
+            if self.em_andamento >= max(1, int(self.limite * FRACAO_LIMITE[prioridade])):
+                self.descartadas[nome] += 1
+                return False
+            self.em_andamento += 1
+            self.admitidas[nome] += 1
+            return True
+
+    def release(self, latencia):
+        """Libera a vaga e registra a latência (segundos) da requisição"""
+        with self._lock:
+            self.em_andamento -= 1
+            # Média móvel exponencial da latência
+            if self.latencia_media:
+                self.latencia_media = 0.8 * self.latencia_media + 0.2 * latencia
+            else:
+                self.latencia_media = latencia
+            self._concluidas += 1
+            if self._concluidas % self.AJUSTE_A_CADA == 0:
+                if self.latencia_media > self.latencia_alvo:
+                    self.limite = max(self.limite_min, self.limite * 0.9)
+                else:
+                    self.limite = min(self.limite_max, self.limite + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limite': round(self.limite, 1),
+                'em_andamento': self.em_andamento,
+                'latencia_media_ms': round(self.latencia_media * 1000, 1),
+                'latencia_alvo_ms': round(self.latencia_alvo * 1000, 1),
+                'admitidas': dict(self.admitidas),
+                'descartadas': dict(self.descartadas)
+            }
+
+admission = AdmissionController()
@@ -0,0 +1,207 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tempo máximo que flush() (encerramento) espera a fila esvaziar
+FLUSH_ESPERA = 10
+
+def _is_locked(erro):
+    """Erro transitório do SQLite: banco travado ou ocupado por outra conexão"""
+    return isinstance(erro, sqlite3.OperationalError) and any(
+        motivo in str(erro) for motivo in ('locked', 'busy')
+    )
+
+class BatchWriter:
+    """
+    Escritor em segundo plano para o SQLite: as operações entram em uma fila
+    limitada e são gravadas a cada `intervalo_ms` ou a cada `lote` itens, em
+    uma única transação. Cada tipo de operação tem um handler registrado que
+    recebe o cursor e a lista de parâmetros do lote. Com o banco travado por
+    outro processo o lote é tentado de novo e, se ainda falhar, volta ao início
+    da fila.
+    """
+
+    def __init__(self, nome, connect, lote=200, intervalo_ms=200, max_fila=10000, tentativas=3, espera=0.1):
+        self.nome = nome
+        self.connect = connect
+        self.lote = lote
+        self.intervalo = intervalo_ms / 1000
+        self.tentativas = tentativas
+        self.espera = espera
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._handlers = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.contadores = {
+            'gravados': 0,
+            'lotes': 0,
+            'sincronos': 0,
+            'erros': 0,
+            'reenfileirados': 0,
+            'perdidos': 0,
+            'ultimo_lote_ms': 0.0
+        }
+
+    def register(self, operacao, handler, after_commit=None):
+        """
+        Registra uma operação. handler(cursor, lista_de_params) grava o lote;
+        after_commit(lista_de_params, retorno_do_handler) roda depois do commit
+        (ex.: invalidar caches, efeitos fora do banco que não podem se repetir).
+        """
+        self._handlers[operacao] = (handler, after_commit)
+
+    def submit(self, operacao, params):
+        """Enfileira uma operação. Com a fila cheia, grava de forma síncrona"""
+        self._ensure_started()
+        try:
+            self._fila.put_nowait((operacao, params))
+        except queue.Full:
+            self.contadores['sincronos'] += 1
+            self._write([(operacao, params)])
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=f"batch-writer-{self.nome}", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _drain(self, limite):
+        itens = []
+        while len(itens) < limite:
+            try:
+                itens.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return itens
+
+    def _write(self, itens):
+        """Grava os itens em uma transação, agrupando por operação na ordem de chegada"""
+        grupos = []
+        for operacao, params in itens:
+            if grupos and grupos[-1][0] == operacao:
+                grupos[-1][1].append(params)
+            else:
+                grupos.append((operacao, [params]))
+
+        inicio = time.perf_counter()
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            retornos = [self._handlers[operacao][0](cursor, lista) for operacao, lista in grupos]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        self.contadores['gravados'] += len(itens)
+        self.contadores['lotes'] += 1
+        self.contadores['ultimo_lote_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+
+        for (operacao, lista), retorno in zip(grupos, retornos):
+            after_commit = self._handlers[operacao][1]
+            if after_commit:
+                try:
+                    after_commit(lista, retorno)
+                except Exception as e:
+                    logger.error(f"Erro após gravar {operacao}: {e}")
+
+    def _write_batch(self, itens):
+        """Grava um lote. Retorna False se ele voltou para a fila ou foi perdido"""
+        try:
+            for tentativa in range(self.tentativas):
+                try:
+                    self._write(itens)
+                    return True
+                except Exception as e:
+                    if _is_locked(e):
+                        # Outro worker está gravando no mesmo arquivo
+                        erro = e
+                        time.sleep(self.espera * 2 ** tentativa)
+                        continue
+                    # Erros que não se resolvem com nova tentativa (esquema, dados inválidos)
+                    self.contadores['erros'] += 1
+                    self.contadores['perdidos'] += len(itens)
+                    logger.error(f"Erro ao gravar lote de {self.nome} ({len(itens)} itens perdidos): {e}")
+                    return False
+            self.contadores['erros'] += 1
+            self._requeue(itens, erro)
+            return False
+        finally:
+            for _ in itens:
+                self._fila.task_done()
+
+    def _requeue(self, itens, erro):
+        """
+        Devolve o lote ao início da fila, na ordem original (leituras de clima
+        são comparadas em sequência). Pode passar do limite da fila em até um lote
+        """
+        with self._fila.mutex:
+            self._fila.queue.extendleft(reversed(itens))
+            self._fila.unfinished_tasks += len(itens)
+            self._fila.not_empty.notify()
+        self.contadores['reenfileirados'] += len(itens)
+        logger.error(
+            f"Erro ao gravar lote de {self.nome} após {self.tentativas} tentativas "
+            f"({len(itens)} itens de volta ao início da fila): {erro}"
+        )
+
+    def flush(self, espera=FLUSH_ESPERA):
+        """
+        Espera a fila ser gravada (direto, se a thread não estiver ativa) por
+        no máximo `espera` segundos: banco travado não segura o encerramento.
+        Retorna quantos itens ficaram sem gravar
+        """
+        limite = time.monotonic() + espera
+        if not (self._thread and self._thread.is_alive()):
+            with self._flush_lock:
+                while time.monotonic() < limite:
+                    itens = self._drain(self.lote)
+                    if not itens:
+                        break
+                    self._write_batch(itens)
+        # Com a thread ativa só ela consome a fila (mantém a ordem dos itens
+        # devolvidos); aqui basta esperar, com prazo, que ela termine
+        with self._fila.all_tasks_done:
+            while self._fila.unfinished_tasks:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._fila.all_tasks_done.wait(restante)
+            # Na fila ou no lote que a thread ainda tenta gravar
+            restantes = self._fila.unfinished_tasks
+        if restantes:
+            logger.error(f"Fila de {self.nome}: {restantes} itens não gravados após {espera}s")
+        return restantes
+
+    def _run(self):
+        while True:
+            # Espera o primeiro item e então até `intervalo` ou um lote completo
+            try:
+                primeiro = self._fila.get(timeout=1)
+            except queue.Empty:
+                continue
+            limite = time.monotonic() + self.intervalo
+            while self._fila.qsize() < self.lote - 1 and time.monotonic() < limite:
+                time.sleep(min(0.005, self.intervalo))
+
+            with self._flush_lock:
+                self._write_batch([primeiro] + self._drain(self.lote - 1))
+
+    def depth(self):
+        return self._fila.qsize()
+
+    def stats(self):
+        return dict(self.contadores, fila=self.depth(), max_fila=self._fila.maxsize)
@@ -0,0 +1,185 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from services.clients import get_redis
+from services.event_bus import subscribe, TRANSICAO_CONCLUIDA
+from services.state_backend import uses_redis
+
+logger = logging.getLogger(__name__)
+
+# Canal usado para avisar os outros workers que uma chave mudou
+INVALIDATION_CHANNEL = 'cache_invalidacao'
+
+_MISSING = object()
+_caches = {}
+_listener_thread = None
+
+class TwoTierCache:
+    """
+    Cache de leitura em dois níveis: LRU com TTL no processo (L1) na frente
+    do Redis (L2). Escritas chamam invalidate(), que remove a chave nos dois
+    níveis e publica a invalidação para os demais workers.
+    """
+
+    def __init__(self, nome, maxsize=128, ttl=60, l2_ttl=300, use_l2=True):
+        self.nome = nome
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.l2_ttl = l2_ttl
+        # Valores que já vêm do Redis não precisam do L2; sem Redis
+        # (STATE_BACKEND=memoria) só há o L1
+        self.use_l2 = use_l2 and uses_redis()
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.contadores = {
+            'hits_l1': 0,
+            'hits_l2': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+        _caches[nome] = self
+
+    def l2_key(self, chave):
+        return f"cache:{self.nome}:{chave}"
+
+    def _get_local(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return _MISSING
+            expira_em, valor = item
+            if expira_em <= time.monotonic():
+                del self._itens[chave]
+                self.contadores['expirations'] += 1
+                return _MISSING
+            self._itens.move_to_end(chave)
+            self.contadores['hits_l1'] += 1
+            return valor
+
+    def _set_local(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maxsize:
+                self._itens.popitem(last=False)
+                self.contadores['evictions'] += 1
+
+    def peek(self, chave):
+        """Valor no L1 sem carregar nada: (True, valor) ou (False, None)"""
+        valor = self._get_local(chave)
+        if valor is _MISSING:
+            return False, None
+        return True, valor
+
+    def fill(self, chave, valor, do_l2=False):
+        """Guarda no L1 um valor carregado por fora (ex.: em lote pelo RequestContext)"""
+        with self._lock:
+            self.contadores['hits_l2' if do_l2 else 'misses'] += 1
+        self._set_local(chave, valor)
+
+    def drop_local(self, chave=None):
+        """Remove uma chave (ou todas) apenas do L1 deste processo"""
+        with self._lock:
+            if chave is None:
+                self._itens.clear()
+            else:
+                self._itens.pop(chave, None)
+
+    def get_or_load(self, chave, loader):
+        """Retorna o valor em cache ou carrega com loader() e guarda nos dois níveis"""
+        valor = self._get_local(chave)
+        if valor is not _MISSING:
+            return valor
+
+        if self.use_l2:
+            try:
+                bruto = get_redis().get(self.l2_key(chave))
+                if bruto is not None:
+                    valor = json.loads(bruto)
+                    with self._lock:
+                        self.contadores['hits_l2'] += 1
+                    self._set_local(chave, valor)
+                    return valor
+            except Exception as e:
+                logger.error(f"Erro ao ler cache {self.nome} no Redis: {e}")
+
+        with self._lock:
+            self.contadores['misses'] += 1
+        valor = loader()
+        self._set_local(chave, valor)
+
+        if self.use_l2:
+            try:
+                get_redis().set(self.l2_key(chave), json.dumps(valor), ex=self.l2_ttl)
+            except Exception as e:
+                logger.error(f"Erro ao gravar cache {self.nome} no Redis: {e}")
+        return valor
+
+    def invalidate(self, chave):
+        """Remove a chave em todos os níveis e avisa os outros workers"""
+        self.drop_local(chave)
+        with self._lock:
+            self.contadores['invalidations'] += 1
+        # Com um único processo não há outros workers para avisar
+        if not uses_redis():
+            return
+        try:
+            redis = get_redis()
+            if self.use_l2:
+                redis.delete(self.l2_key(chave))
+            redis.publish(INVALIDATION_CHANNEL, f"{self.nome}:{chave}")
+        except Exception as e:
+            logger.error(f"Erro ao invalidar cache {self.nome}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.contadores, tamanho=len(self._itens))
+
+def get_cache_stats():
+    """Retorna os contadores de todos os caches"""
+    return {nome: cache.stats() for nome, cache in _caches.items()}
+
+def _listen_invalidations():
+    """Recebe invalidações publicadas por outros workers"""
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Mensagens podem ter sido perdidas enquanto estava desconectado
+            for cache in _caches.values():
+                cache.drop_local()
+            for mensagem in pubsub.listen():
+                nome, _, chave = mensagem['data'].partition(':')
+                cache = _caches.get(nome)
+                if cache:
+                    cache.drop_local(chave)
+        except Exception as e:
+            logger.error(f"Erro na escuta de invalidações de cache: {e}")
+            time.sleep(5)
+
+def start_invalidation_listener():
+    """Inicia a escuta de invalidações em segundo plano"""
+    global _listener_thread
+    if not uses_redis():
+        return None
+    if _listener_thread and _listener_thread.is_alive():
+        return _listener_thread
+
+    _listener_thread = threading.Thread(target=_listen_invalidations, name='cache-invalidation', daemon=True)
+    _listener_thread.start()
+    return _listener_thread
+
+# Caches dos leitores de status, clima e estatísticas
+status_cache = TwoTierCache('status', maxsize=16, ttl=60, use_l2=False)
+weather_cache = TwoTierCache('clima', maxsize=4, ttl=120, l2_ttl=600)
+stats_cache = TwoTierCache('estatisticas', maxsize=8, ttl=60, l2_ttl=300)
+
+def _status_changed(evento):
+    """Transição concluída: todos os workers descartam o status do L1"""
+    status_cache.drop_local()
+
+subscribe(TRANSICAO_CONCLUIDA, _status_changed)
@@ -0,0 +1,374 @@
+import json
+import logging
+import threading
+from config import (
+    GROUP_ID, SERVER_URL, INSTANCE, APIKEY,
+    CATCHUP_JANELA, CATCHUP_PAGINA, CATCHUP_MAX_PAGINAS,
+    RELATOS_JANELA, RELATOS_QUORUM
+)
+from database import record_closure_time
+from services.admission import PALAVRAS_ESTADO
+from services.clients import get_http_session
+from services.evolution_service import (
+    acquire_lock, release_lock, get_active_transition, notify_group, evolution_breaker,
+    STATUS_LOCK_KEY, TRANSICAO_KEY, ESTADO_ABERTO, ESTADO_FECHADO, TEMPO_MINIMO_TRANSICAO
+)
+from services.faq import is_question
+from services.shared_state import try_acquire_interval
+from services.state_backend import get_backend, Script
+from services.state_repository import get_status, set_status
+from services.timeutil import now_epoch
+
+logger = logging.getLogger(__name__)
+
+# Ids de comandos e relatos já aplicados (webhook ou recuperação) em hashes
+# por intervalo do horário da mensagem, como em services.user_state:
+#
+#   mensagens:{bucket}  ->  {id: '1'}
+#
+# bucket = horário // MENSAGEM_BUCKET_SEGUNDOS; cada hash expira inteiro
+# quando a recuperação não alcança mais o seu intervalo
+MENSAGEM_KEY = 'mensagens:{bucket}'
+MENSAGEM_BUCKET_SEGUNDOS = 600
+
+# Só um worker faz a recuperação quando vários sobem juntos
+CATCHUP_KEY = 'catchup:execucao'
+
+COMANDOS_ESTADO = {'!alterna', '!passou', '!cancelar'}
+
+# Mesma validade da transição criada por start_transition
+TRANSICAO_TTL = 3600
+
+_catchup_thread = None
+
+class EvolutionHistory:
+    """Histórico do grupo pela Evolution API (POST /chat/findMessages), mais recentes primeiro"""
+
+    def fetch_page(self, pagina, limite):
+        if not evolution_breaker.allow():
+            raise RuntimeError("Circuito da Evolution API aberto")
+        try:
+            response = get_http_session().post(
+                f"{SERVER_URL}/chat/findMessages/{INSTANCE}",
+                headers={'Content-Type': 'application/json', 'apikey': APIKEY},
+                json={'where': {'key': {'remoteJid': GROUP_ID}}, 'page': pagina, 'offset': limite},
+                timeout=10
+            )
+        except Exception:
+            evolution_breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            evolution_breaker.record_failure()
+        else:
+            evolution_breaker.record_success()
+        response.raise_for_status()
+        dados = response.json()
+        # v2: {'messages': {'records': [...]}}; v1: lista de registros
+        if isinstance(dados, dict):
+            return dados.get('messages', {}).get('records', [])
+        return dados
+
+class FakeHistory:
+    """Histórico em memória com a mesma interface (testes e simulações)"""
+
+    def __init__(self, registros):
+        self.registros = sorted(registros, key=lambda r: int(r.get('messageTimestamp', 0)), reverse=True)
+        self.paginas_lidas = 0
+
+    def fetch_page(self, pagina, limite):
+        self.paginas_lidas += 1
+        return self.registros[(pagina - 1) * limite:pagina * limite]
+
+def parse_record(registro):
+    """Converte um registro da Evolution API em {'id', 'timestamp', 'remetente', 'texto'} (ou None)"""
+    chave = registro.get('key', {})
+    mensagem = registro.get('message') or {}
+    texto = mensagem.get('conversation') or mensagem.get('extendedTextMessage', {}).get('text')
+    # Mensagens do próprio bot não contam
+    if not texto or not chave.get('id') or chave.get('fromMe'):
+        return None
+    return {
+        'id': chave['id'],
+        'timestamp': int(registro.get('messageTimestamp', 0)),
+        'remetente': registro.get('pushName') or chave.get('participant') or 'Usuário',
+        'texto': texto.strip().lower()
+    }
+
+def fetch_missed(cliente, desde):
+    """Mensagens posteriores a `desde`, lidas em páginas e em ordem cronológica"""
+    mensagens = {}
+    for pagina in range(1, CATCHUP_MAX_PAGINAS + 1):
+        registros = cliente.fetch_page(pagina, CATCHUP_PAGINA)
+        if not registros:
+            break
+        for mensagem in filter(None, map(parse_record, registros)):
+            if mensagem['timestamp'] > desde:
+                mensagens[mensagem['id']] = mensagem
+        mais_antiga = min(int(registro.get('messageTimestamp', 0)) for registro in registros)
+        if len(registros) < CATCHUP_PAGINA or mais_antiga <= desde:
+            break
+    return sorted(mensagens.values(), key=lambda m: (m['timestamp'], m['id']))
+
+def _message_key(mensagem_id, timestamp):
+    """(chave do bucket, id, ttl) de uma mensagem pelo horário dela"""
+    agora = now_epoch()
+    bucket = int(timestamp or agora) // MENSAGEM_BUCKET_SEGUNDOS
+    # Vale até a recuperação deixar de alcançar o fim do intervalo
+    ttl = max((bucket + 1) * MENSAGEM_BUCKET_SEGUNDOS + CATCHUP_JANELA - agora, 60)
+    return MENSAGEM_KEY.format(bucket=bucket), mensagem_id, ttl
+
+# Marca vários ids como aplicados em uma operação; ARGV em pares (id, ttl
+# do bucket). Retorna 1 para cada id que ainda não tinha sido visto
+def _claim_python(backend, chaves, args):
+    novos = []
+    for i, chave in enumerate(chaves):
+        mensagem_id, ttl = args[2 * i], int(args[2 * i + 1])
+        ids = backend.lookup(chave, {})
+        novo = mensagem_id not in ids
+        if novo:
+            backend.store(chave, dict(ids, **{mensagem_id: '1'}), ttl)
+        novos.append(int(novo))
+    return novos
+
+_CLAIM_SCRIPT = Script("""
+local novos = {}
+for i = 1, #KEYS do
+    if redis.call('hsetnx', KEYS[i], ARGV[2 * i - 1], '1') == 1 then
+        redis.call('expire', KEYS[i], ARGV[2 * i])
+        novos[i] = 1
+    else
+        novos[i] = 0
+    end
+end
+return novos
+""", _claim_python)
+
+def _release_python(backend, chaves, args):
+    for chave, mensagem_id in zip(chaves, args):
+        ids = backend.lookup(chave)
+        if ids and mensagem_id in ids:
+            backend.store(chave, {k: v for k, v in ids.items() if k != mensagem_id}, manter_ttl=True)
+    return len(chaves)
+
+_RELEASE_SCRIPT = Script("""
+for i = 1, #KEYS do
+    redis.call('hdel', KEYS[i], ARGV[i])
+end
+return #KEYS
+""", _release_python)
+
+def _claim(mensagens):
+    """mensagens: [(id, timestamp)]. Retorna a lista de 0/1 (1 = ainda não aplicada)"""
+    chaves, args = [], []
+    for mensagem_id, timestamp in mensagens:
+        chave, mensagem_id, ttl = _message_key(mensagem_id, timestamp)
+        chaves.append(chave)
+        args.extend([mensagem_id, ttl])
+    return [int(novo) for novo in get_backend().run_script(_CLAIM_SCRIPT, chaves, args)]
+
+def claim_message(message_id, timestamp, texto):
+    """
+    Marca um comando ou relato recebido pelo webhook como aplicado. False se
+    a recuperação (ou um reenvio) já o aplicou. Sem recuperação, ou para
+    mensagens que não mudam o estado, não grava nada
+    """
+    if not CATCHUP_JANELA or not message_id or not is_state_relevant(texto):
+        return True
+    return bool(_claim([(message_id, timestamp)])[0])
+
+def claim_messages(mensagens):
+    """Filtra as mensagens ainda não aplicadas, marcando-as de uma vez"""
+    if not mensagens:
+        return []
+    novos = _claim([(m['id'], m['timestamp']) for m in mensagens])
+    return [mensagem for mensagem, novo in zip(mensagens, novos) if novo]
+
+def release_messages(mensagens):
+    """Desfaz a marcação das mensagens (não aplicadas por erro)"""
+    if not mensagens:
+        return
+    chaves = [_message_key(m['id'], m['timestamp']) for m in mensagens]
+    get_backend().run_script(_RELEASE_SCRIPT, [chave for chave, _, _ in chaves], [mensagem_id for _, mensagem_id, _ in chaves])
+
+def is_state_relevant(texto):
+    """Comandos e relatos que mudam o estado (perguntas e consultas não)"""
+    if texto.startswith('!'):
+        return texto in COMANDOS_ESTADO
+    return not is_question(texto) and any(palavra in texto for palavra in PALAVRAS_ESTADO)
+
+def replay(mensagens, estado):
+    """
+    Aplica as mensagens em ordem sobre o estado, sem I/O nem respostas,
+    usando o horário de cada mensagem. estado: {'status' (de CENTER),
+    'ultima', 'transicao'}. Retorna (estado_final, resumo)
+    """
+    estado = dict(estado)
+    resumo = {'iniciadas': 0, 'concluidas': 0, 'canceladas': 0, 'ignoradas': 0, 'fechamentos': []}
+    relatos = {}
+
+    def iniciar(instante, remetente):
+        local = 'CENTER' if estado['status'] == ESTADO_ABERTO else 'GOIO'
+        estado['transicao'] = {'local': local, 'inicio': instante, 'remetente': remetente}
+        resumo['iniciadas'] += 1
+        relatos.clear()
+
+    for mensagem in mensagens:
+        texto, instante, remetente = mensagem['texto'], mensagem['timestamp'], mensagem['remetente']
+        transicao = estado['transicao']
+
+        if texto == '!alterna':
+            # Sem a confirmação (!sim) que o modo normal pediria, alternâncias
+            # a menos de 30 segundos da anterior são descartadas
+            if transicao or instante - estado['ultima'] < 30:
+                resumo['ignoradas'] += 1
+            else:
+                iniciar(instante, remetente)
+
+        elif texto == '!passou':
+            if not transicao or (instante - transicao['inicio']) / 60 < TEMPO_MINIMO_TRANSICAO:
+                resumo['ignoradas'] += 1
+                continue
+            local = transicao['local']
+            resumo['fechamentos'].append((local, int(instante - transicao['inicio']), instante))
+            resumo['concluidas'] += 1
+            # O lado em transição fecha e o outro passa
+            estado.update(
+                status=ESTADO_FECHADO if local == 'CENTER' else ESTADO_ABERTO,
+                ultima=instante,
+                transicao=None
+            )
+            relatos.clear()
+
+        elif texto == '!cancelar':
+            if not transicao:
+                resumo['ignoradas'] += 1
+                continue
+            estado['transicao'] = None
+            resumo['canceladas'] += 1
+
+        elif not transicao:
+            # Relatos em texto livre: quórum de remetentes diferentes na janela
+            # (peso padrão para todos, com o mesmo decaimento do report_aggregator)
+            relatos[remetente] = instante
+            for nome, quando in list(relatos.items()):
+                if quando < instante - RELATOS_JANELA or quando < estado['ultima']:
+                    del relatos[nome]
+            total = sum(1 - 0.5 * (instante - quando) / RELATOS_JANELA for quando in relatos.values())
+            if total >= RELATOS_QUORUM:
+                iniciar(instante, remetente)
+        else:
+            resumo['ignoradas'] += 1
+
+    return estado, resumo
+
+def apply_replay(inicial, final, resumo):
+    """Grava o resultado da recuperação: fechamentos, o status final e a transição"""
+    for local, tempo, instante in resumo['fechamentos']:
+        record_closure_time(local, tempo, timestamp=instante)
+
+    if resumo['concluidas']:
+        outro = ESTADO_FECHADO if final['status'] == ESTADO_ABERTO else ESTADO_ABERTO
+        set_status({'CENTER': final['status'], 'GOIO': outro}, instante=final['ultima'])
+
+    if final['transicao'] == inicial['transicao']:
+        return
+    backend = get_backend()
+    if inicial['transicao']:
+        backend.delete(TRANSICAO_KEY.format(local=inicial['transicao']['local']))
+    if final['transicao']:
+        restante = TRANSICAO_TTL - (now_epoch() - final['transicao']['inicio'])
+        if restante > 0:
+            transicao = final['transicao']
+            backend.set(
+                TRANSICAO_KEY.format(local=transicao['local']),
+                json.dumps({'inicio': transicao['inicio'], 'remetente': transicao['remetente'], 'status': 'iniciada'}),
+                ttl=int(restante)
+            )
+
+def render_summary(quantidade, final, resumo):
+    """Mensagem única enviada ao grupo no fim da recuperação"""
+    passando, parado = ('QC', 'Goioerê') if final['status'] == ESTADO_ABERTO else ('Goioerê', 'QC')
+    mensagem = (
+        " 🔁 *Mensagens recuperadas*\n\n"
+        f"{quantidade} mensagens chegaram enquanto o bot estava fora do ar.\n"
+        f"• Transições iniciadas: {resumo['iniciadas']}\n"
+        f"• Transições concluídas: {resumo['concluidas']}\n"
+        f"• Transições canceladas: {resumo['canceladas']}\n\n"
+        f"🟢 {passando} PASSANDO\n"
+        f"❌ {parado} PARADO"
+    )
+    if final['transicao']:
+        mensagem += (
+            f"\n\n🔄 Transição em andamento (iniciada por {final['transicao']['remetente']}).\n"
+            "➡️ *!passou* quando todos passarem"
+        )
+    return mensagem
+
+def run_catchup(cliente=None, send=notify_group):
+    """
+    Busca no histórico do grupo as mensagens perdidas desde a última mudança
+    de status (no máximo CATCHUP_JANELA segundos), descarta as já
+    processadas e aplica as que mudam o estado em lote, com um único resumo
+    no fim. Retorna o resumo, ou None se nada foi aplicado
+    """
+    cliente = cliente or EvolutionHistory()
+    _, ultima = get_status('CENTER', usar_cache=False)
+    desde = max(now_epoch() - CATCHUP_JANELA, ultima or 0)
+
+    # A leitura do histórico (HTTP) fica fora do lock de status
+    perdidas = fetch_missed(cliente, desde)
+    if not any(is_state_relevant(mensagem['texto']) for mensagem in perdidas):
+        logger.info(f"Recuperação: {len(perdidas)} mensagens, nenhuma muda o estado")
+        return None
+
+    token = acquire_lock(STATUS_LOCK_KEY, timeout=30, espera=10)
+    if not token:
+        # Nada foi marcado: o webhook ainda processa um reenvio dessas mensagens
+        logger.error("Recuperação: lock de status ocupado, mensagens não aplicadas")
+        return None
+    try:
+        # Marcar só com o lock: as mensagens marcadas são sempre aplicadas
+        relevantes = claim_messages([m for m in perdidas if is_state_relevant(m['texto'])])
+        logger.info(f"Recuperação: {len(perdidas)} mensagens, {len(relevantes)} ainda não aplicadas mudam o estado")
+        if not relevantes:
+            return None
+        try:
+            status, ultima = get_status('CENTER', usar_cache=False)
+            local, transicao = get_active_transition()
+            inicial = {'status': status, 'ultima': ultima, 'transicao': None}
+            if transicao:
+                # start_transition grava o início como float
+                inicial['transicao'] = {
+                    'local': local,
+                    'inicio': int(transicao['inicio']),
+                    'remetente': transicao.get('remetente')
+                }
+            final, resumo = replay(relevantes, inicial)
+            if not (resumo['iniciadas'] or resumo['concluidas'] or resumo['canceladas']):
+                logger.info(f"Recuperação: {resumo['ignoradas']} comandos ignorados, estado mantido")
+                return None
+            apply_replay(inicial, final, resumo)
+        except Exception:
+            release_messages(relevantes)
+            raise
+    finally:
+        release_lock(STATUS_LOCK_KEY, token)
+
+    send(render_summary(len(perdidas), final, resumo))
+    return resumo
+
+def _catchup_worker(send):
+    try:
+        run_catchup(send=send)
+    except Exception as e:
+        logger.error(f"Erro na recuperação de mensagens: {e}")
+
+def start_catchup(send=notify_group):
+    """Inicia a recuperação das mensagens perdidas em segundo plano (uma vez por inicialização)"""
+    global _catchup_thread
+    if not CATCHUP_JANELA or not try_acquire_interval(CATCHUP_KEY, 60):
+        return None
+
+    _catchup_thread = threading.Thread(target=_catchup_worker, args=(send,), name='catchup', daemon=True)
+    _catchup_thread.start()
+    return _catchup_thread
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from collections import deque
+from config import (
+    CIRCUIT_JANELA, CIRCUIT_TAXA_FALHAS,
+    CIRCUIT_MINIMO_CHAMADAS, CIRCUIT_TEMPO_ABERTO
+)
+
+logger = logging.getLogger(__name__)
+
+# Estados do circuito
+FECHADO = 'closed'
+ABERTO = 'open'
+MEIO_ABERTO = 'half_open'
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+class CircuitBreaker:
+    """
+    Circuit breaker por taxa de falhas em uma janela de tempo. Aberto, recusa
+    chamadas na hora; depois de tempo_aberto deixa passar uma chamada de teste
+    (meio aberto) que decide se volta a fechar ou abre de novo. Se a chamada de
+    teste não registrar resultado em tempo_aberto, outra é liberada.
+    """
+
+    def __init__(self, nome, janela=CIRCUIT_JANELA, taxa_falhas=CIRCUIT_TAXA_FALHAS,
+                 minimo_chamadas=CIRCUIT_MINIMO_CHAMADAS, tempo_aberto=CIRCUIT_TEMPO_ABERTO):
+        self.nome = nome
+        self.janela = janela
+        self.taxa_falhas = taxa_falhas
+        self.minimo_chamadas = minimo_chamadas
+        self.tempo_aberto = tempo_aberto
+        self.estado = FECHADO
+        self._resultados = deque()  # (timestamp, sucesso)
+        self._aberto_em = 0
+        self._teste_em_andamento = False
+        self._teste_iniciado_em = 0
+        self._lock = threading.Lock()
+        self.contadores = {
+            'sucessos': 0,
+            'falhas': 0,
+            'recusadas': 0,
+            'aberturas': 0
+        }
+
+    def _limpar_janela(self, agora):
+        while self._resultados and self._resultados[0][0] < agora - self.janela:
+            self._resultados.popleft()
+
+    def _abrir(self, agora):
+        self.estado = ABERTO
+        self._aberto_em = agora
+        self._teste_em_andamento = False
+        self.contadores['aberturas'] += 1
+        logger.warning(f"Circuito {self.nome} aberto por {self.tempo_aberto}s")
+
+    def allow(self):
+        """Indica se a chamada pode ser feita agora"""
+        with self._lock:
+            if self.estado == ABERTO:
+                if time.monotonic() - self._aberto_em < self.tempo_aberto:
+                    self.contadores['recusadas'] += 1
+                    return False
+                self.estado = MEIO_ABERTO
+                self._teste_em_andamento = False
+
+            if self.estado == MEIO_ABERTO:
+                # Apenas uma chamada de teste por vez; uma que saiu sem registrar
+                # sucesso ou falha não prende o circuito depois de tempo_aberto
+                agora = time.monotonic()
+                if self._teste_em_andamento and agora - self._teste_iniciado_em < self.tempo_aberto:
+                    self.contadores['recusadas'] += 1
+                    return False
+                self._teste_em_andamento = True
+                self._teste_iniciado_em = agora
+            return True
+
+    def record_success(self):
+        with self._lock:
+            agora = time.monotonic()
+            self.contadores['sucessos'] += 1
+            if self.estado == MEIO_ABERTO:
+                logger.info(f"Circuito {self.nome} fechado novamente")
+                self.estado = FECHADO
+                self._teste_em_andamento = False
+                self._resultados.clear()
+            self._resultados.append((agora, True))
+            self._limpar_janela(agora)
+
+    def record_failure(self):
+        with self._lock:
+            agora = time.monotonic()
+            self.contadores['falhas'] += 1
+            if self.estado == MEIO_ABERTO:
+                self._abrir(agora)
+                return
+            self._resultados.append((agora, False))
+            self._limpar_janela(agora)
+            total = len(self._resultados)
+            falhas = sum(1 for _, sucesso in self._resultados if not sucesso)
+            if self.estado == FECHADO and total >= self.minimo_chamadas and falhas / total >= self.taxa_falhas:
+                self._abrir(agora)
+
+    def stats(self):
+        with self._lock:
+            self._limpar_janela(time.monotonic())
+            total = len(self._resultados)
+            falhas = sum(1 for _, sucesso in self._resultados if not sucesso)
+            return dict(
+                self.contadores,
+                estado=self.estado,
+                chamadas_na_janela=total,
+                taxa_falhas=round(falhas / total, 2) if total else 0.0
+            )
+
+def get_breaker(nome):
+    """Retorna o circuit breaker de uma integração, criando-o no primeiro uso"""
+    with _registry_lock:
+        if nome not in _breakers:
+            _breakers[nome] = CircuitBreaker(nome)
+        return _breakers[nome]
+
+def get_breaker_stats():
+    """Retorna o estado e os contadores de todos os circuitos"""
+    return {nome: breaker.stats() for nome, breaker in _breakers.items()}
@@ -0,0 +1,78 @@
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Clientes criados sob demanda: importar este módulo não abre conexões
+# nem carrega as bibliotecas de rede
+_lock = threading.Lock()
+_redis_client = None
+_http_session = None
+_openai = None
+
+def get_redis():
+    """Retorna o cliente Redis, criando-o no primeiro uso"""
+    global _redis_client
+    if _redis_client is None:
+        with _lock:
+            if _redis_client is None:
+                import redis
+                _redis_client = redis.Redis(
+                    host=os.getenv('REDIS_HOST', 'sigabot_redis'),
+                    port=int(os.getenv('REDIS_PORT', '6379')),
+                    db=int(os.getenv('REDIS_DB', '0')),
+                    password=os.getenv('REDIS_PASSWORD'),
+                    decode_responses=True
+                )
+    return _redis_client
+
+def get_http_session():
+    """Retorna a sessão HTTP compartilhada (reaproveita conexões)"""
+    global _http_session
+    if _http_session is None:
+        with _lock:
+            if _http_session is None:
+                import requests
+                _http_session = requests.Session()
+    return _http_session
+
+def get_openai():
+    """Retorna o módulo openai configurado com a chave da API"""
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                import openai
+                openai.api_key = os.getenv('OPENAI_API_KEY')
+                _openai = openai
+    return _openai
+
+def reset_clients():
+    """Descarta os clientes criados (usado após fork de processos)"""
+    global _redis_client, _http_session, _openai
+    with _lock:
+        _redis_client = None
+        _http_session = None
+        _openai = None
+
+def warm_up():
+    """Abre as conexões antecipadamente para o primeiro request não pagar o custo"""
+    from services.state_backend import uses_redis
+    try:
+        if uses_redis():
+            get_redis().ping()
+    except Exception as e:
+        # Sem sys.exit: o erro de conexão aparece de novo no primeiro uso
+        logger.error(f"Erro ao conectar ao Redis: {e}")
+        logger.error("Verifique se o serviço 'sigabot_redis' está acessível e se a senha está correta")
+
+    try:
+        from database import connect_db
+        conn = connect_db()
+        conn.execute("SELECT 1")
+        conn.close()
+    except Exception as e:
+        logger.error(f"Erro ao abrir o banco SQLite: {e}")
+
+    get_http_session()
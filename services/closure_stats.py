@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from config import ALERTA_JANELA, ALERTA_MINIMO_AMOSTRAS, ALERTA_INTERVALO
+from services.shared_state import try_acquire_interval
+from services.state_backend import get_backend, Script
+
+logger = logging.getLogger(__name__)
+
+# Média e variância dos fechamentos de cada lado, atualizadas a cada novo
+# fechamento sem reler o histórico:
+#
+#   fechamentos:estatistica:{lado}  ->  {n, media, variancia}
+#
+# Com peso 1/n é o algoritmo de Welford (média e variância exatas). Depois de
+# ALERTA_JANELA fechamentos o peso fica fixo em 1/ALERTA_JANELA, o que vira
+# uma média móvel exponencial e acompanha mudanças no ritmo da obra.
+ESTATISTICA_KEY = 'fechamentos:estatistica:{lado}'
+
+# Agenda compartilhada: apenas um worker verifica as transições por intervalo
+MONITOR_SCHEDULE_KEY = 'agenda_alerta_fechamento'
+
+_monitor_thread = None
+
+# Um passo da atualização com o tempo `tempo` (peso 1/n, n limitado à janela)
+_PASSO_LUA = """
+local n = math.min((tonumber(redis.call('hget', KEYS[1], 'n')) or 0) + 1, tonumber(ARGV[1]))
+local media = tonumber(redis.call('hget', KEYS[1], 'media')) or 0
+local variancia = tonumber(redis.call('hget', KEYS[1], 'variancia')) or 0
+local delta = tempo - media
+media = media + delta / n
+variancia = (1 - 1 / n) * (variancia + delta * delta / n)
+redis.call('hset', KEYS[1], 'n', n, 'media', string.format('%.17g', media),
+    'variancia', string.format('%.17g', variancia))
+"""
+
+def _step(backend, chave, tempo, janela):
+    atual = backend.lookup(chave, {})
+    n = min(int(atual.get('n', 0)) + 1, janela)
+    media = float(atual.get('media', 0))
+    variancia = float(atual.get('variancia', 0))
+    delta = tempo - media
+    media += delta / n
+    variancia = (1 - 1 / n) * (variancia + delta * delta / n)
+    backend.store(chave, {'n': str(n), 'media': repr(media), 'variancia': repr(variancia)})
+    return n
+
+# ARGV[1] = janela, ARGV[2] = tempo do fechamento em segundos
+def _update_python(backend, chaves, args):
+    return _step(backend, chaves[0], float(args[1]), int(args[0]))
+
+_UPDATE_SCRIPT = Script(f"""
+local tempo = tonumber(ARGV[2])
+{_PASSO_LUA}
+return n
+""", _update_python)
+
+# Estatística inicial a partir do histórico (ARGV[2..]: tempos do mais antigo
+# ao mais recente); não sobrescreve a de outro worker que chegou antes
+def _seed_python(backend, chaves, args):
+    if backend.lookup(chaves[0]) is not None:
+        return 0
+    for tempo in args[1:]:
+        _step(backend, chaves[0], float(tempo), int(args[0]))
+    return 1
+
+_SEED_SCRIPT = Script(f"""
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+for i = 2, #ARGV do
+    local tempo = tonumber(ARGV[i])
+    {_PASSO_LUA}
+end
+return 1
+""", _seed_python)
+
+def record(lado, tempo):
+    """Soma um fechamento (segundos) à estatística do lado, em O(1)"""
+    try:
+        get_backend().run_script(_UPDATE_SCRIPT, [ESTATISTICA_KEY.format(lado=lado)], [ALERTA_JANELA, tempo])
+    except Exception as e:
+        logger.error(f"Erro ao atualizar estatística de fechamento: {e}")
+
+def seed(lado, tempos):
+    """Monta a estatística do lado a partir do histórico, se ainda não existe"""
+    if not tempos:
+        return False
+    try:
+        return bool(get_backend().run_script(_SEED_SCRIPT, [ESTATISTICA_KEY.format(lado=lado)], [ALERTA_JANELA, *tempos]))
+    except Exception as e:
+        logger.error(f"Erro ao montar estatística de fechamento: {e}")
+        return False
+
+def get_closure_stats(lado):
+    """{'n', 'media', 'desvio'} dos fechamentos do lado (segundos), ou None"""
+    try:
+        campos = get_backend().hgetall(ESTATISTICA_KEY.format(lado=lado))
+    except Exception as e:
+        logger.error(f"Erro ao ler estatística de fechamento: {e}")
+        return None
+    if not campos:
+        return None
+    return {
+        'n': int(campos['n']),
+        'media': float(campos['media']),
+        'desvio': max(float(campos['variancia']), 0.0) ** 0.5
+    }
+
+def is_above_normal(estatistica, decorrido, limite):
+    """Indica se `decorrido` passa de `limite` vezes a média (com amostras suficientes)"""
+    return (
+        estatistica is not None
+        and estatistica['n'] >= ALERTA_MINIMO_AMOSTRAS
+        and decorrido > limite * estatistica['media']
+    )
+
+def _monitor_loop(verificar):
+    """Executa a verificação das transições periodicamente"""
+    while True:
+        try:
+            if try_acquire_interval(MONITOR_SCHEDULE_KEY, ALERTA_INTERVALO - 1):
+                verificar()
+        except Exception as e:
+            logger.error(f"Erro ao verificar tempo de fechamento: {e}")
+        time.sleep(ALERTA_INTERVALO)
+
+def start_monitor(verificar):
+    """Inicia a verificação periódica das transições em andamento"""
+    global _monitor_thread
+    if _monitor_thread and _monitor_thread.is_alive():
+        return _monitor_thread
+
+    _monitor_thread = threading.Thread(target=_monitor_loop, args=(verificar,), name='alerta-fechamento', daemon=True)
+    _monitor_thread.start()
+    logger.info(f"Alerta de fechamento acima do normal iniciado (intervalo de {ALERTA_INTERVALO}s)")
+    return _monitor_thread
@@ -0,0 +1,258 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from services.clients import get_redis
+from services.state_backend import uses_redis
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento
+TRANSICAO_INICIADA = 'transicao_iniciada'
+TRANSICAO_CONCLUIDA = 'transicao_concluida'
+TRANSICAO_CANCELADA = 'transicao_cancelada'
+CLIMA_ALTERADO = 'clima_alterado'
+FECHAMENTO_ACIMA_DO_NORMAL = 'fechamento_acima_do_normal'
+
+# Stream Redis com os eventos e grupo de consumo das notificações
+EVENT_STREAM = 'eventos'
+EVENT_STREAM_MAXLEN = 10000
+NOTIFIER_GROUP = 'notificador'
+
+# Uma notificação que não é entregue é tentada de novo até estes limites
+# (ex.: Evolution API fora do ar ou recusando a mensagem) e depois descartada
+ENTREGA_MAX_TENTATIVAS = 10
+ENTREGA_VALIDADE = 900  # segundos desde a publicação
+
+# Eleição do worker que entrega as notificações ao grupo
+LEADER_KEY = 'eventos:lider'
+LEADER_TTL = 15  # segundos
+
+# Renova a liderança apenas se a chave ainda pertence a este worker
+_RENEW_LEADER_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_handlers = {}
+_renderers = {}
+_tentativas = {}  # event_id -> entregas que falharam (no líder)
+_consumer_thread = None
+_notifier_thread = None
+
+# Sem Redis (STATE_BACKEND=memoria) os eventos passam por uma fila do
+# próprio processo, entregue aos handlers e ao grupo por uma única thread
+_fila_local = queue.Queue(maxsize=EVENT_STREAM_MAXLEN)
+_sequencia_local = itertools.count(1)
+_local_send = None
+_local_thread = None
+_reenvios_locais = []  # [evento, mensagem, tentativas, proxima_tentativa], em ordem
+
+def publish(tipo, **dados):
+    """Publica um evento no stream. Retorna o id do evento ou None em caso de erro"""
+    campos = {'tipo': tipo, 'dados': json.dumps(dados), 'ts': str(time.time())}
+    try:
+        if not uses_redis():
+            event_id = f"{int(time.time() * 1000)}-{next(_sequencia_local)}"
+            _fila_local.put_nowait((event_id, campos))
+            return event_id
+        return get_redis().xadd(
+            EVENT_STREAM,
+            campos,
+            maxlen=EVENT_STREAM_MAXLEN,
+            approximate=True
+        )
+    except Exception as e:
+        logger.error(f"Erro ao publicar evento {tipo}: {e}")
+        return None
+
+def subscribe(tipo, handler):
+    """Registra um handler chamado em todos os workers quando um evento do tipo chega"""
+    _handlers.setdefault(tipo, []).append(handler)
+
+def register_notification(tipo, render):
+    """Registra como um tipo de evento vira mensagem para o grupo"""
+    _renderers[tipo] = render
+
+def _parse_event(event_id, campos):
+    evento = json.loads(campos.get('dados') or '{}')
+    evento.update({
+        'id': event_id,
+        'tipo': campos.get('tipo'),
+        'ts': float(campos.get('ts', 0))
+    })
+    return evento
+
+def _dispatch(evento):
+    for handler in _handlers.get(evento['tipo'], []):
+        try:
+            handler(evento)
+        except Exception as e:
+            logger.error(f"Erro no handler do evento {evento['tipo']}: {e}")
+
+def _consume_events():
+    """Entrega os eventos novos aos handlers locais deste worker"""
+    ultimo_id = '$'
+    while True:
+        try:
+            resposta = get_redis().xread({EVENT_STREAM: ultimo_id}, count=100, block=5000)
+            for _, entradas in resposta or []:
+                for event_id, campos in entradas:
+                    ultimo_id = event_id
+                    _dispatch(_parse_event(event_id, campos))
+        except Exception as e:
+            logger.error(f"Erro ao consumir eventos: {e}")
+            time.sleep(5)
+
+def _give_up(evento, tentativas):
+    """Indica se a notificação deve ser descartada em vez de tentada de novo"""
+    return tentativas >= ENTREGA_MAX_TENTATIVAS or time.time() - evento['ts'] > ENTREGA_VALIDADE
+
+def _send_local_pending():
+    """Entrega as notificações pendentes em ordem; a primeira que falha segura as seguintes"""
+    while _reenvios_locais:
+        item = _reenvios_locais[0]
+        evento, mensagem, tentativas, proxima = item
+        if proxima > time.time():
+            return
+        try:
+            entregue = _local_send(mensagem) is not False
+        except Exception as e:
+            logger.error(f"Erro na entrega do evento {evento['tipo']}: {e}")
+            entregue = False
+        if not entregue:
+            tentativas += 1
+            if not _give_up(evento, tentativas):
+                item[2], item[3] = tentativas, time.time() + LEADER_TTL
+                return
+            logger.error(f"Notificação {evento['tipo']} descartada após {tentativas} tentativas")
+        _reenvios_locais.pop(0)
+
+def _local_loop():
+    """Sem Redis: entrega os eventos deste processo aos handlers e ao grupo"""
+    while True:
+        try:
+            event_id, campos = _fila_local.get(timeout=1)
+        except queue.Empty:
+            pass
+        else:
+            evento = _parse_event(event_id, campos)
+            # Os handlers recebem o evento na hora, mesmo com entregas ao grupo atrasadas
+            _dispatch(evento)
+            render = _renderers.get(evento['tipo'])
+            if render and _local_send:
+                try:
+                    mensagem = render(evento)
+                    if mensagem:
+                        _reenvios_locais.append([evento, mensagem, 0, 0])
+                except Exception as e:
+                    logger.error(f"Erro na entrega do evento {evento['tipo']}: {e}")
+        if _local_send:
+            _send_local_pending()
+
+def _start_local():
+    global _local_thread
+    if _local_thread and _local_thread.is_alive():
+        return _local_thread
+
+    _local_thread = threading.Thread(target=_local_loop, name='event-local', daemon=True)
+    _local_thread.start()
+    return _local_thread
+
+def start_event_consumer():
+    """Inicia a entrega de eventos aos handlers locais em segundo plano"""
+    global _consumer_thread
+    if not uses_redis():
+        return _start_local()
+    if _consumer_thread and _consumer_thread.is_alive():
+        return _consumer_thread
+
+    _consumer_thread = threading.Thread(target=_consume_events, name='event-consumer', daemon=True)
+    _consumer_thread.start()
+    return _consumer_thread
+
+def _is_leader(redis, worker_id):
+    """Tenta assumir ou renovar a liderança das notificações"""
+    if redis.set(LEADER_KEY, worker_id, nx=True, ex=LEADER_TTL):
+        logger.info(f"Worker {worker_id} assumiu a entrega de notificações")
+        return True
+    return bool(redis.eval(_RENEW_LEADER_SCRIPT, 1, LEADER_KEY, worker_id, LEADER_TTL))
+
+def _ensure_group(redis):
+    # Criado a partir do início do stream para não perder eventos
+    # publicados antes do primeiro líder
+    try:
+        redis.xgroup_create(EVENT_STREAM, NOTIFIER_GROUP, id='0', mkstream=True)
+    except Exception as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+def _deliver(redis, send, event_id, campos):
+    evento = _parse_event(event_id, campos)
+    render = _renderers.get(evento['tipo'])
+    if render:
+        mensagem = render(evento)
+        # Sem confirmação (ack) o evento fica pendente e é reenviado depois,
+        # por exemplo enquanto o circuito da Evolution API está aberto
+        if mensagem and send(mensagem) is False:
+            tentativas = _tentativas.get(event_id, 0) + 1
+            if not _give_up(evento, tentativas):
+                _tentativas[event_id] = tentativas
+                return
+            logger.error(f"Notificação {evento['tipo']} descartada após {tentativas} tentativas")
+    _tentativas.pop(event_id, None)
+    redis.xack(EVENT_STREAM, NOTIFIER_GROUP, event_id)
+
+def _notifier_loop(send):
+    """Enquanto for líder, entrega cada evento ao grupo uma única vez"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    grupo_criado = False
+    while True:
+        try:
+            redis = get_redis()
+            if not _is_leader(redis, worker_id):
+                time.sleep(LEADER_TTL / 3)
+                continue
+
+            if not grupo_criado:
+                _ensure_group(redis)
+                grupo_criado = True
+
+            # Primeiro os eventos que um líder anterior leu e não confirmou
+            _, entradas, *_ = redis.xautoclaim(
+                EVENT_STREAM, NOTIFIER_GROUP, worker_id,
+                min_idle_time=LEADER_TTL * 1000, start_id='0-0', count=10
+            )
+            if not entradas:
+                resposta = redis.xreadgroup(
+                    NOTIFIER_GROUP, worker_id, {EVENT_STREAM: '>'},
+                    count=10, block=5000
+                )
+                entradas = resposta[0][1] if resposta else []
+
+            for event_id, campos in entradas:
+                _deliver(redis, send, event_id, campos)
+        except Exception as e:
+            logger.error(f"Erro na entrega de notificações: {e}")
+            grupo_criado = False
+            time.sleep(5)
+
+def start_notifier(send):
+    """Inicia a disputa pela liderança e a entrega das notificações com send(mensagem)"""
+    global _notifier_thread, _local_send
+    if not uses_redis():
+        # Um único processo: ele mesmo entrega as notificações
+        _local_send = send
+        return _start_local()
+    if _notifier_thread and _notifier_thread.is_alive():
+        return _notifier_thread
+
+    _notifier_thread = threading.Thread(target=_notifier_loop, args=(send,), name='event-notifier', daemon=True)
+    _notifier_thread.start()
+    return _notifier_thread
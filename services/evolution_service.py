@@ -1,72 +1,115 @@
-import os
 import json
 import logging
 import re
 import time
-import requests
-from datetime import datetime, timedelta
-import pytz
+import uuid
 import random
-import openai
 from database import (
-    get_status, update_status, record_closure_time,
-    get_daily_stats, get_weather_status, update_weather,
-    redis_client
+    record_closure_time, get_daily_stats, get_weather_status, update_weather
+)
+from services.state_repository import get_status, set_status
+from services.clients import get_http_session
+from services.state_backend import get_backend, Script
+from services.shared_state import try_acquire_interval
+from services.circuit_breaker import get_breaker
+from services.event_bus import (
+    publish, register_notification,
+    TRANSICAO_INICIADA, TRANSICAO_CONCLUIDA, TRANSICAO_CANCELADA, CLIMA_ALTERADO,
+    FECHAMENTO_ACIMA_DO_NORMAL
+)
+from services.rollup_service import get_report, PERIODOS_RELATORIO
+from services.timeutil import now, now_epoch, local_datetime
+from services.report_aggregator import submit_report, clear_reports
+from services.closure_stats import get_closure_stats, is_above_normal
+from services.faq import is_question, match, is_on_topic, render_answer, ask_model
+from services.request_context import load_context, STATUS, CLIMA, ESTATISTICAS
+from services.user_state import (
+    get_last_action, set_last_action, set_confirmation, pop_confirmation
 )
 from config import (
-    BR_TIMEZONE, PICOS, WEATHER_API_KEY, CITY_ID,
-    GROUP_ID, SERVER_URL, INSTANCE, APIKEY
+    PICOS, WEATHER_API_KEY, CITY_ID,
+    GROUP_ID, SERVER_URL, INSTANCE, APIKEY,
+    INTERVALO_MINIMO_PUBLICIDADE, ALERTA_TEMPO_MEDIO
 )
 
 logger = logging.getLogger(__name__)
-openai.api_key = os.getenv('OPENAI_API_KEY')
 
-# Controle de publicidade
-ultima_publicidade = None
-INTERVALO_MINIMO_PUBLICIDADE = timedelta(minutes=30)
+# Controle de publicidade (compartilhado entre workers)
+PUBLICIDADE_KEY = 'ultima_publicidade'
 
-# Chave para armazenar última atualização do clima no Redis
+# Circuit breakers das integrações externas
+evolution_breaker = get_breaker('evolution')
+weather_breaker = get_breaker('openweather')
+
+# Chave para armazenar última atualização do clima
 WEATHER_UPDATE_KEY = 'last_weather_update'
 
-# Chaves Redis para controle de concorrência
+# Chaves de estado para controle de concorrência
+# (o estado por usuário fica em services.user_state)
 STATUS_LOCK_KEY = 'status_lock'
-CONFIRMATION_KEY = 'confirmation_{user}'
-LAST_ACTION_KEY = 'last_action_{user}'
+
+# Libera o lock apenas se ele ainda pertence a quem o adquiriu
+def _release_lock_python(backend, chaves, args):
+    if backend.lookup(chaves[0]) == args[0]:
+        return backend.delete(chaves[0])
+    return 0
+
+_RELEASE_LOCK_SCRIPT = Script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""", _release_lock_python)
 
 def get_current_time():
     """Retorna a hora atual no fuso horário do Brasil"""
-    return datetime.now(BR_TIMEZONE)
+    return local_datetime(now())
 
 def is_horario_pico():
     """Verifica se é horário de pico"""
     hora_atual = get_current_time().hour
     return any(inicio <= hora_atual <= fim for inicio, fim in PICOS.values())
 
-def acquire_lock(key, timeout=30):
-    """Tenta adquirir um lock no Redis"""
-    return redis_client.set(key, '1', ex=timeout, nx=True)
+def acquire_lock(key, timeout=30, espera=0):
+    """
+    Tenta adquirir um lock no backend de estado, aguardando até `espera` segundos.
+    Retorna o token necessário para liberá-lo, ou None
+    """
+    token = uuid.uuid4().hex
+    limite = time.monotonic() + espera
+    while True:
+        if get_backend().set(key, token, ttl=timeout, nx=True):
+            return token
+        if time.monotonic() >= limite:
+            return None
+        time.sleep(0.05)
+
+def release_lock(key, token):
+    """Libera um lock (não remove o lock de outro processo se este já expirou)"""
+    return bool(get_backend().run_script(_RELEASE_LOCK_SCRIPT, [key], [token]))
 
-def release_lock(key):
-    """Libera um lock no Redis"""
-    redis_client.delete(key)
+MENSAGEM_LOCK_OCUPADO = (
+    " ⚠️ *Atenção*\n"
+    "Outra pessoa está alterando o status.\n"
+    "⏳ Aguarde alguns segundos e tente novamente."
+)
 
-def toggle_status(nome_remetente):
+def toggle_status(nome_remetente, status_confirmado=None):
     """
-    Alterna o status da rodovia com proteção contra condições de corrida
+    Alterna o status da rodovia com proteção contra condições de corrida.
+    status_confirmado: status visto pelo usuário ao confirmar com !sim; a
+    confirmação dispensa as esperas e é ignorada se o status já mudou.
     """
     try:
         # Tenta adquirir o lock
-        if not acquire_lock(STATUS_LOCK_KEY, timeout=30):
-            return (
-                " ⚠️ *Atenção*\n"
-                "Outra pessoa está alterando o status.\n"
-                "⏳ Aguarde alguns segundos e tente novamente."
-            )
+        token = acquire_lock(STATUS_LOCK_KEY, timeout=30)
+        if not token:
+            return MENSAGEM_LOCK_OCUPADO
         
         try:
             # Verificar se já há uma transição em andamento
-            transicao_center = redis_client.get(TRANSICAO_KEY.format(local='CENTER'))
-            transicao_goio = redis_client.get(TRANSICAO_KEY.format(local='GOIO'))
+            transicao_center = get_backend().get(TRANSICAO_KEY.format(local='CENTER'))
+            transicao_goio = get_backend().get(TRANSICAO_KEY.format(local='GOIO'))
             
             if transicao_center or transicao_goio:
                 return (
@@ -76,7 +119,8 @@ def toggle_status(nome_remetente):
                     "com o comando !cancelar"
                 )
             
-            status_atual, ultima_atualizacao = get_status('CENTER')
+            # Sem cache: outro worker pode ter acabado de concluir uma transição
+            status_atual, ultima_atualizacao = get_status('CENTER', usar_cache=False)
             if not status_atual or not ultima_atualizacao:
                 logger.error("Erro ao obter status atual")
                 return (
@@ -85,14 +129,16 @@ def toggle_status(nome_remetente):
                     "Por favor, tente novamente."
                 )
 
-            ultima = datetime.strptime(ultima_atualizacao, '%d/%m/%Y %H:%M')
-            ultima = BR_TIMEZONE.localize(ultima)
-            
+            if status_confirmado and status_confirmado != status_atual:
+                return (
+                    " ℹ️ *Status já alterado*\n"
+                    "Outra pessoa alterou o status antes da sua confirmação."
+                )
+
             # Verificar última ação do usuário
-            last_action = redis_client.get(LAST_ACTION_KEY.format(user=nome_remetente))
-            if last_action:
-                last_action_time = float(last_action)
-                if (time.time() - last_action_time) < 5:  # 5 segundos entre ações
+            last_action_time = get_last_action(nome_remetente)
+            if last_action_time and not status_confirmado:
+                if (now() - last_action_time) < 5:  # 5 segundos entre ações
                     return (
                         " ⏳ *Aguarde*\n"
                         "Você precisa esperar alguns segundos\n"
@@ -100,23 +146,13 @@ def toggle_status(nome_remetente):
                     )
             
             # Registrar ação do usuário
-            redis_client.set(LAST_ACTION_KEY.format(user=nome_remetente), 
-                           str(time.time()), 
-                           ex=300)  # Expira em 5 minutos
+            set_last_action(nome_remetente)
             
-            tempo_desde = int((get_current_time() - ultima).total_seconds())
+            tempo_desde = now_epoch() - ultima_atualizacao
             
-            if tempo_desde < 30:
+            if tempo_desde < 30 and not status_confirmado:
                 # Registrar intenção de confirmação
-                redis_client.set(
-                    CONFIRMATION_KEY.format(user=nome_remetente),
-                    json.dumps({
-                        'action': 'toggle',
-                        'timestamp': time.time(),
-                        'current_status': status_atual
-                    }),
-                    ex=300  # Expira em 5 minutos
-                )
+                set_confirmation(nome_remetente, 'toggle', status_atual)
                 
                 return (
                     " ⚠️ *Confirmação Necessária*\n\n"
@@ -139,12 +175,10 @@ def toggle_status(nome_remetente):
                 )
                 
         finally:
-            release_lock(STATUS_LOCK_KEY)
+            release_lock(STATUS_LOCK_KEY, token)
             
     except Exception as e:
         logger.error(f"Erro ao alternar status: {e}")
-        # Garantir que o lock seja liberado mesmo em caso de erro
-        release_lock(STATUS_LOCK_KEY)
         return (
             " ❌ *Erro*\n"
             "Não foi possível alterar o status.\n"
@@ -161,22 +195,15 @@ def get_mensagem_publicidade():
     return random.choice(mensagens)
 
 def pode_enviar_publicidade():
-    """Verifica se pode enviar publicidade"""
-    global ultima_publicidade
-    agora = get_current_time()
-    
-    if not ultima_publicidade or (agora - ultima_publicidade) > INTERVALO_MINIMO_PUBLICIDADE:
-        ultima_publicidade = agora
-        return True
-    return False
+    """Verifica se pode enviar publicidade (verificação e marcação atômicas)"""
+    return try_acquire_interval(
+        PUBLICIDADE_KEY,
+        INTERVALO_MINIMO_PUBLICIDADE.total_seconds()
+    )
 
 def get_time_since_update(ultima_atualizacao):
-    """Calcula tempo desde última atualização"""
-    agora = get_current_time()
-    ultima = datetime.strptime(ultima_atualizacao, '%d/%m/%Y %H:%M')
-    ultima = BR_TIMEZONE.localize(ultima)
-    
-    minutos = int((agora - ultima).total_seconds() / 60)
+    """Calcula tempo desde última atualização (segundos desde a época)"""
+    minutos = (now_epoch() - ultima_atualizacao) // 60
     
     if minutos < 60:
         return f"{minutos} minutos atrás"
@@ -228,7 +255,9 @@ def get_mensagem_ajuda():
         " 📱 *Comandos Disponíveis*\n\n"
         "*Consultas*\n"
         "➡️ *!status* - Ver status atual\n"
-        "➡️ *!stats* - Ver estatísticas do dia\n\n"
+        "➡️ *!stats* - Ver estatísticas do dia\n"
+        "➡️ *!relatorio* - Relatório da semana\n"
+        "   (ou *!relatorio mes* / *!relatorio ano*)\n\n"
         "*Alterações*\n"
         "➡️ *!alterna* - Iniciar transição\n"
         "➡️ *!passou* - Confirmar que todos passaram\n"
@@ -250,17 +279,24 @@ TEMPO_MEDIO_TRANSICAO = 20
 TEMPO_MINIMO_TRANSICAO = 10
 TEMPO_MAXIMO_TRANSICAO = 30
 
-# Chaves Redis para controle de transição
+# Chaves de estado para controle de transição
 TRANSICAO_KEY = 'transicao_{local}'
+SEGMENTO_RELATOS = 'rodovia'
 ULTIMO_FECHAMENTO_KEY = 'ultimo_fechamento_{local}'
 CARROS_PASSANDO_KEY = 'carros_passando_{local}'
+ALERTA_FECHAMENTO_KEY = 'alerta_fechamento:{local}:{inicio}'
 
 def notify_group(mensagem, group_id=None):
-    """Envia mensagem para o grupo"""
+    """Envia mensagem para o grupo. Retorna True se a mensagem foi entregue"""
     try:
         if not group_id:
             group_id = GROUP_ID
             
+        # Com a Evolution API fora do ar, desistir na hora em vez de esperar o timeout
+        if not evolution_breaker.allow():
+            logger.warning(f"Circuito da Evolution API aberto, notificação não enviada: {mensagem}")
+            return False
+            
         logger.info(f"Enviando notificação para o grupo {group_id}")
         logger.info(f"Mensagem: {mensagem}")
             
@@ -279,45 +315,51 @@ def notify_group(mensagem, group_id=None):
         }
         
         logger.info(f"Fazendo requisição para {SERVER_URL}/message/sendText/{INSTANCE}")
-        response = requests.post(
-            f"{SERVER_URL}/message/sendText/{INSTANCE}",
-            headers=headers,
-            json=payload
-        )
+        try:
+            response = get_http_session().post(
+                f"{SERVER_URL}/message/sendText/{INSTANCE}",
+                headers=headers,
+                json=payload,
+                timeout=10
+            )
+        except Exception:
+            evolution_breaker.record_failure()
+            raise
         
+        if response.status_code >= 500:
+            evolution_breaker.record_failure()
+        else:
+            evolution_breaker.record_success()
+            
         if response.status_code != 200:
             logger.error(f"Erro ao enviar mensagem para o grupo: {response.text}")
             logger.error(f"Status code: {response.status_code}")
-        else:
-            logger.info("Notificação enviada com sucesso!")
+            return False
+            
+        logger.info("Notificação enviada com sucesso!")
+        return True
             
     except Exception as e:
         logger.error(f"Erro ao notificar grupo: {e}", exc_info=True)
+        return False
 
 def process_confirmation(mensagem, nome_remetente):
     """Processa confirmações com proteção contra timing issues"""
     try:
-        # Verificar se existe uma confirmação pendente
-        confirmation_data = redis_client.get(CONFIRMATION_KEY.format(user=nome_remetente))
-        if not confirmation_data:
+        # Consumir a confirmação pendente: só um !sim a recebe
+        # (dois !sim simultâneos não alternam duas vezes)
+        confirmation = pop_confirmation(nome_remetente)
+        if not confirmation:
             return " Não há confirmação pendente para você."
-            
-        confirmation = json.loads(confirmation_data)
         
         # Verificar se a confirmação não expirou (5 minutos)
-        if (time.time() - confirmation['timestamp']) > 300:
-            redis_client.delete(CONFIRMATION_KEY.format(user=nome_remetente))
+        if (now() - confirmation['timestamp']) > 300:
             return " ⚠️ Confirmação expirada. Por favor, tente a ação novamente."
             
         if mensagem.lower() == '!sim':
-            # Limpar confirmação
-            redis_client.delete(CONFIRMATION_KEY.format(user=nome_remetente))
-            
             if confirmation['action'] == 'toggle':
-                return toggle_status(nome_remetente)
+                return toggle_status(nome_remetente, status_confirmado=confirmation['current_status'])
         else:
-            # Limpar confirmação
-            redis_client.delete(CONFIRMATION_KEY.format(user=nome_remetente))
             return " Operação cancelada."
             
     except Exception as e:
@@ -328,7 +370,7 @@ def process_message(data):
     """Processa mensagens recebidas"""
     try:
         mensagem = data.get('text', '').strip().lower()
-        nome_remetente = data.get('sender', {}).get('pushName', 'Usuário')
+        nome_remetente = data.get('sender', {}).get('pushName') or 'Usuário'
         
         # Ignorar mensagens vazias
         if not mensagem:
@@ -344,49 +386,16 @@ def process_message(data):
             
         # Processar consultas de status
         if any(palavra in mensagem for palavra in ['como esta', 'como está', 'status']):
-            status_center, ultima_center = get_status('CENTER')
-            status_goio, ultima_goio = get_status('GOIO')
-            
-            if not status_center or not status_goio:
-                return (
-                    " ❌ *Erro*\n"
-                    "Não foi possível obter o status.\n"
-                    "Por favor, tente novamente."
-                )
-                
-            tempo_center = get_time_since_update(ultima_center)
-            tempo_goio = get_time_since_update(ultima_goio)
-            
-            # Obter informações do clima
-            weather = get_weather_status()
-            weather_info = ""
-            if weather:
-                weather_info = f"\n\n🌤️ *Clima*: {weather['condicao']}"
-                if weather.get('alerta'):
-                    weather_info += f"\n⚠️ {weather['alerta']}"
-            
-            # Obter estatísticas
-            stats = get_stats_message()
+            return get_status_reply()
             
-            # Chance de 30% de mostrar publicidade
-            publicidade = ""
-            if random.random() < 0.3 and pode_enviar_publicidade():
-                publicidade = f"\n\n📢 {get_mensagem_publicidade()}"
+        # Perguntas: índice local das perguntas frequentes, depois o modelo remoto
+        # (uma pergunta como "tá fechado?" não conta como relato)
+        if is_question(mensagem):
+            return answer_question(mensagem)
             
-            return (
-                " 📊 *Status Atual*\n\n"
-                f"QC: {status_center}\n"
-                f"⏰ {tempo_center}\n\n"
-                f"Goioerê: {status_goio}\n"
-                f"⏰ {tempo_goio}"
-                f"{weather_info}\n\n"
-                f"📊 {stats}"
-                f"{publicidade}"
-            )
-            
-        # Processar alterações de status
+        # Processar relatos de alteração de status
         if any(palavra in mensagem for palavra in ['fechado', 'aberto', 'liberado', 'bloqueado', 'passando', 'parado']):
-            return toggle_status(nome_remetente)
+            return process_status_report(nome_remetente)
             
         return None
             
@@ -398,6 +407,125 @@ def process_message(data):
             "Por favor, tente novamente."
         )
 
+def process_status_report(nome_remetente):
+    """
+    Agrega relatos em texto livre: o status só é alternado quando relatos de
+    remetentes diferentes atingem o quórum dentro da janela
+    """
+    # Durante uma transição os relatos descrevem a própria transição
+    if get_backend().exists(TRANSICAO_KEY.format(local='CENTER'), TRANSICAO_KEY.format(local='GOIO')):
+        return None
+        
+    try:
+        # Relatos anteriores à última mudança de status não contam
+        _, ultima_atualizacao = get_status('CENTER')
+        quorum, _, quantidade = submit_report(SEGMENTO_RELATOS, nome_remetente, desde=ultima_atualizacao)
+    except Exception as e:
+        logger.error(f"Erro ao registrar relato: {e}")
+        return toggle_status(nome_remetente)
+        
+    if quorum:
+        return toggle_status(nome_remetente)
+        
+    # Responder apenas ao primeiro relato da janela
+    if quantidade == 1:
+        return (
+            " 📝 *Relato registrado*\n"
+            "O status muda quando mais alguém confirmar.\n"
+            "➡️ Ou use *!alterna* para alternar agora"
+        )
+    return None
+
+def _nome_lado(lado):
+    return 'QC' if lado == 'CENTER' else 'Goioerê'
+
+def get_active_transition():
+    """Retorna (local, dados) da transição em andamento, ou (None, None)"""
+    for local in ('CENTER', 'GOIO'):
+        transicao = get_backend().get(TRANSICAO_KEY.format(local=local))
+        if transicao:
+            return local, json.loads(transicao)
+    return None, None
+
+def _closed_side_average():
+    """(lado parado, tempo médio de fechamento dele em segundos)"""
+    status, _ = get_status('CENTER')
+    parado = 'GOIO' if status == ESTADO_ABERTO else 'CENTER'
+    estatistica = get_closure_stats(parado)
+    return parado, estatistica['media'] if estatistica else TEMPO_MEDIO_TRANSICAO * 60
+
+def _faq_status():
+    status, ultima_atualizacao = get_status('CENTER')
+    passando, parado = ('CENTER', 'GOIO') if status == ESTADO_ABERTO else ('GOIO', 'CENTER')
+    return (
+        f"🟢 *{_nome_lado(passando).upper()} PASSANDO*\n"
+        f"❌ {_nome_lado(parado)} PARADO\n"
+        f"↪️ Última atualização: {get_time_since_update(ultima_atualizacao)}"
+    )
+
+def _faq_status_resumo():
+    status, _ = get_status('CENTER')
+    return f"Agora: {'QC' if status == ESTADO_ABERTO else 'Goioerê'} passando."
+
+def _faq_previsao():
+    local, transicao = get_active_transition()
+    if transicao:
+        decorrido = int((now() - transicao['inicio']) // 60)
+        return (
+            f"🔄 Transição em andamento há {decorrido} minutos "
+            f"(previsão: ~{int(check_transition_time(local))} minutos)."
+        )
+    _, ultima_atualizacao = get_status('CENTER')
+    parado, media = _closed_side_average()
+    restante = int(media - (now_epoch() - ultima_atualizacao)) // 60
+    if restante > 0:
+        return f"⏳ {_nome_lado(parado)} deve liberar em cerca de {restante} minutos."
+    return f"⏳ {_nome_lado(parado)} já passou do tempo médio parado e deve liberar em breve."
+
+def _faq_tempo_medio():
+    _, media = _closed_side_average()
+    return f"{int(media // 60)} minutos"
+
+def _faq_clima():
+    weather = get_weather_status()
+    if not weather:
+        return "🌤️ Sem informações de clima no momento."
+    clima = f"🌤️ *Clima*: {weather['condicao']}"
+    if weather.get('alerta'):
+        clima += f"\n⚠️ {weather['alerta']}"
+    return clima
+
+def _faq_picos():
+    return "\n".join(f"• {inicio}h às {fim}h" for inicio, fim in PICOS.values())
+
+# Campos disponíveis nos modelos de resposta das perguntas frequentes
+FAQ_FONTES = {
+    'status': _faq_status,
+    'status_resumo': _faq_status_resumo,
+    'previsao': _faq_previsao,
+    'tempo_medio': _faq_tempo_medio,
+    'clima': _faq_clima,
+    'picos': _faq_picos
+}
+
+def answer_question(mensagem):
+    """
+    Responde perguntas frequentes pelo índice local; abaixo do limiar de
+    similaridade consulta o modelo remoto com o contexto atual. Perguntas
+    fora do tema (sem relação com o índice) ficam sem resposta
+    """
+    try:
+        entrada, similaridade = match(mensagem)
+        if entrada:
+            return render_answer(entrada, FAQ_FONTES)
+        if not is_on_topic(similaridade):
+            return None
+        contexto = "\n".join(FAQ_FONTES[campo]() for campo in ('status', 'previsao', 'clima'))
+        return ask_model(mensagem, contexto)
+    except Exception as e:
+        logger.error(f"Erro ao responder pergunta: {e}")
+        return None
+
 def process_command(mensagem, nome_remetente):
     """Processa comandos com !"""
     try:
@@ -409,45 +537,13 @@ def process_command(mensagem, nome_remetente):
             
         # Comandos de status
         if mensagem == '!status':
-            status_center, ultima_center = get_status('CENTER')
-            status_goio, ultima_goio = get_status('GOIO')
+            return get_status_reply()
             
-            if not status_center or not status_goio:
-                return (
-                    " ❌ *Erro*\n"
-                    "Não foi possível obter o status.\n"
-                    "Por favor, tente novamente."
-                )
-                
-            tempo_center = get_time_since_update(ultima_center)
-            tempo_goio = get_time_since_update(ultima_goio)
-            
-            # Obter informações do clima
-            weather = get_weather_status()
-            weather_info = ""
-            if weather:
-                weather_info = f"\n\n🌤️ *Clima*: {weather['condicao']}"
-                if weather.get('alerta'):
-                    weather_info += f"\n⚠️ {weather['alerta']}"
-            
-            # Obter estatísticas
-            stats = get_stats_message()
-            
-            # Chance de 30% de mostrar publicidade
-            publicidade = ""
-            if random.random() < 0.3 and pode_enviar_publicidade():
-                publicidade = f"\n\n📢 {get_mensagem_publicidade()}"
-            
-            return (
-                " 📊 *Status Atual*\n\n"
-                f"QC: {status_center}\n"
-                f"⏰ {tempo_center}\n\n"
-                f"Goioerê: {status_goio}\n"
-                f"⏰ {tempo_goio}"
-                f"{weather_info}\n\n"
-                f"📊 {stats}"
-                f"{publicidade}"
-            )
+        # Relatórios de longo prazo
+        if mensagem.startswith('!relatorio'):
+            partes = mensagem.split()
+            periodo = partes[1] if len(partes) > 1 else 'semana'
+            return get_relatorio_message(periodo)
             
         # Comandos de alternância
         if mensagem == '!alterna':
@@ -475,99 +571,169 @@ def process_command(mensagem, nome_remetente):
             "Por favor, tente novamente."
         )
 
-def get_status(local):
-    """Retorna o status de um local específico"""
-    try:
-        # Obter status atual
-        status_atual = redis_client.get("status_atual")
-        if status_atual:
-            status = json.loads(status_atual)
-        else:
-            status = {}
-            
-        # Obter última atualização
-        ultima_atualizacao = redis_client.get("ultima_atualizacao")
-        if not ultima_atualizacao:
-            ultima_atualizacao = datetime.now().strftime("%d/%m/%Y %H:%M")
-            
-        # Obter status do local específico
-        if local == "center":
-            status_local = status.get("center", ESTADO_ABERTO)
-        elif local == "goio":
-            status_local = status.get("goio", ESTADO_ABERTO)
-        else:
-            status_local = ESTADO_ABERTO
-            
-        return {
-            "status": status_local,
-            "ultima_atualizacao": ultima_atualizacao.decode() if isinstance(ultima_atualizacao, bytes) else ultima_atualizacao
-        }
+def get_status_reply():
+    """
+    Resposta completa de status (!status e "como está?"). Status dos dois
+    lados, clima e estatísticas vêm de um RequestContext: uma ida ao Redis
+    e no máximo uma transação no SQLite
+    """
+    contexto = load_context(STATUS, CLIMA, ESTATISTICAS)
+    status_center, ultima_center = contexto.status['CENTER']
+    status_goio, ultima_goio = contexto.status['GOIO']
+    
+    if not status_center or not status_goio:
+        return (
+            " ❌ *Erro*\n"
+            "Não foi possível obter o status.\n"
+            "Por favor, tente novamente."
+        )
         
-    except Exception as e:
-        logger.error(f"Erro ao obter status: {e}")
-        return {
-            "status": ESTADO_ABERTO,
-            "ultima_atualizacao": datetime.now().strftime("%d/%m/%Y %H:%M")
-        }
+    tempo_center = get_time_since_update(ultima_center)
+    tempo_goio = get_time_since_update(ultima_goio)
+    
+    # Informações do clima
+    weather = contexto.clima
+    weather_info = ""
+    if weather:
+        weather_info = f"\n\n🌤️ *Clima*: {weather['condicao']}"
+        if weather.get('alerta'):
+            weather_info += f"\n⚠️ {weather['alerta']}"
+    
+    # Estatísticas
+    stats = get_stats_message(contexto.estatisticas)
+    
+    # Chance de 30% de mostrar publicidade
+    publicidade = ""
+    if random.random() < 0.3 and pode_enviar_publicidade():
+        publicidade = f"\n\n📢 {get_mensagem_publicidade()}"
+    
+    return (
+        " 📊 *Status Atual*\n\n"
+        f"QC: {status_center}\n"
+        f"⏰ {tempo_center}\n\n"
+        f"Goioerê: {status_goio}\n"
+        f"⏰ {tempo_goio}"
+        f"{weather_info}\n\n"
+        f"{stats}"
+        f"{publicidade}"
+    )
 
-def get_stats_message():
-    """Retorna estatísticas do dia"""
+def get_stats_message(stats=None):
+    """Retorna estatísticas do dia (stats: já carregadas, senão lidas agora)"""
     try:
-        stats = get_daily_stats()
+        if stats is None:
+            stats = get_daily_stats()
         return (
             f"📊 *Estatísticas do Dia*\n\n"
-            f"🚗 Total de transições: {stats['total_transitions']}\n"
-            f"⏱️ Tempo médio aberto: {stats['avg_open_time']} minutos\n"
-            f"🔄 Última atualização: {stats['last_update']}"
+            f"🚗 Total de fechamentos: {stats['total_fechamentos']}\n"
+            f"⏱️ Tempo médio fechado: {stats['tempo_medio'] // 60} minutos\n"
+            f"🕐 Horário de pico: {stats['horario_pico']}"
         )
     except Exception as e:
         logger.error(f"Erro ao gerar estatísticas: {e}")
         return "Erro ao gerar estatísticas"
 
+def get_relatorio_message(periodo='semana'):
+    """Retorna o relatório de longo prazo formatado"""
+    try:
+        if periodo not in PERIODOS_RELATORIO:
+            return (
+                " ❓ *Período Desconhecido*\n"
+                "Use *!relatorio semana*, *!relatorio mes*\n"
+                "ou *!relatorio ano*."
+            )
+            
+        relatorio = get_report(periodo)
+        if not relatorio['total_fechamentos']:
+            return f" 📈 *Relatório ({periodo})*\n\nAinda não há dados para este período."
+            
+        horarios = "\n".join(
+            f"• {hora} - {total} fechamentos" for hora, total in relatorio['horarios_pico']
+        )
+        dias_semana = "\n".join(
+            f"• {dia}: {media}" for dia, media in relatorio['media_por_dia_semana'].items()
+        )
+        
+        mensagem = (
+            f" 📈 *Relatório ({periodo})*\n\n"
+            f"🚗 Total de fechamentos: {relatorio['total_fechamentos']}\n"
+            f"⏱️ Tempo médio: {relatorio['tempo_medio'] // 60} minutos\n\n"
+            f"🕐 *Horários mais movimentados*\n{horarios}\n\n"
+            f"📅 *Média de fechamentos por dia*\n{dias_semana}"
+        )
+        
+        if relatorio['tempo_medio_chuva'] is not None and relatorio['tempo_medio_sem_chuva'] is not None:
+            mensagem += (
+                "\n\n🌧️ *Clima*\n"
+                f"• Com chuva: {relatorio['tempo_medio_chuva'] // 60} minutos\n"
+                f"• Sem chuva: {relatorio['tempo_medio_sem_chuva'] // 60} minutos"
+            )
+            
+        return mensagem
+    except Exception as e:
+        logger.error(f"Erro ao gerar relatório: {e}")
+        return "Erro ao gerar relatório"
+
 def update_weather_info():
     """Atualiza informações do clima com retry e fallback"""
     if not WEATHER_API_KEY:
         return None
         
+    import requests
+    
     max_retries = 3
     retry_delay = 1  # segundos
     
     for attempt in range(max_retries):
+        # Circuito aberto: responder na hora com o cache, sem tentativas nem esperas
+        if not weather_breaker.allow():
+            logger.warning("Circuito do OpenWeather aberto, usando clima em cache")
+            break
+            
+        registrado = False
         try:
             url = f"http://api.openweathermap.org/data/2.5/weather?id={CITY_ID}&appid={WEATHER_API_KEY}&units=metric&lang=pt_br"
-            response = requests.get(url, timeout=5)  # timeout de 5 segundos
+            response = get_http_session().get(url, timeout=5)  # timeout de 5 segundos
             
-            if response.status_code == 200:
-                data = response.json()
+            if response.status_code != 200:
+                weather_breaker.record_failure()
+                logger.error(f"Tentativa {attempt + 1} falhou: status {response.status_code}")
+                continue
                 
-                condicao = data['weather'][0]['description']
-                temp = data['main']['temp']
-                
-                alerta = None
-                if 'rain' in data or 'thunderstorm' in data:
-                    alerta = " Chuva na região - Dirija com cuidado!"
-                elif temp > 35:
-                    alerta = " Temperatura muito alta - Hidrate-se!"
-                elif temp < 10:
-                    alerta = " Temperatura muito baixa - Cuidado com a pista!"
-                
-                # Cache dos dados do clima no Redis
-                weather_data = {
-                    'condicao': condicao,
-                    'temp': temp,
-                    'alerta': alerta,
-                    'timestamp': time.time()
-                }
-                redis_client.set('weather_cache', 
-                               json.dumps(weather_data),
-                               ex=1800)  # Cache por 30 minutos
-                
-                # Salvar no banco SQLite
-                update_weather(condicao, alerta)
-                
-                return weather_data
+            data = response.json()
+            
+            condicao = data['weather'][0]['description']
+            temp = data['main']['temp']
+            weather_breaker.record_success()
+            registrado = True
+            
+            alerta = None
+            if 'rain' in data or 'thunderstorm' in data:
+                alerta = " Chuva na região - Dirija com cuidado!"
+            elif temp > 35:
+                alerta = " Temperatura muito alta - Hidrate-se!"
+            elif temp < 10:
+                alerta = " Temperatura muito baixa - Cuidado com a pista!"
+            
+            # Cache dos dados do clima
+            weather_data = {
+                'condicao': condicao,
+                'temp': temp,
+                'alerta': alerta,
+                'timestamp': now()
+            }
+            get_backend().set('weather_cache',
+                              json.dumps(weather_data),
+                              ttl=1800)  # Cache por 30 minutos
+            
+            # Salvar no banco SQLite (e avisar se a condição mudou)
+            if update_weather(condicao, alerta):
+                publish(CLIMA_ALTERADO, condicao=condicao, alerta=alerta, temp=temp)
+            
+            return weather_data
                 
         except requests.RequestException as e:
+            weather_breaker.record_failure()
             logger.error(f"Tentativa {attempt + 1} falhou: {e}")
             if attempt < max_retries - 1:
                 time.sleep(retry_delay)
@@ -575,11 +741,14 @@ def update_weather_info():
             continue
             
         except Exception as e:
+            # Resposta inesperada conta como falha; erro local depois do sucesso não
+            if not registrado:
+                weather_breaker.record_failure()
             logger.error(f"Erro ao atualizar clima: {e}")
             break
             
     # Em caso de falha, tentar usar cache
-    cached_weather = redis_client.get('weather_cache')
+    cached_weather = get_backend().get('weather_cache')
     if cached_weather:
         return json.loads(cached_weather)
         
@@ -589,33 +758,43 @@ def start_transition(local, nome_remetente):
     """Inicia transição para um local"""
     try:
         # Registrar início da transição
-        redis_client.set(
+        get_backend().set(
             TRANSICAO_KEY.format(local=local),
             json.dumps({
-                'inicio': time.time(),
+                'inicio': now(),
                 'remetente': nome_remetente,
                 'status': 'iniciada'
             }),
-            ex=3600  # Expira em 1 hora
+            ttl=3600  # Expira em 1 hora
         )
         
-        # Notificar grupo
-        notify_group(
-            f" 🔄 *Iniciando Transição*\n\n"
-            f"Local: {local}\n"
-            f"Iniciada por: {nome_remetente}\n\n"
-            "⚠️ Aguardando confirmação de que\n"
-            "todos os carros terminaram de passar.\n\n"
-            "📱 Responda com:\n"
-            "➡️ *!passou* - Quando todos passarem\n"
-            "➡️ *!cancelar* - Para cancelar"
-        )
+        # Relatos em texto livre pendentes não contam para a próxima alternância
+        clear_reports(SEGMENTO_RELATOS)
+        
+        # O líder do barramento de eventos notifica o grupo
+        if not publish(TRANSICAO_INICIADA, local=local, remetente=nome_remetente):
+            notify_group(render_transicao_iniciada({'local': local, 'remetente': nome_remetente}))
         
     except Exception as e:
         logger.error(f"Erro ao iniciar transição: {e}")
         return False
     return True
 
+def render_transicao_iniciada(evento):
+    """Mensagem enviada ao grupo quando uma transição começa"""
+    return (
+        f" 🔄 *Iniciando Transição*\n\n"
+        f"Local: {evento['local']}\n"
+        f"Iniciada por: {evento['remetente']}\n\n"
+        "⚠️ Aguardando confirmação de que\n"
+        "todos os carros terminaram de passar.\n\n"
+        "📱 Responda com:\n"
+        "➡️ *!passou* - Quando todos passarem\n"
+        "➡️ *!cancelar* - Para cancelar"
+    )
+
+register_notification(TRANSICAO_INICIADA, render_transicao_iniciada)
+
 def check_transition_time(local):
     """Verifica tempo de transição com base em variáveis"""
     try:
@@ -643,71 +822,65 @@ def check_transition_time(local):
         logger.error(f"Erro ao calcular tempo de transição: {e}")
         return TEMPO_MEDIO_TRANSICAO
 
+def check_closure_alert():
+    """
+    Compara a transição em andamento com a estatística dos fechamentos do
+    lado e avisa o grupo, uma única vez por transição, quando ela passa de
+    ALERTA_TEMPO_MEDIO vezes a média. Retorna True se o alerta foi emitido
+    """
+    local, transicao = get_active_transition()
+    if not transicao:
+        return False
+    decorrido = now() - transicao['inicio']
+    estatistica = get_closure_stats(local)
+    if not is_above_normal(estatistica, decorrido, ALERTA_TEMPO_MEDIO):
+        return False
+
+    # A chave identifica a transição pelo início: só um worker alerta
+    if not get_backend().set(
+        ALERTA_FECHAMENTO_KEY.format(local=local, inicio=transicao['inicio']), '1', ttl=3600, nx=True
+    ):
+        return False
+    evento = {
+        'local': local,
+        'remetente': transicao['remetente'],
+        'decorrido': int(decorrido),
+        'media': int(estatistica['media']),
+        'desvio': int(estatistica['desvio'])
+    }
+    if not publish(FECHAMENTO_ACIMA_DO_NORMAL, **evento):
+        notify_group(render_fechamento_acima_do_normal(evento))
+    return True
+
+def render_fechamento_acima_do_normal(evento):
+    """Mensagem enviada ao grupo quando a transição demora mais que o normal"""
+    return (
+        f" ⚠️ *Fechamento acima do normal*\n\n"
+        f"{_nome_lado(evento['local'])} em transição há {evento['decorrido'] // 60} minutos "
+        f"(normal: {evento['media'] // 60} ± {evento['desvio'] // 60} minutos).\n"
+        f"Iniciada por: {evento['remetente']}\n\n"
+        "➡️ *!passou* se todos já passaram\n"
+        "➡️ *!cancelar* se a transição não aconteceu"
+    )
+
+register_notification(FECHAMENTO_ACIMA_DO_NORMAL, render_fechamento_acima_do_normal)
+
 def process_transition_command(mensagem, nome_remetente):
     """Processa comandos de transição"""
     try:
-        if mensagem == '!passou':
-            # Verificar se há transição ativa
-            transicao_center = redis_client.get(TRANSICAO_KEY.format(local='CENTER'))
-            transicao_goio = redis_client.get(TRANSICAO_KEY.format(local='GOIO'))
+        # Mesmo lock do toggle_status: entre apagar a transição e gravar o novo
+        # status nenhum !alterna pode ler o status antigo e iniciar outra
+        token = acquire_lock(STATUS_LOCK_KEY, timeout=30, espera=2)
+        if not token:
+            return MENSAGEM_LOCK_OCUPADO
             
-            if not transicao_center and not transicao_goio:
-                return (
-                    " ❌ *Erro*\n"
-                    "Não há transição em andamento.\n"
-                    "Use !alterna para iniciar uma."
-                )
-                
-            # Identificar qual local está em transição
-            local = 'CENTER' if transicao_center else 'GOIO'
-            transicao = json.loads(transicao_center or transicao_goio)
-            
-            # Calcular tempo decorrido
-            tempo_decorrido = (time.time() - transicao['inicio']) / 60  # em minutos
-            tempo_esperado = check_transition_time(local)
-            
-            if tempo_decorrido < TEMPO_MINIMO_TRANSICAO:
-                return (
-                    " ⚠️ *Atenção*\n"
-                    f"Tempo muito curto ({int(tempo_decorrido)} minutos).\n"
-                    f"Aguarde pelo menos {TEMPO_MINIMO_TRANSICAO} minutos\n"
-                    "para garantir que todos passaram."
-                )
-                
-            # Registrar tempo de fechamento
-            record_closure_time(local, int(tempo_decorrido * 60))  # converter para segundos
-            
-            # Limpar transição
-            redis_client.delete(TRANSICAO_KEY.format(local=local))
-            
-            # Alternar status
-            toggle_status(nome_remetente)
-            
-            return None  # toggle_status já envia a mensagem
-            
-        elif mensagem == '!cancelar':
-            # Verificar se há transição ativa
-            transicao_center = redis_client.get(TRANSICAO_KEY.format(local='CENTER'))
-            transicao_goio = redis_client.get(TRANSICAO_KEY.format(local='GOIO'))
-            
-            if not transicao_center and not transicao_goio:
-                return (
-                    " ❌ *Erro*\n"
-                    "Não há transição em andamento\n"
-                    "para cancelar."
-                )
-                
-            # Identificar qual local está em transição
-            local = 'CENTER' if transicao_center else 'GOIO'
-            
-            # Limpar transição
-            redis_client.delete(TRANSICAO_KEY.format(local=local))
-            
-            return (
-                " 🚫 *Transição Cancelada*\n"
-                f"Local: {local}\n"
-                f"Cancelada por: {nome_remetente}"
-            )
+        try:
+            if mensagem == '!passou':
+                return complete_transition(nome_remetente)
+            elif mensagem == '!cancelar':
+                return cancel_transition(nome_remetente)
+        finally:
+            release_lock(STATUS_LOCK_KEY, token)
             
     except Exception as e:
         logger.error(f"Erro ao processar comando de transição: {e}")
@@ -715,4 +888,87 @@ def process_transition_command(mensagem, nome_remetente):
             " ❌ *Erro*\n"
             "Ocorreu um erro ao processar o comando.\n"
             "Por favor, tente novamente."
-        )
\ No newline at end of file
+        )
+
+MENSAGEM_TRANSICAO_ENCERRADA = (
+    " ❌ *Erro*\n"
+    "Esta transição já foi concluída ou cancelada."
+)
+
+def complete_transition(nome_remetente):
+    """Conclui a transição em andamento (!passou)"""
+    # Verificar se há transição ativa
+    transicao_center = get_backend().get(TRANSICAO_KEY.format(local='CENTER'))
+    transicao_goio = get_backend().get(TRANSICAO_KEY.format(local='GOIO'))
+    
+    if not transicao_center and not transicao_goio:
+        return (
+            " ❌ *Erro*\n"
+            "Não há transição em andamento.\n"
+            "Use !alterna para iniciar uma."
+        )
+        
+    # Identificar qual local está em transição
+    local = 'CENTER' if transicao_center else 'GOIO'
+    transicao = json.loads(transicao_center or transicao_goio)
+    
+    # Calcular tempo decorrido
+    tempo_decorrido = (now() - transicao['inicio']) / 60  # em minutos
+    
+    if tempo_decorrido < TEMPO_MINIMO_TRANSICAO:
+        return (
+            " ⚠️ *Atenção*\n"
+            f"Tempo muito curto ({int(tempo_decorrido)} minutos).\n"
+            f"Aguarde pelo menos {TEMPO_MINIMO_TRANSICAO} minutos\n"
+            "para garantir que todos passaram."
+        )
+        
+    # Limpar transição: só quem remove a chave conclui (sem conclusões duplicadas)
+    if not get_backend().delete(TRANSICAO_KEY.format(local=local)):
+        return MENSAGEM_TRANSICAO_ENCERRADA
+        
+    # Registrar tempo de fechamento
+    record_closure_time(local, int(tempo_decorrido * 60))  # converter para segundos
+    
+    # Aplicar o novo estado: o lado em transição fecha e o outro passa
+    outro = 'GOIO' if local == 'CENTER' else 'CENTER'
+    set_status({local: ESTADO_FECHADO, outro: ESTADO_ABERTO})
+    # Publicado depois do novo status: quem recebe o evento já lê o estado novo
+    publish(
+        TRANSICAO_CONCLUIDA, local=local, remetente=nome_remetente,
+        tempo_fechamento=int(tempo_decorrido * 60)
+    )
+    
+    return (
+        " ✅ *Transição Concluída*\n\n"
+        f"🟢 {'QC' if outro == 'CENTER' else 'Goioerê'} PASSANDO\n"
+        f"❌ {'QC' if local == 'CENTER' else 'Goioerê'} PARADO\n\n"
+        f"Confirmada por: {nome_remetente}"
+    )
+
+def cancel_transition(nome_remetente):
+    """Cancela a transição em andamento (!cancelar)"""
+    # Verificar se há transição ativa
+    transicao_center = get_backend().get(TRANSICAO_KEY.format(local='CENTER'))
+    transicao_goio = get_backend().get(TRANSICAO_KEY.format(local='GOIO'))
+    
+    if not transicao_center and not transicao_goio:
+        return (
+            " ❌ *Erro*\n"
+            "Não há transição em andamento\n"
+            "para cancelar."
+        )
+        
+    # Identificar qual local está em transição
+    local = 'CENTER' if transicao_center else 'GOIO'
+    
+    # Limpar transição
+    if not get_backend().delete(TRANSICAO_KEY.format(local=local)):
+        return MENSAGEM_TRANSICAO_ENCERRADA
+    publish(TRANSICAO_CANCELADA, local=local, remetente=nome_remetente)
+    
+    return (
+        " 🚫 *Transição Cancelada*\n"
+        f"Local: {local}\n"
+        f"Cancelada por: {nome_remetente}"
+    )
@@ -0,0 +1,332 @@
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from config import FAQ_LIMIAR, FAQ_LIMIAR_MODELO, FAQ_MODELO
+from services.circuit_breaker import get_breaker
+from services.clients import get_openai
+
+logger = logging.getLogger(__name__)
+
+# Perguntas frequentes do grupo. Cada entrada tem exemplos de como a pergunta
+# aparece e um modelo de resposta; os campos entre chaves são preenchidos com
+# os dados do momento (ver evolution_service.answer_question).
+FAQ = [
+    {
+        'id': 'tempo_espera',
+        'perguntas': [
+            'quanto tempo demora',
+            'quanto tempo fica fechado',
+            'demora muito pra abrir',
+            'quanto tempo falta',
+            'quanto tempo de espera',
+            'vai demorar muito'
+        ],
+        'resposta': (
+            " ⏱️ *Tempo de Espera*\n\n"
+            "Cada lado fica parado em média {tempo_medio}.\n"
+            "{previsao}"
+        )
+    },
+    {
+        'id': 'horario_abertura',
+        'perguntas': [
+            'que horas abre',
+            'quando vai abrir',
+            'que horas libera',
+            'vai liberar quando',
+            'quando libera pra passar',
+            'falta muito pra abrir'
+        ],
+        'resposta': " {status}\n\n{previsao}"
+    },
+    {
+        'id': 'lado_passando',
+        'perguntas': [
+            'qual lado esta passando',
+            'ta passando',
+            'ta liberado pra goioere',
+            'ta aberto pro quarto centenario',
+            'qc ta parado',
+            'goioere ta passando',
+            'ta fechado',
+            'ta aberto'
+        ],
+        'resposta': " {status}"
+    },
+    {
+        'id': 'clima',
+        'perguntas': [
+            'ta chovendo ai',
+            'como esta o tempo',
+            'vai chover',
+            'esta chovendo na pista',
+            'como ta o clima na rodovia',
+            'a pista ta molhada'
+        ],
+        'resposta': " {clima}"
+    },
+    {
+        'id': 'horario_pico',
+        'perguntas': [
+            'qual o horario de pico',
+            'que horas tem mais movimento',
+            'qual horario mais tranquilo',
+            'melhor horario pra passar',
+            'que horas fica mais cheio'
+        ],
+        'resposta': (
+            " 🕐 *Horários de Pico*\n\n"
+            "{picos}\n\n"
+            "Fora desses horários a espera costuma ser menor."
+        )
+    },
+    {
+        'id': 'pare_siga',
+        'perguntas': [
+            'como funciona o pare siga',
+            'por que esta fechado',
+            'que obra e essa',
+            'porque tem que esperar',
+            'por que so passa um lado'
+        ],
+        'resposta': (
+            " 🚧 *PARE/SIGA*\n\n"
+            "Por causa da obra só uma faixa da PR-180 está liberada.\n"
+            "Os carros passam um sentido de cada vez: enquanto um lado\n"
+            "passa, o outro aguarda. {status_resumo}"
+        )
+    },
+    {
+        'id': 'comandos',
+        'perguntas': [
+            'como usa o bot',
+            'quais sao os comandos',
+            'como atualizo o status',
+            'como eu aviso que abriu',
+            'o que o bot faz'
+        ],
+        'resposta': (
+            " 🤖 Use *!status* para ver a situação, *!alterna* quando o\n"
+            "lado mudar e *!ajuda* para ver todos os comandos."
+        )
+    }
+]
+
+# Palavras que não ajudam a distinguir as perguntas
+STOPWORDS = {
+    'a', 'o', 'as', 'os', 'de', 'do', 'da', 'dos', 'das', 'e', 'que', 'um',
+    'uma', 'no', 'na', 'em', 'para', 'por', 'ai', 'la', 'aqui', 'ja', 'me',
+    'eu', 'voce', 'se', 'isso', 'esse', 'essa', 'ou', 'com', 'ao', 'hoje',
+    'agora', 'gente', 'alguem', 'sabe', 'pessoal', 'sao', 'foi'
+}
+
+# Abreviações comuns no grupo
+ABREVIACOES = {
+    'ta': 'esta', 'to': 'estou', 'pra': 'para', 'pro': 'para', 'q': 'que',
+    'vc': 'voce', 'qdo': 'quando', 'qnd': 'quando', 'hj': 'hoje', 'pq': 'porque'
+}
+
+# Prefixos de uma mesma família de palavras (chovendo, chuva, chover...)
+RADICAIS = [
+    ('chov', 'chuva'), ('chuv', 'chuva'),
+    ('demor', 'demora'), ('esper', 'demora'),
+    ('liber', 'abrir'), ('abr', 'abrir'), ('abert', 'aberto'),
+    ('fech', 'fechado'), ('parad', 'fechado'),
+    ('pass', 'passar'), ('hora', 'hora'), ('movimen', 'movimento')
+]
+
+# Início típico de perguntas sem o ponto de interrogação
+INTERROGATIVAS = (
+    'quanto', 'quantos', 'quanta', 'quantas', 'que hora', 'que horas',
+    'qual', 'quais', 'quando', 'como', 'onde',
+    'por que', 'porque', 'sera', 'alguem sabe'
+)
+
+# Palavras inteiras ("qualquer" não é "qual"); expressões que começam como
+# pergunta mas não são ("como assim kkk") só contam com o ponto de interrogação
+_INTERROGATIVA_RE = re.compile(r'(?:' + '|'.join(INTERROGATIVAS) + r')\b')
+EXPRESSOES = ('como assim', 'como sempre', 'quando puder')
+_EXPRESSAO_RE = re.compile(r'(?:' + '|'.join(EXPRESSOES) + r')\b')
+
+COMPRIMENTO_RADICAL = 6
+
+faq_breaker = get_breaker('openai')
+
+_indice = None
+_indice_lock = threading.Lock()
+_contadores = {'locais': 0, 'modelo': 0, 'sem_resposta': 0, 'fora_do_tema': 0}
+_contadores_lock = threading.Lock()
+
+def _normalize(texto):
+    texto = unicodedata.normalize('NFD', texto.lower())
+    return ''.join(c for c in texto if unicodedata.category(c) != 'Mn')
+
+def tokenize(texto):
+    """Termos de um texto: sem acentos, sem stopwords e reduzidos ao radical"""
+    termos = []
+    # "por que" vira uma palavra só (pergunta pelo motivo, não pelo status)
+    texto = re.sub(r'\bpor que\b', 'porque', _normalize(texto))
+    for palavra in re.findall(r'[a-z0-9]+', texto):
+        palavra = ABREVIACOES.get(palavra, palavra)
+        if palavra in STOPWORDS:
+            continue
+        for prefixo, radical in RADICAIS:
+            if palavra.startswith(prefixo):
+                palavra = radical
+                break
+        else:
+            palavra = palavra[:COMPRIMENTO_RADICAL]
+        termos.append(palavra)
+    return termos
+
+def is_question(texto):
+    """Indica se a mensagem parece uma pergunta"""
+    texto = _normalize(texto or '').strip()
+    if '?' in texto:
+        return True
+    return bool(_INTERROGATIVA_RE.match(texto)) and not _EXPRESSAO_RE.match(texto)
+
+def _count(nome):
+    with _contadores_lock:
+        _contadores[nome] += 1
+
+class FaqIndex:
+    """
+    Índice invertido com vetores TF-IDF normalizados dos exemplos de cada
+    pergunta. A busca soma pesos só das listas dos termos da mensagem
+    (similaridade do cosseno) e fica bem abaixo de um milissegundo.
+    """
+
+    def __init__(self, entradas):
+        self.entradas = entradas
+        documentos = [
+            (entrada, tokenize(pergunta))
+            for entrada in entradas for pergunta in entrada['perguntas']
+        ]
+        self.documentos = [entrada for entrada, _ in documentos]
+        frequencia = Counter(termo for _, termos in documentos for termo in set(termos))
+        total = len(documentos)
+        # IDF suavizado; termos fora do vocabulário recebem o maior peso
+        self.idf = {termo: math.log((1 + total) / (1 + df)) + 1 for termo, df in frequencia.items()}
+        self.idf_desconhecido = math.log(1 + total) + 1
+        self.postings = defaultdict(list)
+        for i, (_, termos) in enumerate(documentos):
+            for termo, peso in self._vector(termos).items():
+                self.postings[termo].append((i, peso))
+
+    def _vector(self, termos):
+        pesos = {
+            termo: quantidade * self.idf.get(termo, self.idf_desconhecido)
+            for termo, quantidade in Counter(termos).items()
+        }
+        norma = math.sqrt(sum(peso * peso for peso in pesos.values())) or 1.0
+        return {termo: peso / norma for termo, peso in pesos.items()}
+
+    def search(self, texto):
+        """Retorna (entrada, similaridade) da pergunta mais parecida, ou (None, 0.0)"""
+        pontuacao = defaultdict(float)
+        for termo, peso in self._vector(tokenize(texto)).items():
+            for i, peso_documento in self.postings.get(termo, ()):
+                pontuacao[i] += peso * peso_documento
+        if not pontuacao:
+            return None, 0.0
+        melhor = max(pontuacao, key=pontuacao.get)
+        return self.documentos[melhor], pontuacao[melhor]
+
+def build_index():
+    """Monta o índice das perguntas frequentes (chamado na inicialização)"""
+    global _indice
+    with _indice_lock:
+        _indice = FaqIndex(FAQ)
+    logger.info(f"Índice de perguntas frequentes: {len(_indice.documentos)} exemplos, {len(_indice.idf)} termos")
+    return _indice
+
+def get_index():
+    return _indice or build_index()
+
+def match(texto):
+    """
+    (entrada, similaridade) da pergunta frequente mais parecida; a entrada
+    é None abaixo de FAQ_LIMIAR
+    """
+    entrada, similaridade = get_index().search(texto)
+    if entrada and similaridade >= FAQ_LIMIAR:
+        _count('locais')
+        logger.info(f"Pergunta frequente '{entrada['id']}' (similaridade {similaridade:.2f})")
+        return entrada, similaridade
+    return None, similaridade
+
+def is_on_topic(similaridade):
+    """
+    Indica se vale consultar o modelo: abaixo de FAQ_LIMIAR_MODELO a pergunta
+    não tem relação com as perguntas frequentes (conversa do grupo)
+    """
+    if similaridade >= FAQ_LIMIAR_MODELO:
+        return True
+    _count('fora_do_tema')
+    return False
+
+class _Contexto(dict):
+    """Preenche os campos do modelo de resposta sob demanda (só o que é usado é calculado)"""
+
+    def __init__(self, fontes):
+        super().__init__()
+        self.fontes = fontes
+
+    def __missing__(self, campo):
+        valor = self.fontes[campo]()
+        self[campo] = valor
+        return valor
+
+def render_answer(entrada, fontes):
+    """Monta a resposta da entrada; fontes: {campo: função que retorna o texto}"""
+    return entrada['resposta'].format_map(_Contexto(fontes))
+
+def ask_model(pergunta, contexto):
+    """
+    Pergunta ao modelo remoto (abaixo do limiar de similaridade). Retorna
+    None sem chave da API, com o circuito aberto ou em caso de erro
+    """
+    if not FAQ_MODELO or not os.getenv('OPENAI_API_KEY'):
+        _count('sem_resposta')
+        return None
+    if not faq_breaker.allow():
+        logger.warning("Circuito da OpenAI aberto, pergunta sem resposta")
+        _count('sem_resposta')
+        return None
+
+    try:
+        resposta = get_openai().ChatCompletion.create(
+            model=FAQ_MODELO,
+            messages=[
+                {
+                    'role': 'system',
+                    'content': (
+                        "Você é o bot do PARE/SIGA da PR-180 entre Quarto Centenário (QC) "
+                        "e Goioerê. Responda em português, em até três linhas, usando apenas "
+                        f"estas informações:\n{contexto}"
+                    )
+                },
+                {'role': 'user', 'content': pergunta}
+            ],
+            max_tokens=200,
+            temperature=0.3,
+            request_timeout=10
+        )
+    except Exception as e:
+        faq_breaker.record_failure()
+        logger.error(f"Erro ao consultar o modelo: {e}")
+        _count('sem_resposta')
+        return None
+
+    faq_breaker.record_success()
+    _count('modelo')
+    return f" {resposta['choices'][0]['message']['content'].strip()}"
+
+def stats():
+    with _contadores_lock:
+        return dict(_contadores)
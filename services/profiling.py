@@ -0,0 +1,135 @@
+import cProfile
+import glob
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from config import PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_MAX_ARQUIVOS
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+def _novo_arquivo(prefixo, extensao):
+    """Gera o caminho de um novo arquivo de perfil e remove os mais antigos"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    arquivos = sorted(glob.glob(os.path.join(PROFILE_DIR, f"*.{extensao}")), key=os.path.getmtime)
+    for antigo in arquivos[:max(len(arquivos) - PROFILE_MAX_ARQUIVOS + 1, 0)]:
+        os.remove(antigo)
+    nome = f"{prefixo}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.randint(0, 9999):04d}.{extensao}"
+    return os.path.join(PROFILE_DIR, nome)
+
+def should_profile(forcar=False):
+    """Decide se a requisição atual será perfilada (amostragem ou pedido do admin)"""
+    return forcar or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+@contextmanager
+def profile_request(nome):
+    """Perfila o bloco com cProfile e grava um arquivo .pstats"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            caminho = _novo_arquivo(nome, 'pstats')
+            profiler.dump_stats(caminho)
+            logger.info(f"Perfil gravado em {caminho}")
+        except Exception as e:
+            logger.error(f"Erro ao gravar perfil: {e}")
+
+class StackSampler:
+    """
+    Amostrador de pilhas de baixo custo: a cada intervalo lê as pilhas de
+    todas as threads e acumula no formato "collapsed" (flamegraph.pl,
+    speedscope).
+    """
+
+    def __init__(self, segundos, intervalo=0.005):
+        self.segundos = segundos
+        self.intervalo = intervalo
+        self.amostras = Counter()
+        self.inicio = None
+        self.caminho = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _pilha(self, frame):
+        partes = []
+        while frame is not None:
+            codigo = frame.f_code
+            partes.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(partes))
+
+    def _run(self):
+        proprio = threading.get_ident()
+        fim = self.inicio + self.segundos
+        while not self._parar.is_set() and time.monotonic() < fim:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != proprio:
+                    self.amostras[self._pilha(frame)] += 1
+            time.sleep(self.intervalo)
+        self._gravar()
+
+    def _gravar(self):
+        try:
+            self.caminho = _novo_arquivo('sessao', 'folded')
+            with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+                for pilha, total in self.amostras.most_common():
+                    arquivo.write(f"{pilha} {total}\n")
+            logger.info(f"Sessão de profiling gravada em {self.caminho}")
+        except Exception as e:
+            logger.error(f"Erro ao gravar sessão de profiling: {e}")
+
+    def start(self):
+        self.inicio = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._parar.set()
+        self._thread.join()
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        return {
+            'ativo': self.ativo,
+            'segundos': self.segundos,
+            'intervalo': self.intervalo,
+            'decorrido': round(time.monotonic() - self.inicio, 1) if self.inicio else 0,
+            'amostras': sum(self.amostras.values()),
+            'arquivo': self.caminho
+        }
+
+def start_session(segundos=30, intervalo=0.005):
+    """Inicia uma sessão de profiling com tempo limitado neste processo"""
+    global _session
+    with _session_lock:
+        if _session and _session.ativo:
+            return None
+        _session = StackSampler(segundos, intervalo)
+        _session.start()
+        return _session.status()
+
+def stop_session():
+    """Encerra a sessão atual e retorna seu resumo"""
+    with _session_lock:
+        if not _session:
+            return None
+        if _session.ativo:
+            _session.stop()
+        return _session.status()
+
+def session_status():
+    """Retorna o resumo da sessão atual (ou da última)"""
+    return _session.status() if _session else None
@@ -0,0 +1,87 @@
+import logging
+from collections import defaultdict
+from services.clients import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Chaves antigas sem ':' com um sufixo por usuário ou lado
+PREFIXOS_SEM_SEPARADOR = ('last_action_', 'confirmation_', 'transicao_')
+
+LOTE_SCAN = 1000
+
+def key_family(chave):
+    """Agrupa chaves da mesma família (ex.: usuarios:confirmacao:*, estado:*)"""
+    partes = chave.split(':')
+    if len(partes) > 2:
+        return ':'.join(partes[:2])
+    if len(partes) == 2:
+        return partes[0]
+    for prefixo in PREFIXOS_SEM_SEPARADOR:
+        if chave.startswith(prefixo):
+            return prefixo + '*'
+    return chave
+
+def _measure(redis, chaves):
+    """MEMORY USAGE e codificação de um lote de chaves em uma ida ao Redis"""
+    pipe = redis.pipeline(transaction=False)
+    for chave in chaves:
+        pipe.memory_usage(chave)
+        pipe.object('encoding', chave)
+    resultados = pipe.execute(raise_on_error=False)
+    # Erros (ex.: chave expirada entre o SCAN e a medição) contam como zero
+    return [
+        (
+            resultados[i] if isinstance(resultados[i], int) else 0,
+            resultados[i + 1] if isinstance(resultados[i + 1], str) else None
+        )
+        for i in range(0, len(resultados), 2)
+    ]
+
+def memory_report(amostra=200):
+    """
+    Percorre o keyspace com SCAN e estima a memória por família de chaves.
+    Até `amostra` chaves por família são medidas com MEMORY USAGE e o total
+    é extrapolado pela contagem de chaves da família.
+    """
+    redis = get_redis()
+    contagem = defaultdict(int)
+    amostras = defaultdict(list)
+    for chave in redis.scan_iter(count=LOTE_SCAN):
+        familia = key_family(chave)
+        contagem[familia] += 1
+        if len(amostras[familia]) < amostra:
+            amostras[familia].append(chave)
+
+    familias = []
+    for familia, chaves in amostras.items():
+        medidas = _measure(redis, chaves)
+        medido = sum(bytes_ for bytes_, _ in medidas)
+        codificacoes = defaultdict(int)
+        for _, codificacao in medidas:
+            codificacoes[codificacao or 'desconhecida'] += 1
+        familias.append({
+            'familia': familia,
+            'chaves': contagem[familia],
+            'amostra': len(chaves),
+            'bytes_por_chave': round(medido / len(chaves)),
+            'bytes_estimados': round(medido / len(chaves) * contagem[familia]),
+            'codificacoes': dict(codificacoes)
+        })
+    familias.sort(key=lambda item: item['bytes_estimados'], reverse=True)
+
+    try:
+        memoria = redis.info('memory')
+        total = {
+            'used_memory': memoria.get('used_memory'),
+            'used_memory_human': memoria.get('used_memory_human'),
+            'maxmemory': memoria.get('maxmemory')
+        }
+    except Exception as e:
+        logger.error(f"Erro ao ler INFO memory: {e}")
+        total = {}
+
+    return {
+        'total': total,
+        'chaves': sum(contagem.values()),
+        'familias': familias
+    }
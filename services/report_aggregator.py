@@ -0,0 +1,138 @@
+import logging
+from config import RELATOS_JANELA, RELATOS_QUORUM, RELATOS_PESO_MAX, RELATOS_PESO_VALIDADE
+from services.state_backend import get_backend, Script
+from services.timeutil import now_epoch
+
+logger = logging.getLogger(__name__)
+
+# Relatos em texto livre ("fechado", "passando"...) de um trecho: sorted set
+# com um membro por remetente e o instante do relato como score
+RELATOS_KEY = 'relatos:{segmento}'
+
+# Peso de cada remetente (padrão 1.0); quem participa de um quórum que
+# muda o status ganha PESO_BONUS até RELATOS_PESO_MAX. O bônus volta ao
+# padrão linearmente em RELATOS_PESO_VALIDADE segundos desde o último
+# prêmio (instantes em um sorted set); depois disso o campo é removido, no
+# máximo LIMPEZA_LOTE por relato, e sem relatos as duas chaves expiram
+PESOS_KEY = 'relatos:pesos'
+PESOS_INSTANTES_KEY = 'relatos:pesos:instantes'
+PESO_PADRAO = 1.0
+PESO_BONUS = 0.1
+LIMPEZA_LOTE = 100
+
+def _peso_python(pesos, instantes, membro, agora, padrao, validade):
+    if membro not in pesos:
+        return padrao
+    idade = agora - instantes.get(membro, agora)
+    return padrao + (float(pesos[membro]) - padrao) * max(0.0, 1 - idade / validade)
+
+# Registra o relato, descarta os antigos e soma os pesos com decaimento
+# linear pela idade (um relato no fim da janela vale metade). Ao atingir o
+# quórum apaga a janela e premia os remetentes, tudo de forma atômica:
+# só um dos relatos simultâneos recebe o resultado 1. No backend em memória
+# os sorted sets são dicionários membro -> instante.
+def _report_python(backend, chaves, args):
+    remetente, agora, janela, inicio, quorum, padrao, bonus, maximo, validade = args
+    agora, janela, inicio = float(agora), float(janela), float(inicio)
+    padrao, validade = float(padrao), float(validade)
+    relatos = dict(backend.lookup(chaves[0], {}))
+    relatos[remetente] = agora
+    relatos = {membro: score for membro, score in relatos.items() if score >= inicio}
+    backend.store(chaves[0], relatos, ttl=janela)
+
+    pesos = dict(backend.lookup(chaves[1], {}))
+    instantes = dict(backend.lookup(chaves[2], {}))
+    antigos = [membro for membro, score in instantes.items() if score < agora - validade]
+    for membro in antigos[:LIMPEZA_LOTE]:
+        pesos.pop(membro, None)
+        instantes.pop(membro, None)
+
+    total = sum(
+        _peso_python(pesos, instantes, membro, agora, padrao, validade) * (1 - 0.5 * (agora - score) / janela)
+        for membro, score in relatos.items()
+    )
+    decidiu = total >= float(quorum)
+    if decidiu:
+        backend.delete(chaves[0])
+        for membro in relatos:
+            peso = _peso_python(pesos, instantes, membro, agora, padrao, validade)
+            pesos[membro] = str(min(peso + float(bonus), float(maximo)))
+            instantes[membro] = agora
+    if pesos:
+        # Como o EXPIRE do script: o prazo só é renovado quando há prêmio
+        backend.store(chaves[1], pesos, ttl=validade if decidiu else None, manter_ttl=not decidiu)
+        backend.store(chaves[2], instantes, ttl=validade if decidiu else None, manter_ttl=not decidiu)
+    else:
+        backend.delete(chaves[1], chaves[2])
+    return [1 if decidiu else 0, str(total), len(relatos)]
+
+_REPORT_SCRIPT = Script(f"""
+local agora = tonumber(ARGV[2])
+local janela = tonumber(ARGV[3])
+local padrao = tonumber(ARGV[6])
+local validade = tonumber(ARGV[9])
+redis.call('zadd', KEYS[1], agora, ARGV[1])
+redis.call('zremrangebyscore', KEYS[1], '-inf', '(' .. ARGV[4])
+redis.call('expire', KEYS[1], janela)
+
+local antigos = redis.call('zrangebyscore', KEYS[3], '-inf', '(' .. (agora - validade), 'LIMIT', 0, {LIMPEZA_LOTE})
+for _, membro in ipairs(antigos) do
+    redis.call('hdel', KEYS[2], membro)
+    redis.call('zrem', KEYS[3], membro)
+end
+
+local function peso(membro)
+    local valor = redis.call('hget', KEYS[2], membro)
+    if not valor then
+        return padrao
+    end
+    local idade = agora - (tonumber(redis.call('zscore', KEYS[3], membro)) or agora)
+    return padrao + (tonumber(valor) - padrao) * math.max(0, 1 - idade / validade)
+end
+
+local relatos = redis.call('zrange', KEYS[1], 0, -1, 'WITHSCORES')
+local total = 0
+for i = 1, #relatos, 2 do
+    local idade = agora - tonumber(relatos[i + 1])
+    total = total + peso(relatos[i]) * (1 - 0.5 * idade / janela)
+end
+
+if total < tonumber(ARGV[5]) then
+    return {{0, tostring(total), #relatos / 2}}
+end
+
+redis.call('del', KEYS[1])
+for i = 1, #relatos, 2 do
+    local novo = math.min(peso(relatos[i]) + tonumber(ARGV[7]), tonumber(ARGV[8]))
+    redis.call('hset', KEYS[2], relatos[i], tostring(novo))
+    redis.call('zadd', KEYS[3], agora, relatos[i])
+end
+redis.call('expire', KEYS[2], validade)
+redis.call('expire', KEYS[3], validade)
+return {{1, tostring(total), #relatos / 2}}
+""", _report_python)
+
+def submit_report(segmento, remetente, desde=None):
+    """
+    Registra o relato de um remetente sobre um trecho. Relatos anteriores a
+    `desde` (ex.: a última mudança de status) não contam.
+    Retorna (quorum_atingido, peso_total, quantidade_de_relatos).
+    """
+    agora = now_epoch()
+    inicio = agora - RELATOS_JANELA
+    if desde:
+        inicio = min(max(inicio, desde), agora)
+
+    decidiu, total, quantidade = get_backend().run_script(
+        _REPORT_SCRIPT,
+        [RELATOS_KEY.format(segmento=segmento), PESOS_KEY, PESOS_INSTANTES_KEY],
+        [remetente, agora, RELATOS_JANELA, inicio, RELATOS_QUORUM,
+         PESO_PADRAO, PESO_BONUS, RELATOS_PESO_MAX, RELATOS_PESO_VALIDADE]
+    )
+    total = float(total)
+    logger.info(f"Relato de {remetente} em {segmento}: {quantidade} relatos, peso {total:.2f}/{RELATOS_QUORUM}")
+    return bool(decidiu), total, int(quantidade)
+
+def clear_reports(segmento):
+    """Descarta os relatos pendentes de um trecho (ex.: após uma mudança explícita)"""
+    get_backend().delete(RELATOS_KEY.format(segmento=segmento))
@@ -0,0 +1,137 @@
+import json
+import logging
+from database import current_day, get_daily_stats, get_weather_status, load_status_dependencies
+from services.cache import status_cache, weather_cache, stats_cache
+from services.clients import get_redis
+from services.state_backend import get_backend, uses_redis
+from services.state_repository import ESTADO_KEY, LADOS, get_status, parse_status
+
+logger = logging.getLogger(__name__)
+
+# Dependências que um handler pode declarar
+STATUS = 'status'
+CLIMA = 'clima'
+ESTATISTICAS = 'estatisticas'
+
+CLIMA_CHAVE = 'atual'
+
+class RequestContext:
+    """
+    Dados de que uma resposta precisa, declarados de antemão e carregados de
+    uma vez: o que não está no L1 dos caches vem em uma única ida ao Redis
+    (pipeline com os hashes de status e o L2 de clima e estatísticas) e, se
+    ainda faltar algo, em uma única transação de leitura no SQLite.
+    """
+
+    def __init__(self, *necessidades):
+        self.necessidades = set(necessidades)
+        self.status = {}  # lado -> (status, ultima_atualizacao)
+        self.clima = None
+        self.estatisticas = None
+        self.dia = current_day()
+
+    def _status_pendentes(self):
+        pendentes = []
+        for lado in LADOS:
+            encontrado, valor = status_cache.peek(lado)
+            if encontrado:
+                self.status[lado] = tuple(valor)
+            else:
+                pendentes.append(lado)
+        return pendentes
+
+    def _fetch(self, lados, caches):
+        """Hashes de status e valores no L2 em uma ida ao backend"""
+        chaves_estado = [ESTADO_KEY.format(lado=lado) for lado in lados]
+        if not uses_redis():
+            # Sem Redis não há L2; o estado em memória não custa ida à rede
+            backend = get_backend()
+            return [backend.hgetall(chave) for chave in chaves_estado], [None] * len(caches)
+
+        pipe = get_redis().pipeline(transaction=False)
+        for chave in chaves_estado:
+            pipe.hgetall(chave)
+        for cache, chave in caches:
+            pipe.get(cache.l2_key(chave))
+        resultados = pipe.execute()
+        return resultados[:len(lados)], resultados[len(lados):]
+
+    def _store_l2(self, valores):
+        if not valores or not uses_redis():
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for cache, chave, valor in valores:
+                pipe.set(cache.l2_key(chave), json.dumps(valor), ex=cache.l2_ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Erro ao gravar caches no Redis: {e}")
+
+    def load(self):
+        """Carrega todas as dependências declaradas. Retorna o próprio contexto"""
+        try:
+            self._load_batch()
+        except Exception as e:
+            # Caminho normal, item a item, com o tratamento de erro de cada leitor
+            logger.error(f"Erro ao carregar o contexto da requisição: {e}")
+            self._load_each()
+        return self
+
+    def _load_each(self):
+        if STATUS in self.necessidades:
+            self.status = {lado: get_status(lado) for lado in LADOS}
+        if CLIMA in self.necessidades:
+            self.clima = get_weather_status()
+        if ESTATISTICAS in self.necessidades:
+            self.estatisticas = get_daily_stats()
+
+    def _load_batch(self):
+        lados = self._status_pendentes() if STATUS in self.necessidades else []
+
+        # Clima e estatísticas: primeiro o L1 de cada cache
+        pendentes = []
+        if CLIMA in self.necessidades:
+            encontrado, self.clima = weather_cache.peek(CLIMA_CHAVE)
+            if not encontrado:
+                pendentes.append((CLIMA, weather_cache, CLIMA_CHAVE))
+        if ESTATISTICAS in self.necessidades:
+            dia = self.dia.strftime('%Y-%m-%d')
+            encontrado, self.estatisticas = stats_cache.peek(dia)
+            if not encontrado:
+                pendentes.append((ESTATISTICAS, stats_cache, dia))
+        if not lados and not pendentes:
+            return
+
+        estados, brutos = self._fetch(lados, [(cache, chave) for _, cache, chave in pendentes])
+        for lado, estado in zip(lados, estados):
+            # Hash ausente: restaurar do SQLite pelo caminho normal
+            valor = parse_status(estado) if estado else get_status(lado, usar_cache=False)
+            # (None, None) é falha de leitura: não fica no cache até o próximo TTL
+            if valor[0] is not None:
+                status_cache.fill(lado, valor)
+            self.status[lado] = valor
+
+        faltando = []
+        for (nome, cache, chave), bruto in zip(pendentes, brutos):
+            if bruto is None:
+                faltando.append((nome, cache, chave))
+                continue
+            valor = json.loads(bruto)
+            cache.fill(chave, valor, do_l2=True)
+            setattr(self, nome, valor)
+        if not faltando:
+            return
+
+        nomes = {nome for nome, _, _ in faltando}
+        lidos = load_status_dependencies(
+            clima=CLIMA in nomes,
+            dia=self.dia if ESTATISTICAS in nomes else None
+        )
+        for nome, cache, chave in faltando:
+            cache.fill(chave, lidos[nome])
+            setattr(self, nome, lidos[nome])
+        self._store_l2([(cache, chave, lidos[nome]) for nome, cache, chave in faltando])
+
+def load_context(*necessidades):
+    """Cria e carrega um RequestContext com as dependências informadas"""
+    return RequestContext(*necessidades).load()
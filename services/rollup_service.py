@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from database import connect_db
+from services.shared_state import try_acquire_interval
+from services.timeutil import now_epoch, format_epoch
+from config import (
+    BR_TIMEZONE, ROLLUP_INTERVALO,
+    RETENCAO_FECHAMENTOS_DIAS, RETENCAO_ROLLUP_HORA_DIAS
+)
+
+logger = logging.getLogger(__name__)
+
+# Chave do último fechamento bruto já agregado
+WATERMARK_KEY = 'ultimo_id_fechamento'
+
+# Agenda compartilhada: apenas um worker compacta por intervalo
+COMPACTOR_SCHEDULE_KEY = 'agenda_rollup'
+
+# Quantidade máxima de fechamentos brutos agregados por transação
+ROLLUP_LOTE = 5000
+
+# Períodos aceitos pelo relatório (em dias)
+PERIODOS_RELATORIO = {
+    'semana': 7,
+    'mes': 30,
+    'ano': 365
+}
+
+DIAS_SEMANA = ['Domingo', 'Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado']
+
+_compactor_thread = None
+
+def _condicao_chuva(condicao):
+    """Indica se a condição do clima registrada é de chuva"""
+    return bool(condicao) and 'chuva' in condicao.lower()
+
+def compact_rollups():
+    """
+    Agrega fechamentos brutos em buckets por hora, recalcula os dias
+    afetados a partir das horas e aplica a retenção dos dados brutos.
+    Retorna a quantidade de fechamentos agregados.
+    """
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        # Lock de escrita desde o início para que dois compactadores
+        # nunca agreguem o mesmo intervalo de ids
+        cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("SELECT valor FROM rollup_estado WHERE chave = ?", (WATERMARK_KEY,))
+        result = cursor.fetchone()
+        ultimo_id = result[0] if result else 0
+
+        cursor.execute("""
+            SELECT f.id, f.lado, f.tempo_fechamento, f.timestamp,
+                   (SELECT c.condicao FROM clima c
+                    WHERE c.ultima_atualizacao <= f.timestamp
+                    ORDER BY c.ultima_atualizacao DESC LIMIT 1)
+            FROM fechamentos f
+            WHERE f.id > ?
+            ORDER BY f.id
+            LIMIT ?
+        """, (ultimo_id, ROLLUP_LOTE))
+        linhas = cursor.fetchall()
+
+        horas = {}
+        for id_, lado, tempo, timestamp, condicao in linhas:
+            chave = (format_epoch(timestamp, '%Y-%m-%d %H'), lado)
+            total, soma, total_chuva, soma_chuva = horas.get(chave, (0, 0, 0, 0))
+            chuva = _condicao_chuva(condicao)
+            horas[chave] = (
+                total + 1,
+                soma + tempo,
+                total_chuva + (1 if chuva else 0),
+                soma_chuva + (tempo if chuva else 0)
+            )
+            ultimo_id = id_
+
+        if horas:
+            cursor.executemany("""
+                INSERT INTO fechamentos_hora (hora, lado, total, soma_tempo, total_chuva, soma_tempo_chuva)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (hora, lado) DO UPDATE SET
+                    total = total + excluded.total,
+                    soma_tempo = soma_tempo + excluded.soma_tempo,
+                    total_chuva = total_chuva + excluded.total_chuva,
+                    soma_tempo_chuva = soma_tempo_chuva + excluded.soma_tempo_chuva
+            """, [(hora, lado) + valores for (hora, lado), valores in horas.items()])
+
+            # Recalcular os dias afetados a partir dos agregados por hora
+            dias = sorted({hora[:10] for hora, _ in horas})
+            cursor.executemany("""
+                INSERT OR REPLACE INTO fechamentos_dia
+                    (dia, lado, dia_semana, total, soma_tempo, total_chuva, soma_tempo_chuva)
+                SELECT substr(hora, 1, 10), lado, CAST(strftime('%w', substr(hora, 1, 10)) AS INTEGER),
+                       SUM(total), SUM(soma_tempo), SUM(total_chuva), SUM(soma_tempo_chuva)
+                FROM fechamentos_hora
+                WHERE hora >= ? AND hora < ?
+                GROUP BY substr(hora, 1, 10), lado
+            """, [(dia, dia + '~') for dia in dias])
+
+            cursor.execute(
+                "INSERT OR REPLACE INTO rollup_estado (chave, valor) VALUES (?, ?)",
+                (WATERMARK_KEY, ultimo_id)
+            )
+
+        # Retenção: dados brutos só são apagados depois de agregados
+        agora = now_epoch()
+        cursor.execute(
+            "DELETE FROM fechamentos WHERE id <= ? AND timestamp < ?",
+            (ultimo_id, agora - RETENCAO_FECHAMENTOS_DIAS * 86400)
+        )
+        limite_hora = format_epoch(agora - RETENCAO_ROLLUP_HORA_DIAS * 86400, '%Y-%m-%d %H')
+        cursor.execute("DELETE FROM fechamentos_hora WHERE hora < ?", (limite_hora,))
+
+        conn.commit()
+        return len(linhas)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _compactor_loop():
+    """Executa a compactação periodicamente"""
+    while True:
+        try:
+            if try_acquire_interval(COMPACTOR_SCHEDULE_KEY, ROLLUP_INTERVALO - 1):
+                # Esvaziar o backlog em lotes antes de dormir
+                while compact_rollups() >= ROLLUP_LOTE:
+                    pass
+        except Exception as e:
+            logger.error(f"Erro ao compactar agregados: {e}")
+        time.sleep(ROLLUP_INTERVALO)
+
+def start_compactor():
+    """Inicia o compactador de agregados em segundo plano"""
+    global _compactor_thread
+    if _compactor_thread and _compactor_thread.is_alive():
+        return _compactor_thread
+
+    _compactor_thread = threading.Thread(target=_compactor_loop, name='rollup-compactor', daemon=True)
+    _compactor_thread.start()
+    logger.info(f"Compactador de agregados iniciado (intervalo de {ROLLUP_INTERVALO}s)")
+    return _compactor_thread
+
+def _dias_no_periodo(inicio, fim):
+    """Conta quantas vezes cada dia da semana (0 = domingo) aparece no intervalo"""
+    contagem = [0] * 7
+    dia = inicio
+    while dia <= fim:
+        contagem[(dia.weekday() + 1) % 7] += 1
+        dia += timedelta(days=1)
+    return contagem
+
+def get_report(periodo='semana'):
+    """Retorna o relatório de um período lendo apenas os agregados"""
+    dias = PERIODOS_RELATORIO.get(periodo)
+    if not dias:
+        return None
+
+    hoje = datetime.now(BR_TIMEZONE).date()
+    inicio = hoje - timedelta(days=dias - 1)
+    inicio_str = inicio.strftime('%Y-%m-%d')
+
+    conn = connect_db()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT MIN(dia), SUM(total), SUM(soma_tempo), SUM(total_chuva), SUM(soma_tempo_chuva)
+        FROM fechamentos_dia
+        WHERE dia >= ?
+    """, (inicio_str,))
+    primeiro_dia, total, soma, total_chuva, soma_chuva = cursor.fetchone()
+
+    # Horários mais movimentados
+    cursor.execute("""
+        SELECT substr(hora, 12, 2) AS h, SUM(total) AS total
+        FROM fechamentos_hora
+        WHERE hora >= ?
+        GROUP BY h
+        ORDER BY total DESC
+        LIMIT 3
+    """, (inicio_str,))
+    horarios_pico = [(f"{h}:00", t) for h, t in cursor.fetchall()]
+
+    # Fechamentos por dia da semana
+    cursor.execute("""
+        SELECT dia_semana, SUM(total)
+        FROM fechamentos_dia
+        WHERE dia >= ?
+        GROUP BY dia_semana
+    """, (inicio_str,))
+    por_dia_semana = dict(cursor.fetchall())
+    conn.close()
+
+    if not total:
+        return {
+            'periodo': periodo,
+            'total_fechamentos': 0,
+            'tempo_medio': 0,
+            'horarios_pico': [],
+            'media_por_dia_semana': {},
+            'tempo_medio_chuva': None,
+            'tempo_medio_sem_chuva': None
+        }
+
+    # Médias consideram apenas os dias desde o primeiro registro do período
+    inicio_dados = max(inicio, datetime.strptime(primeiro_dia, '%Y-%m-%d').date())
+    ocorrencias = _dias_no_periodo(inicio_dados, hoje)
+    media_por_dia_semana = {
+        DIAS_SEMANA[d]: round(por_dia_semana.get(d, 0) / ocorrencias[d], 1)
+        for d in range(7) if ocorrencias[d]
+    }
+
+    total_seco = total - total_chuva
+    return {
+        'periodo': periodo,
+        'total_fechamentos': total,
+        'tempo_medio': int(soma / total),
+        'horarios_pico': horarios_pico,
+        'media_por_dia_semana': media_por_dia_semana,
+        'tempo_medio_chuva': int(soma_chuva / total_chuva) if total_chuva else None,
+        'tempo_medio_sem_chuva': int((soma - soma_chuva) / total_seco) if total_seco else None
+    }
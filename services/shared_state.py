@@ -0,0 +1,45 @@
+import logging
+import sqlite3
+import time
+from config import SHARED_STATE_BACKEND, SHARED_STATE_PATH
+from services.state_backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Estado compartilhado entre processos (workers). Com Redis o estado vale
+# para todos os nós; o modo 'local' usa um arquivo SQLite como substituto
+# para vários workers na mesma máquina sem Redis. Nos demais casos vale o
+# backend de estado (STATE_BACKEND).
+
+def _connect_local():
+    conn = sqlite3.connect(SHARED_STATE_PATH, timeout=5, isolation_level=None)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS estado_compartilhado (
+        chave TEXT PRIMARY KEY,
+        expira_em REAL NOT NULL
+    )
+    ''')
+    return conn
+
+def _try_acquire_local(chave, segundos):
+    agora = time.time()
+    conn = _connect_local()
+    try:
+        # Um único UPSERT condicional: só grava se a chave não existe ou já expirou
+        cursor = conn.execute('''
+            INSERT INTO estado_compartilhado (chave, expira_em) VALUES (?, ?)
+            ON CONFLICT (chave) DO UPDATE SET expira_em = excluded.expira_em
+            WHERE expira_em <= ?
+        ''', (chave, agora + segundos, agora))
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def try_acquire_interval(chave, segundos):
+    """
+    Verifica e marca atomicamente um intervalo compartilhado entre workers.
+    Retorna True para apenas um chamador a cada `segundos`.
+    """
+    if SHARED_STATE_BACKEND == 'local':
+        return _try_acquire_local(chave, segundos)
+    return get_backend().set(chave, str(time.time()), ttl=max(int(segundos), 1), nx=True)
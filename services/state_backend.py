@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from config import STATE_BACKEND
+from services.clients import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Backend do estado efêmero (locks, transições, relatos, estado por usuário,
+# status atual). 'redis' vale para vários workers e nós; 'memoria' guarda
+# tudo neste processo, sem ida à rede, para instalações de um único processo
+# e testes. Recursos que dependem do Redis (L2 dos caches, invalidação entre
+# workers, stream de eventos) verificam uses_redis().
+BACKEND_REDIS = 'redis'
+BACKEND_MEMORIA = 'memoria'
+
+# Intervalo mínimo entre varreduras de chaves expiradas no backend em memória
+VARREDURA_INTERVALO = 60
+
+_backend = None
+_backend_lock = threading.Lock()
+
+class Script:
+    """
+    Operação atômica com duas implementações equivalentes: `lua` para o
+    Redis e `python(backend, chaves, args)` para o backend em memória, que a
+    executa segurando o lock do backend. Os retornos devem seguir os do
+    Redis (strings, inteiros, listas).
+    """
+
+    def __init__(self, lua, python):
+        self.lua = lua
+        self.python = python
+
+class StateBackend:
+    """Interface dos backends de estado (valores em string, TTL em segundos)"""
+
+    def get(self, chave):
+        raise NotImplementedError
+
+    def set(self, chave, valor, ttl=None, nx=False):
+        """Grava o valor. Com nx=True só grava se a chave não existe. Retorna True se gravou"""
+        raise NotImplementedError
+
+    def delete(self, *chaves):
+        """Remove as chaves. Retorna quantas existiam"""
+        raise NotImplementedError
+
+    def exists(self, *chaves):
+        """Retorna quantas das chaves existem"""
+        raise NotImplementedError
+
+    def hgetall(self, chave):
+        raise NotImplementedError
+
+    def hset(self, chave, mapping, ttl=None):
+        """Grava campos de um hash. Com ttl, renova a expiração do hash inteiro"""
+        raise NotImplementedError
+
+    def run_script(self, script, chaves, args):
+        """Executa um Script de forma atômica"""
+        raise NotImplementedError
+
+class RedisBackend(StateBackend):
+    """Estado no Redis (compartilhado entre workers e nós)"""
+
+    def get(self, chave):
+        return get_redis().get(chave)
+
+    def set(self, chave, valor, ttl=None, nx=False):
+        return bool(get_redis().set(chave, valor, ex=ttl, nx=nx))
+
+    def delete(self, *chaves):
+        return get_redis().delete(*chaves)
+
+    def exists(self, *chaves):
+        return get_redis().exists(*chaves)
+
+    def hgetall(self, chave):
+        return get_redis().hgetall(chave)
+
+    def hset(self, chave, mapping, ttl=None):
+        if not ttl:
+            get_redis().hset(chave, mapping=mapping)
+            return
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hset(chave, mapping=mapping)
+        pipe.expire(chave, ttl)
+        pipe.execute()
+
+    def run_script(self, script, chaves, args):
+        return get_redis().eval(script.lua, len(chaves), *chaves, *args)
+
+class MemoryBackend(StateBackend):
+    """
+    Estado em um dicionário do processo, protegido por um lock. Chaves
+    expiradas somem na leitura e em varreduras periódicas feitas nas escritas.
+    """
+
+    def __init__(self):
+        # chave -> (valor, expira_em ou None); valor é str, dict (hash ou
+        # sorted set como membro -> score) ou list
+        self._dados = {}
+        self._lock = threading.RLock()
+        self._proxima_varredura = time.monotonic() + VARREDURA_INTERVALO
+
+    # Primitivas das implementações Python dos scripts: só podem ser
+    # chamadas com o lock já adquirido (dentro de run_script)
+    def lookup(self, chave, padrao=None):
+        item = self._dados.get(chave)
+        if item is None:
+            return padrao
+        valor, expira_em = item
+        if expira_em is not None and expira_em <= time.monotonic():
+            del self._dados[chave]
+            return padrao
+        return valor
+
+    def store(self, chave, valor, ttl=None, manter_ttl=False):
+        expira_em = time.monotonic() + ttl if ttl else None
+        if manter_ttl and chave in self._dados:
+            expira_em = self._dados[chave][1]
+        self._dados[chave] = (valor, expira_em)
+        self._sweep()
+
+    def _sweep(self):
+        agora = time.monotonic()
+        if agora < self._proxima_varredura:
+            return
+        self._proxima_varredura = agora + VARREDURA_INTERVALO
+        expiradas = [
+            chave for chave, (_, expira_em) in self._dados.items()
+            if expira_em is not None and expira_em <= agora
+        ]
+        for chave in expiradas:
+            del self._dados[chave]
+
+    def get(self, chave):
+        with self._lock:
+            valor = self.lookup(chave)
+            return valor if isinstance(valor, str) else None
+
+    def set(self, chave, valor, ttl=None, nx=False):
+        with self._lock:
+            if nx and self.lookup(chave) is not None:
+                return False
+            self.store(chave, str(valor), ttl)
+            return True
+
+    def delete(self, *chaves):
+        with self._lock:
+            removidas = 0
+            for chave in chaves:
+                if self.lookup(chave) is not None:
+                    del self._dados[chave]
+                    removidas += 1
+            return removidas
+
+    def exists(self, *chaves):
+        with self._lock:
+            return sum(1 for chave in chaves if self.lookup(chave) is not None)
+
+    def hgetall(self, chave):
+        with self._lock:
+            return dict(self.lookup(chave, {}))
+
+    def hset(self, chave, mapping, ttl=None):
+        with self._lock:
+            campos = dict(self.lookup(chave, {}))
+            campos.update({campo: str(valor) for campo, valor in mapping.items()})
+            self.store(chave, campos, ttl, manter_ttl=not ttl)
+
+    def run_script(self, script, chaves, args):
+        with self._lock:
+            return script.python(self, chaves, [str(arg) for arg in args])
+
+    def stats(self):
+        with self._lock:
+            return {'chaves': len(self._dados)}
+
+def uses_redis():
+    """Indica se o estado fica no Redis (e os recursos entre workers estão ativos)"""
+    return STATE_BACKEND != BACKEND_MEMORIA
+
+def get_backend():
+    """Retorna o backend configurado em STATE_BACKEND, criando-o no primeiro uso"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = MemoryBackend() if STATE_BACKEND == BACKEND_MEMORIA else RedisBackend()
+                logger.info(f"Backend de estado: {STATE_BACKEND}")
+    return _backend
@@ -0,0 +1,214 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from config import ESTADO_FLUSH_INTERVALO, ESTADO_FLUSH_LOTE
+from database import load_status_rows, save_status_changes
+from services.cache import status_cache
+from services.state_backend import get_backend, Script
+from services.timeutil import now_epoch, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Estado quente no backend de estado (Redis ou memória): um hash por lado com
+# status e ultima_atualizacao (segundos desde a época).
+# Cada mudança também entra na fila de pendentes, que o flusher grava em
+# lote no SQLite (status atual + histórico).
+ESTADO_KEY = 'estado:{lado}'
+PENDENTES_KEY = 'estado:pendentes'
+
+LADOS = ('CENTER', 'GOIO')
+
+# Estado usado quando não há nada no backend nem no SQLite
+ESTADO_INICIAL = {
+    'CENTER': 'ABERTO',
+    'GOIO': 'FECHADO'
+}
+
+_flusher_thread = None
+
+def _pending_list(backend, chave):
+    fila = backend.lookup(chave)
+    if fila is None:
+        fila = []
+        backend.store(chave, fila)
+    return fila
+
+# Grava os hashes dos lados e enfileira as mudanças em uma operação
+# KEYS: estado dos lados..., pendentes; ARGV: agora, (status, item)...
+def _set_status_python(backend, chaves, args):
+    agora = args[0]
+    for i, chave in enumerate(chaves[:-1]):
+        status, item = args[1 + 2 * i], args[2 + 2 * i]
+        estado = dict(backend.lookup(chave, {}), status=status, ultima_atualizacao=agora)
+        backend.store(chave, estado, manter_ttl=True)
+        _pending_list(backend, chaves[-1]).append(item)
+    return len(chaves) - 1
+
+_SET_STATUS_SCRIPT = Script("""
+for i = 1, #KEYS - 1 do
+    redis.call('hset', KEYS[i], 'status', ARGV[2 * i], 'ultima_atualizacao', ARGV[1])
+    redis.call('rpush', KEYS[#KEYS], ARGV[2 * i + 1])
+end
+return #KEYS - 1
+""", _set_status_python)
+
+# Restaura um lado sem sobrescrever uma mudança feita por outro worker
+# KEYS: estado do lado, pendentes; ARGV: status, ultima, item ('' = não enfileirar)
+def _restore_python(backend, chaves, args):
+    status, ultima, item = args
+    if 'status' in backend.lookup(chaves[0], {}):
+        return 0
+    backend.store(chaves[0], {'status': status, 'ultima_atualizacao': ultima})
+    if item:
+        _pending_list(backend, chaves[1]).append(item)
+    return 1
+
+_RESTORE_SCRIPT = Script("""
+if redis.call('hsetnx', KEYS[1], 'status', ARGV[1]) == 0 then
+    return 0
+end
+redis.call('hset', KEYS[1], 'ultima_atualizacao', ARGV[2])
+if ARGV[3] ~= '' then
+    redis.call('rpush', KEYS[2], ARGV[3])
+end
+return 1
+""", _restore_python)
+
+# Retira até ARGV[1] mudanças do início da fila
+def _pop_pending_python(backend, chaves, args):
+    fila = _pending_list(backend, chaves[0])
+    itens = fila[:int(args[0])]
+    del fila[:int(args[0])]
+    return itens
+
+_POP_PENDING_SCRIPT = Script("""
+local itens = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+redis.call('ltrim', KEYS[1], tonumber(ARGV[1]), -1)
+return itens
+""", _pop_pending_python)
+
+# Devolve mudanças ao início da fila, na mesma ordem
+def _requeue_python(backend, chaves, args):
+    _pending_list(backend, chaves[0])[:0] = args
+    return len(args)
+
+_REQUEUE_SCRIPT = Script("""
+for i = #ARGV, 1, -1 do
+    redis.call('lpush', KEYS[1], ARGV[i])
+end
+return #ARGV
+""", _requeue_python)
+
+def _count_python(backend, chaves, args):
+    return len(backend.lookup(chaves[0], []))
+
+_COUNT_PENDING_SCRIPT = Script("return redis.call('llen', KEYS[1])", _count_python)
+
+def parse_status(estado):
+    """(status, ultima_atualizacao) a partir do hash de um lado"""
+    if not estado:
+        return None, None
+    # to_epoch também aceita valores gravados no formato texto antigo
+    return estado['status'], to_epoch(estado['ultima_atualizacao'])
+
+def _load_status(lado):
+    """Lê o status no backend de estado, restaurando do SQLite se necessário"""
+    estado = get_backend().hgetall(ESTADO_KEY.format(lado=lado))
+    if not estado:
+        warm_load()
+        estado = get_backend().hgetall(ESTADO_KEY.format(lado=lado))
+    if not estado:
+        # Sem status nem no SQLite: erro, para o (None, None) não ir para o cache
+        raise RuntimeError(f"Status de {lado} indisponível")
+    return parse_status(estado)
+
+def get_status(lado, usar_cache=True):
+    """
+    Retorna (status, ultima_atualizacao em segundos desde a época) de um lado.
+    usar_cache=False lê direto do backend (decisões tomadas sob o lock de status)
+    """
+    try:
+        if not usar_cache:
+            return _load_status(lado)
+        return tuple(status_cache.get_or_load(lado, lambda: _load_status(lado)))
+    except Exception as e:
+        logger.error(f"Erro ao obter status de {lado}: {e}")
+        return None, None
+
+def set_status(mudancas, instante=None):
+    """
+    Grava novos status no backend de estado e enfileira a persistência.
+    mudancas: {lado: status}; instante: momento da mudança (padrão: agora)
+    """
+    agora = now_epoch() if instante is None else instante
+    args = [agora]
+    for lado, status in mudancas.items():
+        args += [status, json.dumps([lado, status, agora])]
+    get_backend().run_script(
+        _SET_STATUS_SCRIPT,
+        [ESTADO_KEY.format(lado=lado) for lado in mudancas] + [PENDENTES_KEY],
+        args
+    )
+    for lado in mudancas:
+        status_cache.invalidate(lado)
+
+def warm_load():
+    """Restaura no backend o estado persistido no SQLite (sem sobrescrever o que já existe)"""
+    persistidos = {lado: (status, ultima) for lado, status, ultima in load_status_rows()}
+    for lado in LADOS:
+        status, ultima = persistidos.get(lado, (ESTADO_INICIAL[lado], now_epoch()))
+        # Estado inicial (nada no SQLite) também entra na fila de persistência
+        item = '' if lado in persistidos else json.dumps([lado, status, ultima])
+        if get_backend().run_script(
+            _RESTORE_SCRIPT, [ESTADO_KEY.format(lado=lado), PENDENTES_KEY], [status, ultima, item]
+        ):
+            logger.info(f"Status de {lado} restaurado: {status}")
+
+def flush_pending(lote=ESTADO_FLUSH_LOTE):
+    """Grava no SQLite as mudanças pendentes. Retorna quantas foram gravadas"""
+    itens = get_backend().run_script(_POP_PENDING_SCRIPT, [PENDENTES_KEY], [lote])
+    if not itens:
+        return 0
+
+    try:
+        save_status_changes([
+            (lado, status, to_epoch(ultima))
+            for lado, status, ultima in map(json.loads, itens)
+        ])
+    except Exception:
+        # Devolver ao início da fila na mesma ordem para a próxima tentativa
+        get_backend().run_script(_REQUEUE_SCRIPT, [PENDENTES_KEY], itens)
+        raise
+    return len(itens)
+
+def pending_count():
+    """Quantidade de mudanças de status ainda não gravadas no SQLite"""
+    return get_backend().run_script(_COUNT_PENDING_SCRIPT, [PENDENTES_KEY], [])
+
+def _flusher_loop():
+    while True:
+        try:
+            while flush_pending() >= ESTADO_FLUSH_LOTE:
+                pass
+        except Exception as e:
+            logger.error(f"Erro ao persistir status: {e}")
+        time.sleep(ESTADO_FLUSH_INTERVALO)
+
+def _flush_on_exit():
+    try:
+        flush_pending()
+    except Exception as e:
+        logger.error(f"Erro ao persistir status no encerramento: {e}")
+
+def start_flusher():
+    """Inicia a persistência periódica (write-behind) dos status"""
+    global _flusher_thread
+    if _flusher_thread and _flusher_thread.is_alive():
+        return _flusher_thread
+
+    _flusher_thread = threading.Thread(target=_flusher_loop, name='state-flusher', daemon=True)
+    _flusher_thread.start()
+    atexit.register(_flush_on_exit)
+    return _flusher_thread
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime, timedelta
+from config import BR_TIMEZONE
+
+# Instantes são guardados como inteiros (segundos desde a época, UTC) no
+# SQLite e no Redis; a conversão para o horário local acontece apenas na
+# exibição e nos rótulos de agregação (dia/hora)
+
+FORMATO_ANTIGO = '%Y-%m-%d %H:%M:%S'
+
+_relogio = time.time
+
+def set_clock(relogio):
+    """Substitui o relógio (ex.: relógio controlável em benchmarks). None restaura o padrão"""
+    global _relogio
+    _relogio = relogio or time.time
+
+def now():
+    """Retorna o instante atual em segundos desde a época (com fração)"""
+    return _relogio()
+
+def now_epoch():
+    """Retorna o instante atual em segundos desde a época"""
+    return int(_relogio())
+
+def to_epoch(valor):
+    """
+    Converte um instante para segundos desde a época. Aceita inteiros e o
+    formato texto antigo ('%Y-%m-%d %H:%M:%S' no horário de Brasília).
+    """
+    if valor is None or isinstance(valor, int):
+        return valor
+    texto = str(valor)
+    if texto.isdigit():
+        return int(texto)
+    data = datetime.strptime(texto.split('.')[0], FORMATO_ANTIGO)
+    return int(data.replace(tzinfo=BR_TIMEZONE).timestamp())
+
+def local_datetime(epoch):
+    """Converte segundos desde a época para datetime no horário de Brasília"""
+    return datetime.fromtimestamp(epoch, BR_TIMEZONE)
+
+def format_epoch(epoch, formato='%d/%m/%Y %H:%M'):
+    """Formata um instante no horário de Brasília (apenas para exibição)"""
+    return local_datetime(epoch).strftime(formato)
+
+def day_bounds(dia):
+    """Retorna (inicio, fim) em segundos desde a época de um dia local (date)"""
+    inicio = datetime(dia.year, dia.month, dia.day, tzinfo=BR_TIMEZONE)
+    fim = inicio + timedelta(days=1)
+    return int(inicio.timestamp()), int(fim.timestamp())
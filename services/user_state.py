@@ -0,0 +1,85 @@
+import zlib
+from config import USUARIOS_BUCKET_SEGUNDOS, USUARIOS_SHARDS
+from services.state_backend import get_backend, Script
+from services.timeutil import now
+
+# Estado efêmero por usuário (última ação, confirmação pendente) em hashes
+# pequenos em vez de uma chave com JSON por usuário:
+#
+#   usuarios:{familia}:{bucket}:{shard}  ->  {usuario: valor compactado}
+#
+# bucket = instante // USUARIOS_BUCKET_SEGUNDOS. As escritas vão para o bucket
+# atual e as leituras olham o atual e o anterior; buckets antigos expiram
+# inteiros. Os shards mantêm cada hash pequeno o bastante para a codificação
+# compacta do Redis (listpack, até 128 campos por padrão).
+USUARIO_KEY = 'usuarios:{familia}:{bucket}:{shard}'
+
+ULTIMA_ACAO = 'ultima_acao'
+CONFIRMACAO = 'confirmacao'
+
+SEPARADOR = '|'
+
+def _keys(familia, usuario, instante):
+    """Chaves do bucket atual e do anterior para um usuário"""
+    bucket = int(instante // USUARIOS_BUCKET_SEGUNDOS)
+    shard = zlib.crc32(usuario.encode('utf-8')) % USUARIOS_SHARDS
+    return [
+        USUARIO_KEY.format(familia=familia, bucket=bucket, shard=shard),
+        USUARIO_KEY.format(familia=familia, bucket=bucket - 1, shard=shard)
+    ]
+
+# Valor do bucket atual, senão o do anterior; com ARGV[2] = '1' também o
+# remove dos dois (só um chamador o recebe)
+def _read_python(backend, chaves, args):
+    usuario, remover = args
+    atual, anterior = (backend.lookup(chave, {}) for chave in chaves)
+    valor = atual.get(usuario, anterior.get(usuario))
+    if remover == '1':
+        atual.pop(usuario, None)
+        anterior.pop(usuario, None)
+    return valor
+
+_READ_SCRIPT = Script("""
+local valor = redis.call('hget', KEYS[1], ARGV[1]) or redis.call('hget', KEYS[2], ARGV[1])
+if ARGV[2] == '1' then
+    redis.call('hdel', KEYS[1], ARGV[1])
+    redis.call('hdel', KEYS[2], ARGV[1])
+end
+return valor
+""", _read_python)
+
+def _set(familia, usuario, valor):
+    atual, _ = _keys(familia, usuario, now())
+    # Dois buckets de vida: o bucket ainda é lido durante o período seguinte
+    get_backend().hset(atual, {usuario: valor}, ttl=2 * USUARIOS_BUCKET_SEGUNDOS)
+
+def _get(familia, usuario):
+    """Valor mais recente do usuário (bucket atual, senão o anterior)"""
+    return get_backend().run_script(_READ_SCRIPT, _keys(familia, usuario, now()), [usuario, 0])
+
+def _pop(familia, usuario):
+    """Lê e remove o valor do usuário de forma atômica (só um chamador o recebe)"""
+    return get_backend().run_script(_READ_SCRIPT, _keys(familia, usuario, now()), [usuario, 1])
+
+def get_last_action(usuario):
+    """Instante (segundos desde a época) da última ação do usuário, ou None"""
+    valor = _get(ULTIMA_ACAO, usuario)
+    return float(valor) if valor is not None else None
+
+def set_last_action(usuario, instante=None):
+    _set(ULTIMA_ACAO, usuario, f"{now() if instante is None else instante:.1f}")
+
+def set_confirmation(usuario, acao, status_atual):
+    """Registra uma confirmação pendente ('instante|acao|status')"""
+    _set(CONFIRMACAO, usuario, SEPARADOR.join((f"{now():.1f}", acao, status_atual)))
+
+def pop_confirmation(usuario):
+    """
+    Consome a confirmação pendente do usuário. Retorna
+    {'timestamp', 'action', 'current_status'} ou None
+    """
+    valor = _pop(CONFIRMACAO, usuario)
+    if valor is None:
+        return None
+    instante, acao, status_atual = valor.split(SEPARADOR, 2)
+    return {'timestamp': float(instante), 'action': acao, 'current_status': status_atual}